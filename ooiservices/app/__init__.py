@@ -15,6 +15,11 @@ from flask_wtf.csrf import CsrfProtect
 from sqlalchemy_searchable import make_searchable
 from flask_redis import Redis
 from flask_cors import CORS
+from ooiservices.app.uframe_client import UframeClient
+from ooiservices.app.redmine_client import RedmineClient
+from ooiservices.app.vocab import VocabResolver
+from ooiservices.app.plot_cache import PlotCache
+from ooiservices.app.blob_cache import BlobCache
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -27,6 +32,11 @@ make_searchable()
 csrf = CsrfProtect()
 redis_store = Redis()
 cors = CORS()
+uframe_client = UframeClient()
+redmine_client = RedmineClient()
+vocab_resolver = VocabResolver()
+plot_cache = PlotCache()
+blob_cache = BlobCache()
 
 
 def create_app(config_name):
@@ -80,6 +90,11 @@ def create_app(config_name):
     csrf.init_app(app)
     redis_store.init_app(app)
     cors.init_app(app)
+    uframe_client.init_app(app)
+    redmine_client.init_app(app)
+    vocab_resolver.init_app(app)
+    plot_cache.init_app(app)
+    blob_cache.init_app(app)
 
     # Flask-Security Init
     from ooiservices.app.models import User, Role
@@ -93,6 +108,10 @@ def create_app(config_name):
     from ooiservices.app.uframe import uframe as uframe_blueprint
     app.register_blueprint(uframe_blueprint, url_prefix='/uframe')
 
+    # plot render processes are forked when a web worker starts
+    from ooiservices.app.uframe.plot_pool import plot_pool
+    plot_pool.init_app(app)
+
     from ooiservices.app.redmine import redmine as redmine_blueprint
     app.register_blueprint(redmine_blueprint, url_prefix='/redmine')
 
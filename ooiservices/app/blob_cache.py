@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+'''
+ooiservices.app.blob_cache
+
+Cache for the large compiled collections (stream_list, asset_list,
+event_list, glider_tracks, large_format).  Flask-Cache pickles each one
+into a single redis value of several megabytes which every hit unpickles;
+here they are written through a pluggable codec (compact json + zlib by
+default, CACHE_CODEC) under versioned keys, and list collections with a
+shard function are split into one value per shard (per array or per
+glider), so a request can load just the shards it needs:
+
+    blob:v1:<name>                  unsharded value
+    blob:v1:<name>:manifest         shard names of a sharded value
+    blob:v1:<name>:shard:<shard>    one shard (a list)
+
+Each value starts with the name of the codec which wrote it, so values
+stay readable across a codec change.  Serialized size, encode and decode
+times are counted per collection in the 'blob_cache_stats' redis hash.
+
+The hot collections (BLOB_L1_NAMES) are also held decoded in process (L1),
+LRU evicted beyond BLOB_L1_MAX_BYTES of decoded (uncompressed serialized)
+size, which approximates their size in memory far better than the
+compressed payload.  Every set or
+delete increments the collection's generation in redis and publishes it on
+'blob_cache_invalidate'; a listener thread per process drops stale L1
+entries, so steady state reads never leave the process.  Without the
+listener, an L1 entry's generation is checked every BLOB_L1_CHECK_INTERVAL
+seconds.  L1 values are shared between requests: treat them as read only
+and use get(name, fresh=True) to get a copy to modify.
+'''
+
+import cPickle as pickle
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+BLOB_VERSION = 1
+BLOB_PREFIX = 'blob:v%d:' % BLOB_VERSION
+BLOB_STATS_KEY = 'blob_cache_stats'
+BLOB_CHANNEL = 'blob_cache_invalidate'
+
+# collections read on most requests and rebuilt only by the compile tasks
+L1_NAMES = ('stream_list', 'asset_list', 'event_list', 'event_index')
+
+_MISS = object()
+
+
+class JsonCodec(object):
+    '''
+    Compact json.  Values json cannot represent fall back to pickle.
+    '''
+    name = 'json'
+
+    def dumps(self, value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+    def loads_sized(self, payload):
+        return self.loads(payload), len(payload)
+
+
+class ZlibJsonCodec(JsonCodec):
+    name = 'zlib-json'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def dumps(self, value):
+        return zlib.compress(JsonCodec.dumps(self, value), self.level)
+
+    def loads(self, payload):
+        return JsonCodec.loads(self, zlib.decompress(payload))
+
+    def loads_sized(self, payload):
+        raw = zlib.decompress(payload)
+        return JsonCodec.loads(self, raw), len(raw)
+
+
+class ZlibPickleCodec(object):
+    name = 'zlib-pickle'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def dumps(self, value):
+        return zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.level)
+
+    def loads(self, payload):
+        return pickle.loads(zlib.decompress(payload))
+
+    def loads_sized(self, payload):
+        raw = zlib.decompress(payload)
+        return pickle.loads(raw), len(raw)
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    '''
+    Make a codec available to CACHE_CODEC and for reading its values; a codec
+    has a name and dumps(value) / loads(payload), and optionally
+    loads_sized(payload) returning (value, uncompressed size).
+    '''
+    CODECS[codec.name] = codec
+
+
+register_codec(JsonCodec())
+register_codec(ZlibJsonCodec())
+register_codec(ZlibPickleCodec())
+
+
+def by_array(field):
+    '''
+    Shard function: the array code (first two characters of the reference
+    designator held in field).
+    '''
+    def shard(item):
+        return (item.get(field) or '')[:2] or '_'
+    return shard
+
+
+def by_path(field, parts):
+    '''
+    Shard function: the first parts of the uframe path held in field joined
+    with '-' (e.g. /CP05MOAS/GL340/... -> CP05MOAS-GL340 for parts=2).
+    '''
+    def shard(item):
+        return '-'.join((item.get(field) or '').strip('/').split('/')[:parts]) or '_'
+    return shard
+
+
+# collections split per array (per glider); see BlobCache.get(name, shards=...)
+SHARDS = {'stream_list': by_array('reference_designator'),
+          'asset_list': by_array('ref_des'),
+          'glider_tracks': by_path('location', 2)}
+
+
+class BlobCache(object):
+
+    def __init__(self, app=None):
+        self.codec = CODECS['zlib-json']
+        self.fallback = CODECS['zlib-pickle']
+        self.default_timeout = 300
+        self.shards = dict(SHARDS)
+        self.l1_enabled = True
+        self.l1_names = set(L1_NAMES)
+        self.l1_max_bytes = 64 * 1024 * 1024
+        self.check_interval = 30
+        # (name, shards) -> [generation, value, serialized size, checked at]
+        self._l1 = OrderedDict()
+        self._l1_bytes = 0
+        self._l1_counts = {'hits': 0, 'misses': 0, 'evictions': 0}
+        # name -> latest generation seen (published or read)
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+        self._listening = False
+        self._listen_attempt = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        name = config.get('CACHE_CODEC', self.codec.name)
+        if name not in CODECS:
+            raise ValueError('Unknown CACHE_CODEC %s' % name)
+        self.codec = CODECS[name]
+        if 'CACHE_CODEC_LEVEL' in config and hasattr(self.codec, 'level'):
+            self.codec.level = self.fallback.level = int(config['CACHE_CODEC_LEVEL'])
+        self.default_timeout = int(config.get('CACHE_DEFAULT_TIMEOUT', self.default_timeout))
+        self.l1_enabled = bool(config.get('BLOB_L1_ENABLED', self.l1_enabled))
+        self.l1_names = set(config.get('BLOB_L1_NAMES', self.l1_names))
+        self.l1_max_bytes = int(config.get('BLOB_L1_MAX_BYTES', self.l1_max_bytes))
+        self.check_interval = int(config.get('BLOB_L1_CHECK_INTERVAL', self.check_interval))
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['blob_cache'] = self
+
+    @staticmethod
+    def _redis():
+        from ooiservices.app import redis_store
+        return redis_store
+
+    def _key(self, name, shard=None):
+        if shard is None:
+            return BLOB_PREFIX + name
+        return '%s%s:shard:%s' % (BLOB_PREFIX, name, shard)
+
+    def _manifest_key(self, name):
+        return BLOB_PREFIX + name + ':manifest'
+
+    def _generation_key(self, name):
+        return BLOB_PREFIX + name + ':generation'
+
+    def encode(self, value):
+        try:
+            codec = self.codec
+            payload = codec.dumps(value)
+        except (TypeError, ValueError):
+            # not json serializable (datetimes, custom objects)
+            codec = self.fallback
+            payload = codec.dumps(value)
+        return codec.name + '\n' + payload
+
+    @staticmethod
+    def decode(payload):
+        name, payload = payload.split('\n', 1)
+        return CODECS[name].loads(payload)
+
+    @staticmethod
+    def decode_sized(payload):
+        '''
+        (value, decoded size) of payload; the decoded size is its uncompressed
+        serialized length.
+        '''
+        name, payload = payload.split('\n', 1)
+        codec = CODECS[name]
+        if hasattr(codec, 'loads_sized'):
+            return codec.loads_sized(payload)
+        return codec.loads(payload), len(payload)
+
+    def _record(self, pipe, name, field, amount):
+        if isinstance(amount, float):
+            pipe.hincrbyfloat(BLOB_STATS_KEY, '%s:%s' % (name, field), amount)
+        else:
+            pipe.hincrby(BLOB_STATS_KEY, '%s:%s' % (name, field), amount)
+
+    def set(self, name, value, timeout=None):
+        '''
+        Store value under name; lists of a sharded collection are split per
+        shard.  Returns False when redis is unavailable.
+        '''
+        timeout = timeout or self.default_timeout
+        started = time.time()
+        shard_of = self.shards.get(name)
+        if shard_of is not None and isinstance(value, list):
+            groups = {}
+            order = []
+            for item in value:
+                shard = shard_of(item)
+                if shard not in groups:
+                    groups[shard] = []
+                    order.append(shard)
+                groups[shard].append(item)
+            values = [(self._key(name, group), self.encode(groups[group])) for group in order]
+            values.append((self._manifest_key(name), self.encode(order)))
+        else:
+            values = [(self._key(name), self.encode(value))]
+        encode_ms = (time.time() - started) * 1000
+
+        size = sum(len(payload) for _, payload in values)
+        try:
+            pipe = self._redis().pipeline()
+            pipe.incr(self._generation_key(name))
+            # shards before the manifest which names them
+            for key, payload in values:
+                pipe.setex(key, timeout, payload)
+            if shard_of is None or not isinstance(value, list):
+                pipe.delete(self._manifest_key(name))
+            else:
+                pipe.delete(self._key(name))
+            pipe.hset(BLOB_STATS_KEY, name + ':bytes', size)
+            pipe.hset(BLOB_STATS_KEY, name + ':values', len(values))
+            pipe.hset(BLOB_STATS_KEY, name + ':encode_ms', round(encode_ms, 3))
+            generation = pipe.execute()[0]
+        except Exception:
+            return False
+        self._publish(name, generation)
+        return True
+
+    def _publish(self, name, generation):
+        self._invalidate(name, generation)
+        try:
+            self._redis().publish(BLOB_CHANNEL, '%s %d' % (name, generation))
+        except Exception:
+            pass
+
+    def get(self, name, shards=None, fresh=False):
+        '''
+        Value stored under name, or None.  For a sharded collection, shards
+        (an iterable of shard names, e.g. array codes) limits which shards
+        are loaded; a missing shard is a miss for the whole value.  L1
+        collections come from memory unless fresh is set.
+        '''
+        use_l1 = self.l1_enabled and name in self.l1_names
+        key = (name, tuple(sorted(shards)) if shards is not None else None)
+        if use_l1 and not fresh:
+            self._ensure_listener()
+            value = self._l1_get(key)
+            if value is not _MISS:
+                return value
+
+        generation, value, size = self._fetch(name, shards)
+        if use_l1 and not fresh and value is not None and generation is not None:
+            self._l1_put(key, generation, value, size)
+        return value
+
+    def _fetch(self, name, shards):
+        '''
+        (generation, value, decoded size) from redis; generation is None
+        when the value changed while its shards were read.
+        '''
+        redis = self._redis()
+        generation_key = self._generation_key(name)
+        for attempt in range(3):
+            try:
+                payload, manifest, generation = redis.mget([self._key(name), self._manifest_key(name),
+                                                            generation_key])
+                if manifest is not None:
+                    names = self.decode(manifest)
+                    if shards is not None:
+                        wanted = set(shards)
+                        names = [shard for shard in names if shard in wanted]
+                    payloads = redis.mget([self._key(name, shard) for shard in names] + [generation_key])
+                    if payloads.pop() != generation:
+                        # rewritten between the manifest and the shards
+                        generation = None
+                        if attempt < 2:
+                            continue
+                    if any(part is None for part in payloads):
+                        return generation, None, 0
+                elif payload is not None:
+                    payloads = [payload]
+                else:
+                    return generation, None, 0
+            except Exception:
+                return None, None, 0
+            break
+
+        started = time.time()
+        if manifest is not None:
+            value = []
+            size = 0
+            for part in payloads:
+                items, part_size = self.decode_sized(part)
+                value.extend(items)
+                size += part_size
+        else:
+            value, size = self.decode_sized(payload)
+        decode_ms = (time.time() - started) * 1000
+        try:
+            pipe = redis.pipeline()
+            self._record(pipe, name, 'decodes', 1)
+            self._record(pipe, name, 'decode_ms', decode_ms)
+            self._record(pipe, name, 'decoded_bytes', size)
+            pipe.execute()
+        except Exception:
+            pass
+        if generation is not None:
+            generation = int(generation)
+        return generation, value, size
+
+    def _l1_get(self, key):
+        name = key[0]
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                self._l1_counts['misses'] += 1
+                return _MISS
+            generation, value, size, checked = entry
+            if generation < self._generations.get(name, 0):
+                self._drop(key)
+                self._l1_counts['misses'] += 1
+                return _MISS
+            if self._listening or time.time() - checked < self.check_interval:
+                # most recently used last
+                self._l1[key] = self._l1.pop(key)
+                self._l1_counts['hits'] += 1
+                return value
+
+        # no invalidation listener: confirm the generation in redis
+        try:
+            current = int(self._redis().get(self._generation_key(name)) or 0)
+        except Exception:
+            current = None
+        with self._lock:
+            if current == generation and key in self._l1:
+                self._l1[key][3] = time.time()
+                self._l1_counts['hits'] += 1
+                return value
+            if current is not None:
+                self._generations[name] = max(current, self._generations.get(name, 0))
+            self._drop(key)
+            self._l1_counts['misses'] += 1
+            return _MISS
+
+    def _l1_put(self, key, generation, value, size):
+        with self._lock:
+            if generation < self._generations.get(key[0], 0) or size > self.l1_max_bytes:
+                return
+            self._drop(key)
+            self._l1[key] = [generation, value, size, time.time()]
+            self._l1_bytes += size
+            while self._l1_bytes > self.l1_max_bytes:
+                _, evicted = self._l1.popitem(last=False)
+                self._l1_bytes -= evicted[2]
+                self._l1_counts['evictions'] += 1
+
+    def _drop(self, key):
+        # caller holds the lock
+        entry = self._l1.pop(key, None)
+        if entry is not None:
+            self._l1_bytes -= entry[2]
+
+    def _invalidate(self, name, generation):
+        with self._lock:
+            self._generations[name] = max(generation, self._generations.get(name, 0))
+            for key in [key for key, entry in self._l1.iteritems() if key[0] == name and entry[0] < generation]:
+                self._drop(key)
+
+    def clear_l1(self):
+        with self._lock:
+            self._l1.clear()
+            self._l1_bytes = 0
+
+    def _ensure_listener(self):
+        '''
+        One invalidation listener thread per process (restarted after a
+        fork, or at most every check_interval after it failed).
+        '''
+        pid = os.getpid()
+        if self._listener_pid == pid and self._listener is not None and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                if self._listener is not None and self._listener.is_alive():
+                    return
+                if time.time() - self._listen_attempt < self.check_interval:
+                    return
+            else:
+                # forked: the parent's entries and listener do not carry over
+                self._l1.clear()
+                self._l1_bytes = 0
+                self._listening = False
+            self._listener_pid = pid
+            self._listen_attempt = time.time()
+            self._listener = threading.Thread(target=self._listen, name='blob_cache_listener')
+            self._listener.daemon = True
+            self._listener.start()
+
+    def _listen(self):
+        try:
+            pubsub = self._redis().pubsub()
+            pubsub.subscribe(BLOB_CHANNEL)
+            # anything published before the subscription is unknown
+            self.clear_l1()
+            self._listening = True
+            for message in pubsub.listen():
+                if message.get('type') != 'message':
+                    continue
+                try:
+                    name, generation = message['data'].rsplit(' ', 1)
+                    self._invalidate(name, int(generation))
+                except (AttributeError, ValueError):
+                    continue
+        except Exception:
+            pass
+        finally:
+            self._listening = False
+
+    def delete(self, name):
+        '''
+        Remove a value; orphaned shards expire with their timeout.
+        '''
+        try:
+            pipe = self._redis().pipeline()
+            pipe.incr(self._generation_key(name))
+            pipe.delete(self._key(name), self._manifest_key(name))
+            generation = pipe.execute()[0]
+        except Exception:
+            return
+        self._publish(name, generation)
+
+    def stats(self):
+        '''
+        {name: {bytes, values, encode_ms, decodes, decode_ms, decode_ms_avg,
+        decoded_bytes}} from the counters, and 'l1' for this process.
+        '''
+        try:
+            counters = self._redis().hgetall(BLOB_STATS_KEY) or {}
+        except Exception:
+            counters = {}
+        stats = {}
+        for field, value in counters.iteritems():
+            name, counter = field.rsplit(':', 1)
+            stats.setdefault(name, {})[counter] = float(value) if '.' in value else int(value)
+        for name, counters in stats.iteritems():
+            for counter in ('bytes', 'values', 'decodes', 'decoded_bytes'):
+                counters.setdefault(counter, 0)
+            counters.setdefault('decode_ms', 0.0)
+            counters['decode_ms_avg'] = (float(counters['decode_ms']) / counters['decodes']) if counters['decodes'] else 0.0
+        stats['l1'] = self.l1_stats()
+        return stats
+
+    def l1_stats(self):
+        '''
+        L1 counters of this process.
+        '''
+        with self._lock:
+            stats = dict(self._l1_counts)
+            stats['entries'] = len(self._l1)
+            stats['bytes'] = self._l1_bytes
+        stats['enabled'] = self.l1_enabled
+        stats['listening'] = self._listening
+        return stats
+
+    def reset_stats(self):
+        try:
+            self._redis().delete(BLOB_STATS_KEY)
+        except Exception:
+            pass
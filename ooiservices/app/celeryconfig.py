@@ -1,3 +1,4 @@
+from datetime import timedelta
 from celery.schedules import crontab
 
 CELERYBEAT_SCHEDULE = {
@@ -31,4 +32,9 @@ CELERYBEAT_SCHEDULE = {
         'schedule': crontab(minute=0, hour='*/12'),
         'args': (),
         },
+    'dispatch-notifications': {
+        'task': 'tasks.dispatch_notifications',
+        'schedule': timedelta(seconds=10),
+        'args': (),
+        },
     }
@@ -10,11 +10,10 @@ from ooiservices.app.main.errors import internal_server_error
 # data imports
 from ooiservices.app.uframe.data import get_data
 
-import requests
+from ooiservices.app import uframe_client
 import urllib2
 
 
-requests.adapters.DEFAULT_RETRIES = 2
 CACHE_TIMEOUT = 86400
 
 
@@ -28,7 +27,7 @@ def get_metadata(ref):
         mooring, platform, instrument = ref.split('-', 2)
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, 'metadata'])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code == 200:
             data = response.json()
 
@@ -77,7 +76,7 @@ def get_data(ref, method, stream, start_time, end_time):
     uframe_url, timeout, timeout_read = get_uframe_info()
     url = "/".join([uframe_url, mooring, platform, instrument, method, stream + query])
     current_app.logger.debug('***** url: ' + url)
-    response = requests.get(url, timeout=(timeout, timeout_read))
+    response = uframe_client.get(url, timeout=(timeout, timeout_read))
 
     try:
         GA_URL = current_app.config['GOOGLE_ANALYTICS_URL']+'&ec=m2m&ea=%s&el=%s' % ('-'.join([mooring, platform, instrument, stream]), '-'.join([start_time, end_time]))
@@ -6,20 +6,23 @@ Alerts & Alarms Endpoints
 __author__ = 'James Case'
 
 from flask import (jsonify, request, current_app, g)
-from ooiservices.app import db
+from ooiservices.app import db, uframe_client
 from ooiservices.app.main import api
 from ooiservices.app.decorators import scope_required
 from ooiservices.app.main.authentication import auth
 from ooiservices.app.main.errors import (conflict, bad_request)
-from ooiservices.app.main.notifications import handle_notifications
-from ooiservices.app.models import (SystemEventDefinition, SystemEvent, UserEventNotification, User)
+from ooiservices.app.main.notification_queue import (queue_notifications, get_notification_queue_status)
+from ooiservices.app.models import (SystemEventDefinition, SystemEvent, SystemEventEscalation,
+                                    UserEventNotification, User)
 from ooiservices.app.uframe.assets import get_assets
-from sqlalchemy import desc
+from sqlalchemy import desc, func, case, and_, or_
+from sqlalchemy.orm import contains_eager
+from multiprocessing.pool import ThreadPool
 
-import requests
 import json
 import datetime as dt
 import calendar
+from collections import OrderedDict
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -31,34 +34,69 @@ def get_alerts_alarms():
     """ Get all alert(s) and alarm(s) which match filter rules provided in request.args.
     Dynamically construct filters to query SystemEvent and SystemEventDefinitions.
     List output for each alert_alarm which includes system_event_definition content based request.args 'filters'.
+
+    Keyset pagination (in id order): 'limit' alert_alarms after id 'after_id'; when a page is full,
+    'next_after_id' is the after_id of the next page.
     """
     try:
-        result = get_alerts_alarms_object()
-        return jsonify( {'alert_alarm': result})
+        limit, after_id = get_page_args(request.args)
+        result = get_alerts_alarms_object(limit, after_id)
+        response = {'alert_alarm': result}
+        if limit is not None and len(result) == limit:
+            response['next_after_id'] = result[-1]['id']
+        return jsonify(response)
     except Exception as err:
         message = 'Insufficient data, or bad data format. (%s)' % str(err.message)
         return conflict(message)
 
 
-def get_alerts_alarms_object():
-    """ helper function to get alert alarms
+def get_alerts_alarms_object(limit=None, after_id=None):
+    """ helper function to get alert alarms; one query joins each alert_alarm to its definition,
+    with the filters of get_query_filters applied in SQL.
     """
-    result = []
-    # Get query filters, query SystemEvents using event_filters
+    # Get query filters, query SystemEvents (with definitions) using event and definition filters
     event_filters, definition_filters = get_query_filters(request.args)
-    if event_filters is None:   # alerts_alarms
-        alerts_alarms = db.session.query(SystemEvent).all()
-    else:
-        alerts_alarms = db.session.query(SystemEvent).filter_by(**event_filters)
-    # Process alert_alarm json output based on definition filters
-    if alerts_alarms is not None:
-        result_json = get_alert_alarm_json(alerts_alarms, definition_filters)
-        if result_json is None:
-            result = []
-        else:
-            result = result_json
+    alerts_alarms = db.session.query(SystemEvent).join(SystemEvent.event).options(contains_eager(SystemEvent.event))
+    alerts_alarms = filter_alerts_alarms(alerts_alarms, event_filters, definition_filters)
+    if after_id is not None:
+        alerts_alarms = alerts_alarms.filter(SystemEvent.id > after_id)
+    alerts_alarms = alerts_alarms.order_by(SystemEvent.id)
+    if limit is not None:
+        alerts_alarms = alerts_alarms.limit(limit)
+    result = get_alert_alarm_json(alerts_alarms.all(), None)
+    if result is None:
+        result = []
     return result
 
+
+def filter_alerts_alarms(query, event_filters, definition_filters):
+    """ Apply the event and definition filters of get_query_filters to a query joining SystemEvent and
+    SystemEventDefinition.
+    """
+    for model, filters in ((SystemEvent, event_filters), (SystemEventDefinition, definition_filters)):
+        for k, v in (filters or {}).items():
+            if k in ['acknowledged', 'active', 'retired']:      # booleans, as strings from get_query_filters
+                v = (str(v).lower() == 'true')
+            query = query.filter(getattr(model, k) == v)
+    return query
+
+
+def get_page_args(request_args):
+    """ (limit, after_id) keyset pagination arguments; None when not provided.
+    """
+    limit = None
+    after_id = None
+    try:
+        if request_args.get('limit'):
+            limit = int(request_args.get('limit'))
+            if limit < 1:
+                raise ValueError
+        if request_args.get('after_id'):
+            after_id = int(request_args.get('after_id'))
+    except ValueError:
+        raise Exception('Invalid pagination arguments; limit must be a positive integer and after_id an integer.')
+    return limit, after_id
+
 #List an alert or alarm by id
 @api.route('/alert_alarm/<int:id>')
 def get_alert_alarm(id):
@@ -69,133 +107,119 @@ def get_alert_alarm(id):
     return jsonify(alert_alarm.to_json())
 
 
-def get_asset_list():
-    data = get_assets(True, True)
-    ref_list = []
-    name_list = []
+def get_asset_map():
+    """ Assets with a reference designator, keyed (first one wins) and ordered by reference designator.
+    """
+    data = get_assets(False, True)
+    if not isinstance(data, list):
+        raise Exception('Failed to get asset list.')
+    assets = OrderedDict()
     for d in data:
-        if ('ref_des' in d) and (len(d['ref_des']) > 2) and ("-" in d['ref_des']):
-            split_ref = d['ref_des'].split('-')
-            if d['ref_des'] not in name_list and len(split_ref) > 1:
-                ref_list.append(d)
-                name_list.append(d['ref_des'])
+        ref_des = d.get('ref_des')
+        if ref_des and (len(ref_des) > 2) and ("-" in ref_des):
+            if ref_des not in assets:
+                assets[ref_des] = d
         else:
             current_app.logger.info("Ref-Des not in asset")
-    return ref_list, name_list
+    return assets
+
+
+def get_alert_alarm_rollup(event_filters=None, definition_filters=None):
+    """ Unacknowledged alert_alarm status for each reference designator, in one aggregate query:
+        {reference_designator: {'count': n, 'severity': highest definition severity,
+                                'event_type': 'alarm' when any is an alarm, otherwise 'alert'}}
+    event_filters and definition_filters are the dictionaries of get_query_filters.
+    """
+    is_alarm = func.max(case([(SystemEvent.event_type == 'alarm', 1)], else_=0))
+    query = db.session.query(SystemEventDefinition.reference_designator,
+                             func.count(SystemEvent.id),
+                             func.max(SystemEventDefinition.severity),
+                             is_alarm)\
+        .select_from(SystemEvent)\
+        .join(SystemEventDefinition, and_(SystemEvent.system_event_definition_id == SystemEventDefinition.id,
+                                          SystemEvent.event_type == SystemEventDefinition.event_type))\
+        .filter(SystemEvent.acknowledged == False)
+    query = filter_alerts_alarms(query, event_filters, definition_filters)
+    rollup = {}
+    for reference_designator, count, severity, alarm in query.group_by(SystemEventDefinition.reference_designator):
+        rollup[reference_designator] = {'count': count,
+                                        'severity': severity,
+                                        'event_type': 'alarm' if alarm else 'alert'}
+    return rollup
+
+
+def get_status_entry(ref_des, asset):
+    """ Initial (no alert_alarm) status entry for an asset.
+    """
+    info = asset['assetInfo']
+    manufacture_info = asset.get('manufactureInfo') or {}
+    return {'reference_designator': ref_des, "count": 0,
+            "event_type": 'unknown',
+            'severity': None,
+            'coordinates': asset['coordinates'],
+            'asset_type': info['type'],
+            'longName': info['longName'],
+            'name': info['name'],
+            'instrumentClass': info['instrumentClass'],
+            'manufacturer': manufacture_info.get('manufacturer', 'N/A'),
+            'modelNumber': manufacture_info.get('modelNumber', 'N/A'),
+            'serialNumber': manufacture_info.get('serialNumber', 'N/A'),
+            'owner': info['owner'],
+            'description': info['description']}
+
 
 @api.route('/alert_alarm/status', methods=['GET'])
 def get_alert_alarm_status():
     """ Gets the alert alarm status for all available assets.
+
+    Costs two queries whatever the number of alert_alarms: the unacknowledged rollup per reference
+    designator and the reference designators with definitions; both are joined against the asset map.
     """
-    #the actual alert alarms
-    data = get_alerts_alarms_object()
-    status_info = []
-    status_outline = {}
+    try:
+        # the actual alert alarms, rolled up by reference designator
+        event_filters, definition_filters = get_query_filters(request.args)
+        status_outline = get_alert_alarm_rollup(event_filters, definition_filters)
 
-    for d in data:
-        if d["acknowledged"] == False:
-            ref_des = d['alert_alarm_definition']['reference_designator']
-            if ref_des not in status_outline:
-                status_outline[ref_des] = d
-                status_outline[ref_des]['count'] = 0
-            else:
-                count = status_outline[ref_des]['count']
-                #figure out which one is higher
-                if d["event_type"] == "alarm":
-                    status_outline[ref_des] = d
-                else:
-                    pass
-                status_outline[ref_des]['count'] = count+1
-
-    #get dict of assets available
-    assets_dict, assets_names = get_asset_list()
-
-    #get the list of alert/alarm definitions
-    aa_def = get_alerts_alarms_def_object()
-    aa_def_list = []
-
-    #alerts and alarms
-
-    for aa_item in aa_def:
-        if 'reference_designator' in aa_item:
-            #get the A/A definitions
-            if aa_item['reference_designator'] not in aa_def_list:
-                #used to identify halth sensors
-                aa_def_list.append(aa_item['reference_designator'])
-            if aa_item['reference_designator'] not in assets_names:
-                #means an asset was in the A/A definition, that was not in the asset list returned
-                #create and add it so we can see the status, the TOC may not reflect this
-                print "Ref-Des not in asset name list: ERROR: appending", aa_item['reference_designator']
-
-                new_asset = {'ref_des':aa_item['reference_designator'],
-                             'hasDeploymentEvent' : True,
-                             'coordinates': [0, 0],
-                             'assetInfo': {"type":"Sensor",
-                                           "longName":aa_item['reference_designator'],
-                                           "instrumentClass": "Sensor",
-                                           "name":aa_item['reference_designator'],
-                                           "owner":"N/A",
-                                           "description":"N/A"
-                              },
-                            }
-
-                #append the dict to
-                assets_dict.append(new_asset)
-                aa_def.append(new_asset)
-
-                aa_def_list.append(aa_item['reference_designator'])
-                assets_names.append(aa_item['reference_designator'])
-
-
-    #use all the info to create status
-    for asset in assets_dict:
-        d = asset['ref_des']
-
-        if 'hasDeploymentEvent' in asset and asset['hasDeploymentEvent']:
-            #create inital entry
-            if 'manufactureInfo' in asset:
-                entry = {'reference_designator':d, "count":0,
-                        "event_type":'unknown',
-                        'coordinates':asset['coordinates'],
-                        'asset_type':asset['assetInfo']['type'],
-                        'longName':asset['assetInfo']['longName'],
-                        'name':asset['assetInfo']['name'],
-                        'instrumentClass':asset['assetInfo']['instrumentClass'],
-                        'manufacturer': asset['manufactureInfo']['manufacturer'],
-                        'modelNumber': asset['manufactureInfo']['modelNumber'],
-                        'serialNumber': asset['manufactureInfo']['serialNumber'],
-                        'owner': asset['assetInfo']['owner'],
-                        'description': asset['assetInfo']['description']}
-            else:
-                entry = {'reference_designator':d, "count":0,
-                        "event_type":'unknown',
-                        'coordinates':asset['coordinates'],
-                        'asset_type':asset['assetInfo']['type'],
-                        'longName':asset['assetInfo']['longName'],
-                        'name':asset['assetInfo']['name'],
-                        'instrumentClass':asset['assetInfo']['instrumentClass'],
-                        'manufacturer': 'N/A',
-                        'modelNumber': 'N/A',
-                        'serialNumber': 'N/A',
-                        'owner': asset['assetInfo']['owner'],
-                        'description': asset['assetInfo']['description']}
-
-
-            #use alert alarms status (alarm or alert)
-            if d in status_outline.keys():
-                entry["count"] = status_outline[d]['count']
-                entry["event_type"] = status_outline[d]["event_type"]
-            #healthly
-            elif d in aa_def_list:
-                #used to identify health sensors
+        # reference designators of the alert/alarm definitions (used to identify health sensors)
+        query_filter = get_definitions_query_filter(request.args)
+        if query_filter is None:
+            query_filter = {'retired': False}
+        aa_def_set = set(rd for (rd,) in db.session.query(SystemEventDefinition.reference_designator)
+                         .filter_by(**query_filter).distinct())
+
+        assets = get_asset_map()
+        for rd in sorted(aa_def_set):
+            if rd not in assets:
+                # means an asset was in the A/A definition, that was not in the asset list returned
+                # create and add it so we can see the status, the TOC may not reflect this
+                current_app.logger.info("Ref-Des not in asset name list, appending: %s" % rd)
+                assets[rd] = {'ref_des': rd,
+                              'hasDeploymentEvent': True,
+                              'coordinates': [0, 0],
+                              'assetInfo': {"type": "Sensor",
+                                            "longName": rd,
+                                            "instrumentClass": "Sensor",
+                                            "name": rd,
+                                            "owner": "N/A",
+                                            "description": "N/A"}}
+
+        # use all the info to create status
+        status_info = []
+        for d, asset in assets.iteritems():
+            if not asset.get('hasDeploymentEvent'):
+                continue
+            entry = get_status_entry(d, asset)
+            if d in status_outline:
+                # use alert alarms status (alarm or alert)
+                entry.update(status_outline[d])
+            elif d in aa_def_set:
+                # healthy
                 entry["event_type"] = 'inactive'
-            #no status, unknown
-            else:
-                #nothing to do here
-                pass
-
             status_info.append(entry)
-    return jsonify({'alert_alarm':status_info})
+        return jsonify({'alert_alarm': status_info})
+    except Exception as err:
+        message = 'Failed to get alert_alarm status. (%s)' % str(err.message)
+        return conflict(message)
 
 
 #Create a new alert/alarm
@@ -261,6 +285,9 @@ def create_alert_alarm():
         alert_alarm.timestamp = dt.datetime.now()       # when this alert or alarm is received and persisted
         try:
             db.session.add(alert_alarm)
+            # Escalation state of the definition is updated in the same transaction (see determine_action)
+            if alert_alarm.event_type == 'alert':
+                SystemEventEscalation.record_alert(alert_alarm)
             db.session.commit()
             db.session.flush()
         except Exception as err:
@@ -269,8 +296,8 @@ def create_alert_alarm():
             db.session.rollback()
             return bad_request('IntegrityError creating alert_alarm.')
 
-        # Perform notification processes as required
-        handle_notifications(alert_alarm.id)
+        # Perform notification processes as required (queued; see notification_queue)
+        queue_notifications(alert_alarm.id, system_event_definition_id)
 
         return jsonify(alert_alarm.to_json()), 201
     except Exception as err:
@@ -279,6 +306,18 @@ def create_alert_alarm():
         return conflict(message)
 
 
+# Get notification queue status (queued definitions, batches waiting to be retried and dead-lettered notifications)
+@api.route('/alert_alarm/notification_queue', methods=['GET'])
+@auth.login_required
+@scope_required(u'user_admin')
+def get_alert_alarm_notification_queue():
+    try:
+        return jsonify({'notification_queue': get_notification_queue_status()})
+    except Exception as err:
+        message = 'Failed to get notification queue status. (%s)' % str(err.message)
+        return conflict(message)
+
+
 # Acknowledge alert/alarm
 @api.route('/ack_alert_alarm', methods=['POST','PUT'])
 @auth.login_required
@@ -1015,10 +1054,9 @@ def get_alert_alarm_json(alerts_alarms, definition_filters):
                 definition_id = alert_alarm.system_event_definition_id
                 tmp_json_dict = alert_alarm.to_json()
 
-                # Get SystemEventDefinition, filter based on variables in definition_filters
-                event_type = alert_alarm.event_type
-                definition = SystemEventDefinition.query.filter_by(id=definition_id, event_type=event_type).first()
-                if definition is None:
+                # SystemEventDefinition (loaded with the alert_alarm), filter based on variables in definition_filters
+                definition = alert_alarm.event
+                if definition is None or definition.event_type != alert_alarm.event_type:
                     message = 'No alert_alarm_definition (id:%d) for alert_alarm (id: %d, %s).' % \
                               (definition_id, alert_alarm.id, alert_alarm.event_type)
                     raise Exception(message)
@@ -1176,7 +1214,7 @@ def delete_alertfilter(id):
     try:
         uframe_url, timeout, timeout_read = get_uframe_alerts_info()
         url = "/".join([uframe_url, 'alertfilters', str(id)])
-        response = requests.delete(url, timeout=(timeout, timeout_read))
+        response = uframe_client.delete(url, timeout=(timeout, timeout_read))
         if response.status_code != 200:
             message = '(%r) Failed to execute alertfilter deletion (id: %d)' % (response.status_code, id)
             raise Exception(message)
@@ -1205,7 +1243,7 @@ def get_alertfilter(id):
     try:
         uframe_url, timeout, timeout_read = get_uframe_alerts_info()
         url = "/".join([uframe_url, 'alertfilters', str(id)])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code != 200:
             message = '(%d) Failed to get alertfilter from uframe' % response.status_code
             if response.content is not None:
@@ -1348,7 +1386,7 @@ def uframe_create_alertfilter(uframe_data):
     uframe_url, timeout, timeout_read = get_uframe_alerts_info()
     url = "/".join([uframe_url, 'alertfilters'])
     data = json.dumps(uframe_data)
-    response = requests.post(url, timeout=(timeout, timeout_read), headers=headers(), data=data)
+    response = uframe_client.post(url, timeout=(timeout, timeout_read), headers=headers(), data=data)
     return response
 
 
@@ -1357,7 +1395,7 @@ def uframe_update_alertfilter(uframe_data, alertfilter_id):
     uframe_url, timeout, timeout_read = get_uframe_alerts_info()
     url = "/".join([uframe_url, 'alertfilters', str(alertfilter_id)])
     data = json.dumps(uframe_data)
-    response = requests.put(url, timeout=(timeout, timeout_read), headers=headers(), data=data)
+    response = uframe_client.put(url, timeout=(timeout, timeout_read), headers=headers(), data=data)
     return response
 
 
@@ -1379,7 +1417,7 @@ def uframe_acknowledge_alert_alarm(uframe_event_id, value):
         uframe_data['eventId'] = str(uframe_event_id)
         uframe_data['acknowledgedBy'] = str(value)
         data = json.dumps(uframe_data)
-        response = requests.put(url, timeout=(timeout, timeout_read), headers=headers(), data=data)
+        response = uframe_client.put(url, timeout=(timeout, timeout_read), headers=headers(), data=data)
         if response.status_code != 200:
             message = 'Failure to issue uframe acknowledge for alert_alarm (event id: %d) in uframe. ' % uframe_event_id
             current_app.logger.info('[uframe_acknowledge_alert_alarm] %s ' % message)
@@ -1410,7 +1448,7 @@ def uframe_instrument_available(ref):
         mooring, platform, instrument = ref.split('-', 2)
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, 'metadata'])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code != 200:
             return bad_request('(%d) Failure to retrieve metadata from uframe.' % response.status_code)
         metadata = response.json()
@@ -1449,7 +1487,7 @@ def uframe_get_instrument_metadata(ref):
         mooring, platform, instrument = ref.split('-', 2)
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, 'metadata'])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code == 200:
             metadata = response.json()
             if 'parameters' in metadata:
@@ -1459,7 +1497,7 @@ def uframe_get_instrument_metadata(ref):
 
         # Get instrument methods
         url = "/".join([uframe_url, mooring, platform, instrument])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code == 200:
             methods = response.json()
         if methods is None:
@@ -1468,7 +1506,7 @@ def uframe_get_instrument_metadata(ref):
         # Get streams for each method (expects unique list of methods from uframe; no duplicates)
         for method in methods:
             url = "/".join([uframe_url, mooring, platform, instrument, method])
-            response = requests.get(url, timeout=(timeout, timeout_read))
+            response = uframe_client.get(url, timeout=(timeout, timeout_read))
             if response.status_code == 200:
                 streams_data = response.json()
                 if streams_data is not None:
@@ -1711,6 +1749,262 @@ def resolve_alert_alarm_definition(definition_id):
         return conflict(message)
 
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Bulk operations on alerts & alarms and definitions (selected by id list or filter)
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Acknowledge alerts/alarms in bulk
+@api.route('/alert_alarm/bulk_ack', methods=['POST', 'PUT'])
+@auth.login_required
+@scope_required(u'user_admin')
+@scope_required(u'redmine')
+def bulk_acknowledge_alert_alarm():
+    """ Acknowledge the alert(s) and alarm(s) selected in request.data (see select_bulk_alerts_alarms) by 'ack_by'.
+    Alarms are acknowledged in uframe concurrently; then each batch is updated in one statement and transaction.
+    Response: {'acknowledged': [ids], 'failed': [{'id': id, 'message': message}, ...]}
+    """
+    try:
+        data = json.loads(request.data)
+        ack_by = data.get('ack_by')
+        if ack_by is None:
+            message = 'Required value ack_by is empty or None.'
+            return bad_request(message)
+
+        def uframe_acknowledge(instance):
+            if uframe_acknowledge_alert_alarm(instance.uframe_event_id, ack_by):
+                return None
+            return 'Failed to acknowledge alarm (id:%d) in uframe.' % instance.id
+
+        acknowledged = []
+        failed = []
+        instances = [instance for instance in select_bulk_alerts_alarms(data) if not instance.acknowledged]
+        for batch in get_bulk_batches(instances):
+            # Only alarms go through the acknowledge process with uframe (i.e. uframe only stores alarms)
+            alarms = [instance for instance in batch if instance.event_type == 'alarm']
+            errors = dict(zip([alarm.id for alarm in alarms], map_uframe(uframe_acknowledge, alarms)))
+            ids = []
+            for instance in batch:
+                if errors.get(instance.id) is not None:
+                    failed.append({'id': instance.id, 'message': errors[instance.id]})
+                else:
+                    ids.append(instance.id)
+            if not ids:
+                continue
+            ts_acknowledged = dt.datetime.strftime(dt.datetime.now(), "%Y-%m-%dT%H:%M:%S")
+            try:
+                SystemEvent.query.filter(SystemEvent.id.in_(ids))\
+                    .update({'acknowledged': True, 'ack_by': ack_by, 'ts_acknowledged': ts_acknowledged},
+                            synchronize_session=False)
+                db.session.commit()
+                acknowledged.extend(ids)
+            except Exception as err:
+                db.session.rollback()
+                current_app.logger.info('[bulk_acknowledge_alert_alarm] %s ' % str(err.message))
+                failed.extend({'id': id, 'message': 'IntegrityError acknowledging alert_alarm'} for id in ids)
+        return jsonify({'acknowledged': acknowledged, 'failed': failed}), 200
+    except Exception as err:
+        message = 'Insufficient data, or bad data format; %s' % err.message
+        current_app.logger.info('[bulk_acknowledge_alert_alarm] %s ' % message)
+        return conflict(message)
+
+
+# Resolve (clear) alerts/alarms in bulk
+@api.route('/alert_alarm/bulk_resolve', methods=['PUT'])
+@auth.login_required
+@scope_required(u'user_admin')
+def bulk_resolve_alert_alarm():
+    """ Resolve the alert(s) and alarm(s) selected in request.data (see select_bulk_alerts_alarms) with
+    'resolved_comment'. Instances must be acknowledged (and alarms need a resolved_comment); others are reported
+    as failed. Each batch is updated in one statement and transaction.
+    Response: {'resolved': [ids], 'failed': [{'id': id, 'message': message}, ...]}
+    """
+    try:
+        data = json.loads(request.data)
+        if 'resolved_comment' not in data:
+            message = 'Failed to provide resolved comment in request data; unable to resolve alert or alarm.'
+            return bad_request(message)
+        resolved_comment = data['resolved_comment']
+
+        # Determine current user who is clearing alert or alarm instances
+        assigned_user = User.query.get(g.current_user.id)
+        if assigned_user is None:
+            message = 'Unknown/unassigned user with g.current_user.id: %s' % str(g.current_user.id)
+            return bad_request(message)
+        name = assigned_user.first_name + ' ' + assigned_user.last_name
+        comment = '[' + name + '] ' + (resolved_comment or '')
+
+        resolved = []
+        failed = []
+        instances = [instance for instance in select_bulk_alerts_alarms(data) if not instance.resolved]
+        for batch in get_bulk_batches(instances):
+            ids = []
+            for instance in batch:
+                if not instance.acknowledged:
+                    message = 'Cannot clear %s unless it is acknowledged. (id: %d)' % (instance.event_type, instance.id)
+                    failed.append({'id': instance.id, 'message': message})
+                elif instance.event_type == 'alarm' and resolved_comment is None:
+                    message = 'Resolved comment is empty of None; unable to resolve alarm. (id: %d)' % instance.id
+                    failed.append({'id': instance.id, 'message': message})
+                else:
+                    ids.append(instance.id)
+            if not ids:
+                continue
+            try:
+                SystemEvent.query.filter(SystemEvent.id.in_(ids))\
+                    .update({'resolved': True, 'resolved_comment': comment}, synchronize_session=False)
+                db.session.commit()
+                resolved.extend(ids)
+            except Exception as err:
+                db.session.rollback()
+                current_app.logger.info('[bulk_resolve_alert_alarm] %s ' % str(err.message))
+                failed.extend({'id': id, 'message': 'IntegrityError during resolve'} for id in ids)
+        return jsonify({'resolved': resolved, 'failed': failed}), 200
+    except Exception as err:
+        message = 'Insufficient data, or bad data format. %s' % str(err.message)
+        current_app.logger.info('[bulk_resolve_alert_alarm] %s ' % message)
+        return conflict(message)
+
+
+# Activate or deactivate alert/alarm definitions in bulk
+@api.route('/alert_alarm_definition/bulk_active', methods=['PUT'])
+@auth.login_required
+@scope_required(u'user_admin')
+def bulk_activate_alert_alarm_definition():
+    """ Set 'active' (true or false) for the (not retired) definitions selected in request.data by 'ids' or any of
+    'reference_designator', 'array_name', 'platform_name', 'instrument_name'. The uframe alertfilters are enabled
+    or disabled concurrently; then each batch is updated in one statement and transaction.
+    Response: {'updated': [ids], 'failed': [{'id': id, 'message': message}, ...]}
+    """
+    try:
+        data = json.loads(request.data)
+        if 'active' not in data:
+            message = 'Failed to provide active (true or false) in request data.'
+            return bad_request(message)
+        active = to_bool(data['active'])
+        ids, filters = get_bulk_selection(data, ['reference_designator', 'array_name', 'platform_name',
+                                                 'instrument_name'])
+        definitions = SystemEventDefinition.query.filter(SystemEventDefinition.active != active)\
+            .filter(or_(SystemEventDefinition.retired == None, SystemEventDefinition.retired == False))
+        if ids is not None:
+            definitions = definitions.filter(SystemEventDefinition.id.in_(ids))
+        for key, value in filters.iteritems():
+            definitions = definitions.filter(getattr(SystemEventDefinition, key) == value)
+        definitions = definitions.order_by(SystemEventDefinition.id).all()
+
+        def uframe_update(alertfilter):
+            try:
+                if update_uframe_alertfilter(alertfilter, alertfilter['uframe_filter_id']) is not None:
+                    return None
+                message = 'Failed to update uframe alertfilter (id: %d).' % alertfilter['uframe_filter_id']
+            except Exception as err:
+                message = str(err.message)
+            return message
+
+        updated = []
+        failed = []
+        for batch in get_bulk_batches(definitions):
+            alertfilters = []
+            for definition in batch:
+                alertfilter = definition.to_json()
+                alertfilter['active'] = active
+                alertfilter['stream'] = alertfilter['stream'].replace('-', '_')
+                alertfilters.append(alertfilter)
+            ids = []
+            for alertfilter, error in zip(alertfilters, map_uframe(uframe_update, alertfilters)):
+                if error is not None:
+                    failed.append({'id': alertfilter['id'], 'message': error})
+                else:
+                    ids.append(alertfilter['id'])
+            if not ids:
+                continue
+            try:
+                SystemEventDefinition.query.filter(SystemEventDefinition.id.in_(ids))\
+                    .update({'active': active}, synchronize_session=False)
+                db.session.commit()
+                updated.extend(ids)
+            except Exception as err:
+                db.session.rollback()
+                current_app.logger.info('[bulk_activate_alert_alarm_definition] %s ' % str(err.message))
+                failed.extend({'id': id, 'message': 'IntegrityError updating alert_alarm_definition'} for id in ids)
+        return jsonify({'updated': updated, 'failed': failed}), 200
+    except Exception as err:
+        message = 'Insufficient data, or bad data format. %s' % str(err.message)
+        current_app.logger.info('[bulk_activate_alert_alarm_definition] %s ' % message)
+        return conflict(message)
+
+
+def get_bulk_selection(data, filter_keys):
+    """ Selection for a bulk operation from request data: 'ids' (list of ids) and/or filters (keys in filter_keys);
+    'start_time' and 'end_time' are 'YYYY-mm-ddTHH:MM:SS'. Returns (ids or None, filters); raises if neither given.
+    """
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) == 0:
+            raise Exception('ids must be a non-empty list of ids.')
+        ids = [int(id) for id in ids]
+    filters = {}
+    for key in filter_keys:
+        if data.get(key) is not None:
+            filters[key] = data[key]
+    for key in ['start_time', 'end_time']:
+        if key in filters:
+            filters[key] = dt.datetime.strptime(filters[key], "%Y-%m-%dT%H:%M:%S")
+    if ids is None and not filters:
+        raise Exception('Provide ids or at least one of: %s' % ', '.join(filter_keys))
+    return ids, filters
+
+
+def select_bulk_alerts_alarms(data):
+    """ (id, uframe_event_id, event_type, acknowledged, resolved) of the alert_alarms selected by request data:
+    'ids' and/or 'reference_designator', 'system_event_definition_id' (id or list of ids), 'start_time', 'end_time'
+    (event_time range).
+    """
+    ids, filters = get_bulk_selection(data, ['reference_designator', 'system_event_definition_id',
+                                             'start_time', 'end_time'])
+    query = db.session.query(SystemEvent.id, SystemEvent.uframe_event_id, SystemEvent.event_type,
+                             SystemEvent.acknowledged, SystemEvent.resolved)\
+        .join(SystemEventDefinition, SystemEvent.system_event_definition_id == SystemEventDefinition.id)
+    if ids is not None:
+        query = query.filter(SystemEvent.id.in_(ids))
+    if 'reference_designator' in filters:
+        query = query.filter(SystemEventDefinition.reference_designator == filters['reference_designator'])
+    if 'system_event_definition_id' in filters:
+        definition_ids = filters['system_event_definition_id']
+        if not isinstance(definition_ids, list):
+            definition_ids = [definition_ids]
+        query = query.filter(SystemEvent.system_event_definition_id.in_([int(id) for id in definition_ids]))
+    if 'start_time' in filters:
+        query = query.filter(SystemEvent.event_time >= filters['start_time'])
+    if 'end_time' in filters:
+        query = query.filter(SystemEvent.event_time <= filters['end_time'])
+    return query.order_by(SystemEvent.id).all()
+
+
+def get_bulk_batches(items):
+    """ items in batches of BULK_BATCH_SIZE.
+    """
+    size = max(1, int(current_app.config.get('BULK_BATCH_SIZE', 500)))
+    return [items[index:index + size] for index in xrange(0, len(items), size)]
+
+
+def map_uframe(fn, items):
+    """ [fn(item) for item in items], with at most BULK_UFRAME_WORKERS concurrent calls (each in an app context).
+    """
+    if not items:
+        return []
+    app = current_app._get_current_object()
+
+    def call(item):
+        with app.app_context():
+            return fn(item)
+    workers = min(len(items), int(current_app.config.get('BULK_UFRAME_WORKERS', 8)))
+    pool = ThreadPool(max(1, workers))
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 #==============================================================
 #List all alert and alarm definitions
 @api.route('/alert_alarms', methods=['GET'])
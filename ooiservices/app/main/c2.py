@@ -10,13 +10,19 @@ from ooiservices.app.main import api
 from ooiservices.app.models import Array
 from ooiservices.app.main.routes import get_display_name_by_rd
 import json, os
-import requests
+from ooiservices.app import cache, uframe_client
+from multiprocessing.pool import ThreadPool
 from urllib import urlencode
 from ooiservices.app.main.errors import bad_request
 from ooiservices.app.main.authentication import auth
 from ooiservices.app.decorators import scope_required
+from ooiservices.app.main.c2_status import StatusFanout
 import datetime as dt
 
+C2_TOC_CACHE_KEY = 'c2_toc'
+C2_STATUS_CACHE_PREFIX = 'c2_status:'
+C2_INSTRUMENTS_STATUS_CACHE_KEY = 'c2_instruments_status'
+c2_status_fanout = StatusFanout()
 
 # - - - - - - - - - - - - - - - - - - - - - - - -
 # C2 array routes
@@ -34,6 +40,16 @@ def c2_get_arrays():
             list_of_arrays.append(item)
     return jsonify(arrays=list_of_arrays)
 
+@api.route('/c2/toc', methods=['DELETE'])
+@auth.login_required
+@scope_required(u'command_control')
+def c2_reset_toc():
+    '''
+    Invalidate the cached C2 hierarchy (arrays, platforms, instruments).
+    '''
+    invalidate_toc()
+    return jsonify({}), 200
+
 @api.route('/c2/array/<string:array_code>/abstract', methods=['GET'])
 @auth.login_required
 @scope_required(u'command_control')
@@ -214,6 +230,9 @@ def c2_get_platform_ports_display(reference_designator):
         # Get instruments for this platform
         platform_code = "-".join([platform_deployment['mooring_code'], platform_deployment['platform_code'] ])
         instruments, oinstruments = _get_instruments(platform_code)
+        # Driver status of all instruments, polled concurrently ({} when not available in time)
+        statuses = _c2_get_instrument_driver_statuses([instrument_deployment['reference_designator']
+                                                       for instrument_deployment in instruments])
         # create list of reference_designators (instruments) and accumulate dict result (key=reference_designator) for output
         for instrument_deployment in instruments:
             rd = instrument_deployment['reference_designator']
@@ -235,11 +254,7 @@ def c2_get_platform_ports_display(reference_designator):
                 row['display_name'] = rd
             else:
                 row['display_name'] = instrument_deployment['display_name']
-            try:
-                status = _c2_get_instrument_driver_status(rd)
-            except:
-                status = {}
-            row['instrument_status'] = status
+            row['instrument_status'] = statuses.get(rd, {})
             platform_info[rd] = row
 
         # Create list of dictionaries representing row(s) for 'data' (ordered by reference_designator)
@@ -663,6 +678,11 @@ def _c2_get_instruments_status():
     Sample: http://localhost:4000/instrument/api
     """
     try:
+        cache_timeout = current_app.config.get('C2_STATUS_CACHE_TIMEOUT', 5)
+        if cache_timeout:
+            data = cache.get(C2_INSTRUMENTS_STATUS_CACHE_KEY)
+            if data is not None:
+                return data
         data = None
         response = uframe_get_instruments_status()
         if response.status_code !=200:
@@ -672,10 +692,48 @@ def _c2_get_instruments_status():
                 data = json.loads(response.content)
             except:
                 raise Exception('Malformed data; not in valid json format.')
+        if cache_timeout and data is not None:
+            cache.set(C2_INSTRUMENTS_STATUS_CACHE_KEY, data, timeout=cache_timeout)
         return data
     except:
         raise
 
+
+def _c2_get_instrument_driver_statuses(reference_designators):
+    """
+    Driver status (_c2_get_instrument_driver_status) of each instrument, returned as {reference_designator: status}.
+    Instruments are polled concurrently (at most C2_STATUS_WORKERS per process); an instrument which fails or does
+    not answer within C2_STATUS_TIMEOUT seconds is left out, so one unresponsive driver does not hold up the page.
+    Statuses are cached C2_STATUS_CACHE_TIMEOUT seconds per reference designator, so operators viewing the same
+    platform share one poll.
+    """
+    cache_timeout = current_app.config.get('C2_STATUS_CACHE_TIMEOUT', 5)
+    statuses = {}
+    missing = list(reference_designators)
+    if cache_timeout and missing:
+        cached = cache.get_many(*[C2_STATUS_CACHE_PREFIX + rd for rd in missing])
+        statuses = dict((rd, status) for rd, status in zip(missing, cached) if status is not None)
+        missing = [rd for rd in missing if rd not in statuses]
+    if not missing:
+        return statuses
+
+    app = current_app._get_current_object()
+
+    def fetch(reference_designator):
+        with app.app_context():
+            status = _c2_get_instrument_driver_status(reference_designator)
+            if cache_timeout and status is not None:
+                cache.set(C2_STATUS_CACHE_PREFIX + reference_designator, status, timeout=cache_timeout)
+            return status
+
+    fetched = c2_status_fanout.map(missing, fetch,
+                                   workers=int(current_app.config.get('C2_STATUS_WORKERS', 8)),
+                                   timeout=current_app.config.get('C2_STATUS_TIMEOUT', 10))
+    for reference_designator, status in fetched.iteritems():
+        if status is not None:
+            statuses[reference_designator] = status
+    return statuses
+
 def uframe_get_instruments_status():
     """
     Returns the uframe response for status of all instrument agents.
@@ -683,7 +741,7 @@ def uframe_get_instruments_status():
     """
     try:
         url, timeout, timeout_read = get_uframe_info()
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as err:
         #return _response_internal_server_error()
@@ -747,7 +805,7 @@ def uframe_get_instrument_driver_status(reference_designator):
     try:
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as err:
         message = str(err.message)
@@ -990,7 +1048,7 @@ def uframe_get_instrument_driver_parameter_values(reference_designator, command)
     try:
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator, command])
-        response = requests.get(url, timeout=(timeout, timeout_read),
+        response = uframe_client.get(url, timeout=(timeout, timeout_read),
                                 data={'resource': json.dumps('DRIVER_PARAMETER_ALL')})
         return response
     except Exception as err:
@@ -1189,7 +1247,7 @@ def _uframe_post_instrument_driver_set(reference_designator, command, data):
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator, command])
         url = "?".join([url, suffix])
-        response = requests.post(url, timeout=(timeout, timeout_read), headers=_post_headers())
+        response = uframe_client.post(url, timeout=(timeout, timeout_read), headers=_post_headers())
         return response
     except Exception as err:
         message = str(err.message)
@@ -1507,7 +1565,7 @@ def get_uframe_stream_types(mooring, platform, instrument):
         uframe_url, timeout, timeout_read = get_uframe_data_info()
         url = '/'.join([uframe_url, mooring, platform, instrument])
         if debug: print '\n (get_uframe_stream_types) url: ', url
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as err:
         message = str(err.message)
@@ -1521,7 +1579,7 @@ def get_uframe_streams(mooring, platform, instrument, stream_type):
     try:
         uframe_url, timeout, timeout_read = get_uframe_data_info()
         url = '/'.join([uframe_url, mooring, platform, instrument, stream_type])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as err:
         message = str(err.message)
@@ -1543,7 +1601,7 @@ def get_uframe_stream_contents(mooring, platform, instrument, stream_type, strea
         uframe_url, timeout, timeout_read = get_uframe_data_info()
         url = "/".join([uframe_url, mooring, platform, instrument, stream_type, stream + query])
         if debug: print '\n (get_uframe_stream_contents) url: ', url
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if not response or response is None:
             message = 'No data available from uFrame for this request.\rInstrument: %s, Method: %s, Stream: %s' % \
                             (instrument, stream_type, stream)
@@ -1572,7 +1630,7 @@ def uframe_get_instrument_driver_command(reference_designator, command):
     try:
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator, command])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as err:
         message = str(err.message)
@@ -1588,7 +1646,7 @@ def uframe_post_instrument_driver_command(reference_designator, command, suffix)
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator, command])
         url = "?".join([url, suffix])
-        response = requests.post(url, timeout=(timeout, timeout_read), headers=_post_headers())
+        response = uframe_client.post(url, timeout=(timeout, timeout_read), headers=_post_headers())
         return response
     except Exception as err:
         message = str(err.message)
@@ -1672,76 +1730,125 @@ def _eval_POST_response_data(response_data, msg=None):
     except:
         raise
 
-def _get_toc():
+def _get_toc(reset=False):
     """
     Returns a dictionary of arrays, moorings, platforms and instruments from uframe.
     Augmented by the UI database for vocabulary and arrays.
+
+    The hierarchy is crawled once (each level fetched concurrently) and cached for
+    C2_TOC_TIMEOUT seconds together with lookup indexes:
+        platform_index, instrument_index:   reference_designator -> item
+        platforms_by_array:                 array code -> [platform, ...]
+        instruments_by_platform:            'mooring-platform' -> [instrument, ...]
     :return: json
     """
-    UFRAME_DATA = current_app.config['UFRAME_URL'] + current_app.config['UFRAME_URL_BASE']
-    timeout = current_app.config['UFRAME_TIMEOUT_CONNECT']
-    timeout_read = current_app.config['UFRAME_TIMEOUT_READ']
     try:
-        toc = {}
-        mooring_list = []
-        platform_list = []
-        instrument_list = []
-        url = "/".join([UFRAME_DATA])
-        response = requests.get(url, timeout=(timeout, timeout_read))
-        if response.status_code != 200:
-            raise Exception('uframe connection cannot be made.')
-        moorings = response.json()
-        for mooring in moorings:
-            mooring_list.append({'reference_designator': mooring,
-                                 'array_code': mooring[:2],
-                                 'display_name': get_display_name_by_rd(mooring)
-                                 })
-            url = "/".join([UFRAME_DATA, mooring])
-            response = requests.get(url, timeout=(timeout, timeout_read))
-            if response.status_code == 200:
-                platforms = response.json()
-                for platform in platforms:
-                    platform_list.append({'reference_designator': "-".join([mooring, platform]),
-                                          'mooring_code': mooring,
-                                          'platform_code': platform,
-                                          'display_name': get_display_name_by_rd("-".join([mooring, platform]))
-                                          })
-                    url = "/".join([UFRAME_DATA, mooring, platform])
-                    response = requests.get(url, timeout=(timeout, timeout_read))
-                    if response.status_code == 200:
-                        instruments = response.json()
-                        for instrument in instruments:
-                            reference_designator = "-".join([mooring, platform, instrument])
-                            instrument_list.append({'mooring_code': mooring,
-                                                    'platform_code': platform,
-                                                    'instrument_code': instrument,
-                                                    'reference_designator': reference_designator,
-                                                    'display_name': get_display_name_by_rd(reference_designator=reference_designator)
-                                                    })
-                arrays = Array.query.all()
-                toc['arrays'] = [array.to_json() for array in arrays]
-                toc['moorings'] = mooring_list
-                toc['platforms'] = platform_list
-                toc['instruments'] = instrument_list
-
+        if not reset:
+            toc = cache.get(C2_TOC_CACHE_KEY)
+            if toc:
+                return toc
+        toc = _crawl_toc()
+        if toc:
+            cache.set(C2_TOC_CACHE_KEY, toc, timeout=current_app.config.get('C2_TOC_TIMEOUT', 300))
         return toc
     except Exception as e:
+        current_app.logger.info('[_get_toc] %s' % e.message)
         return None
 
 
+def invalidate_toc():
+    # Drop the cached C2 hierarchy; the next request crawls uframe again.
+    cache.delete(C2_TOC_CACHE_KEY)
+
+
+def _crawl_toc():
+    """
+    Crawl uframe sensor inventory: mooring -> platform -> instrument, issuing the
+    requests of each level concurrently (at most C2_TOC_WORKERS at a time).
+    """
+    UFRAME_DATA = current_app.config['UFRAME_URL'] + current_app.config['UFRAME_URL_BASE']
+    timeout = current_app.config['UFRAME_TIMEOUT_CONNECT']
+    timeout_read = current_app.config['UFRAME_TIMEOUT_READ']
+    workers = current_app.config.get('C2_TOC_WORKERS', 10)
+
+    def fetch(path):
+        # Returns (path, list) for one inventory level; an empty list on failure.
+        try:
+            response = uframe_client.get("/".join([UFRAME_DATA] + list(path)), timeout=(timeout, timeout_read))
+            if response.status_code == 200:
+                return path, response.json()
+        except Exception:
+            pass
+        return path, []
+
+    response = uframe_client.get(UFRAME_DATA, timeout=(timeout, timeout_read))
+    if response.status_code != 200:
+        raise Exception('uframe connection cannot be made.')
+    moorings = response.json()
+
+    pool = ThreadPool(max(1, min(workers, len(moorings) or 1)))
+    try:
+        platform_paths = []
+        for (mooring,), platforms in pool.map(fetch, [(mooring,) for mooring in moorings]):
+            platform_paths.extend([(mooring, platform) for platform in platforms])
+        instrument_lists = pool.map(fetch, platform_paths)
+    finally:
+        pool.close()
+        pool.join()
+
+    toc = {}
+    mooring_list = []
+    platform_list = []
+    instrument_list = []
+    for mooring in moorings:
+        mooring_list.append({'reference_designator': mooring,
+                             'array_code': mooring[:2],
+                             'display_name': get_display_name_by_rd(mooring)
+                             })
+    for (mooring, platform), instruments in instrument_lists:
+        platform_list.append({'reference_designator': "-".join([mooring, platform]),
+                              'mooring_code': mooring,
+                              'platform_code': platform,
+                              'display_name': get_display_name_by_rd("-".join([mooring, platform]))
+                              })
+        for instrument in instruments:
+            reference_designator = "-".join([mooring, platform, instrument])
+            instrument_list.append({'mooring_code': mooring,
+                                    'platform_code': platform,
+                                    'instrument_code': instrument,
+                                    'reference_designator': reference_designator,
+                                    'display_name': get_display_name_by_rd(reference_designator=reference_designator)
+                                    })
+    arrays = Array.query.all()
+    toc['arrays'] = [array.to_json() for array in arrays]
+    toc['moorings'] = mooring_list
+    toc['platforms'] = platform_list
+    toc['instruments'] = instrument_list
+
+    # Indexes used by the C2 routes.
+    toc['platform_index'] = {}
+    toc['platforms_by_array'] = {}
+    for platform in platform_list:
+        toc['platform_index'][platform['reference_designator']] = platform
+        toc['platforms_by_array'].setdefault(platform['reference_designator'][0:2], []).append(platform)
+    toc['instrument_index'] = {}
+    toc['instruments_by_platform'] = {}
+    for instrument in instrument_list:
+        rd = instrument['reference_designator']
+        if rd in toc['instrument_index']:
+            continue
+        toc['instrument_index'][rd] = instrument
+        platform_code = "-".join([instrument['mooring_code'], instrument['platform_code']])
+        toc['instruments_by_platform'].setdefault(platform_code, []).append(instrument)
+    return toc
+
+
 def _get_platforms(array):
     # Returns all platforms for specified array from uframe.
     try:
         dataset = _get_toc()
-        #dataset = get_structured_toc()
         if dataset:
-            _platforms = dataset['platforms']
-            platforms = []
-            if _platforms:
-                for platform in _platforms:
-                    if platform['reference_designator'][0:2] == array:
-                        platforms.append(platform)
-            return platforms
+            return list(dataset['platforms_by_array'].get(array, []))
     except:
         return None
 
@@ -1750,15 +1857,8 @@ def _get_platform(reference_designator):
     # Returns requested platform information from uframe.
     try:
         dataset = _get_toc()
-        #dataset = get_structured_toc()
         if dataset:
-            platforms = dataset['platforms']
-            platform_deployment = None
-            for platform in platforms:
-                if platform['reference_designator'] == reference_designator:
-                    platform_deployment = platform
-                    break
-            return platform_deployment
+            return dataset['platform_index'].get(reference_designator)
     except:
         return None
 
@@ -1767,15 +1867,8 @@ def _get_instrument(reference_designator):
     # Returns requested instrument information from uframe.
     try:
         dataset = _get_toc()
-        #dataset = get_structured_toc()
         if dataset:
-            instruments = dataset['instruments']
-            _instrument = None
-            for instrument in instruments:
-                if instrument['reference_designator'] == reference_designator:
-                    _instrument = instrument
-                    break
-            return _instrument
+            return dataset['instrument_index'].get(reference_designator)
     except:
         return None
 
@@ -1785,13 +1878,9 @@ def _get_instruments(platform):
     instruments = []        # list of dictionaries
     oinstruments = []       # list of reference_designators
     dataset = _get_toc()
-    #dataset = get_structured_toc()
-    _instruments = dataset['instruments']
-    for instrument in _instruments:
-        if platform in instrument['reference_designator']:
-            if instrument['reference_designator'] not in oinstruments:
-                oinstruments.append(instrument['reference_designator'])
-                instruments.append(instrument)
+    if dataset:
+        instruments = list(dataset['instruments_by_platform'].get(platform, []))
+        oinstruments = [instrument['reference_designator'] for instrument in instruments]
     return instruments, oinstruments
 
 
@@ -2215,7 +2304,7 @@ def uframe_start_instrument_agent_and_driver(reference_designator, payload):
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator])
         urlencode(payload)
-        response = requests.post(url, timeout=(timeout, timeout_read), data=json.dumps(payload), headers=_post_headers())
+        response = uframe_client.post(url, timeout=(timeout, timeout_read), data=json.dumps(payload), headers=_post_headers())
         return response
     except:
         return _response_internal_server_error()
@@ -2255,7 +2344,7 @@ def uframe_instrument_driver_stop(reference_designator):
     try:
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator])
-        response = requests.delete(url, timeout=(timeout, timeout_read), headers=_headers())
+        response = uframe_client.delete(url, timeout=(timeout, timeout_read), headers=_headers())
         return response
     except:
         return _response_internal_server_error()
@@ -2319,7 +2408,7 @@ def uframe_instrument_driver_initialize(reference_designator):
     try:
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator, 'initialize'])
-        response = requests.post(url, timeout=(timeout, timeout_read), headers=_post_headers())
+        response = uframe_client.post(url, timeout=(timeout, timeout_read), headers=_post_headers())
         return response
     except:
         return _response_internal_server_error()
@@ -2425,7 +2514,7 @@ def uframe_set_instrument_driver_initparams(reference_designator, command, paylo
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, reference_designator, command])
         urlencode(payload)
-        response = requests.post(url, timeout=(timeout, timeout_read),data=payload, headers=_post_headers())
+        response = uframe_client.post(url, timeout=(timeout, timeout_read),data=payload, headers=_post_headers())
         return response
     except Exception as err:
         return _response_internal_server_error(str(err.message))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+'''
+C2 status fan-out.
+
+Polls a status per reference designator on a shared, per process pool of
+threads (the concurrency cap toward uframe). A reference designator which is
+already being polled (for another request) is not polled again; its request
+waits on the same poll. Callers wait at most timeout seconds and get the
+statuses which are ready; a slow poll keeps running in the background.
+'''
+
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+
+class StatusFanout(object):
+
+    def __init__(self):
+        self._pool = None
+        self._pid = None
+        self._workers = None
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def _get_pool(self, workers):
+        # a forked worker (celery, uwsgi) must not use the threads of its parent
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is None or self._pid != pid or self._workers != workers:
+                if self._pid == pid:
+                    # polls running on the old pool finish there and are still shared
+                    if self._pool is not None:
+                        self._pool.close()
+                else:
+                    # the parent's polls never finish in this process
+                    self._in_flight = {}
+                self._pool = ThreadPool(max(1, workers))
+                self._pid = pid
+                self._workers = workers
+            return self._pool
+
+    def _run(self, key, fetch, entry):
+        try:
+            return fetch(key)
+        finally:
+            with self._lock:
+                # only this poll's entry; a newer poll of key may have replaced it
+                if self._in_flight.get(key) is entry.get('result'):
+                    del self._in_flight[key]
+
+    def map(self, keys, fetch, workers=8, timeout=None):
+        '''
+        {key: fetch(key)} for keys, fetched on a pool of workers threads. Keys
+        whose fetch raises, or which are not done within timeout seconds, are left out.
+        '''
+        if not keys:
+            return {}
+        pool = self._get_pool(workers)
+        pending = {}
+        with self._lock:
+            for key in keys:
+                if key not in self._in_flight:
+                    # _run waits for this lock, so the entry is set before it can finish
+                    entry = {}
+                    entry['result'] = self._in_flight[key] = pool.apply_async(self._run, (key, fetch, entry))
+                pending[key] = self._in_flight[key]
+        deadline = None if timeout is None else time.time() + timeout
+        results = {}
+        for key, result in pending.iteritems():
+            try:
+                if deadline is None:
+                    results[key] = result.get()
+                else:
+                    results[key] = result.get(max(0, deadline - time.time()))
+            except Exception:
+                pass
+        return results
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+Notification dispatch queue (for Alerts & Alarms escalation process)
+
+create_alert_alarm persists the alert_alarm and enqueues its id; notifications (red mine) are sent later by
+dispatch_notifications (celery task tasks.dispatch_notifications), so ingest from uframe does not wait on red mine.
+
+Queue state is kept in redis:
+    notifications:queue                 definition ids with pending alert_alarms (each queued once)
+    notifications:queued                set of the definition ids in notifications:queue
+    notifications:pending:<id>          alert_alarm ids of definition <id> waiting for notification, in order
+    notifications:processing:<id>       alert_alarm ids of definition <id> being sent; each is removed once sent,
+                                        so a batch left by a dispatch which died is sent by the next dispatch
+    notifications:retry                 hash definition id -> json {'ids': [...], 'due': time} of failed batches
+    notifications:attempts              hash alert_alarm id -> failed attempts
+    notifications:dead                  dead-letter list (json) of notifications which could not be sent
+    notifications:dispatch              lock held (with a token unique to the dispatch) while dispatching, renewed
+                                        before each alert_alarm; a dispatch which lost it stops
+
+Definitions are dispatched concurrently (NOTIFICATION_WORKERS threads); the alert_alarms of one definition are
+processed in order by one thread, since the escalation state of an alert depends on the alerts before it.
+When an alert_alarm fails, it and the rest of its batch wait NOTIFICATION_RETRY_DELAY seconds (doubling per attempt);
+after NOTIFICATION_MAX_ATTEMPTS failures it is moved to the dead-letter list and the rest of the batch continues.
+"""
+
+import json
+import os
+import time
+import uuid
+from multiprocessing.pool import ThreadPool
+from flask import current_app
+from ooiservices.app import db, redis_store
+from ooiservices.app.main.notifications import (handle_notifications, process_notifications)
+
+QUEUE_KEY = 'notifications:queue'
+QUEUED_KEY = 'notifications:queued'
+PENDING_PREFIX = 'notifications:pending:'
+PROCESSING_PREFIX = 'notifications:processing:'
+RETRY_KEY = 'notifications:retry'
+ATTEMPTS_KEY = 'notifications:attempts'
+DEAD_KEY = 'notifications:dead'
+LOCK_KEY = 'notifications:dispatch'
+LOCK_TIMEOUT = 600
+
+# delete the lock only while it is still ours (it may have expired and been taken by another dispatch)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# extend the lock while it is still ours
+EXTEND_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# the batch being processed, moving the pending alert_alarms there when there is none
+TAKE_PENDING_SCRIPT = """
+if redis.call('exists', KEYS[2]) == 0 and redis.call('exists', KEYS[1]) == 1 then
+    redis.call('rename', KEYS[1], KEYS[2])
+end
+return redis.call('lrange', KEYS[2], 0, -1)
+"""
+
+
+def queue_notifications(id, definition_id):
+    """ Notify for alert_alarm id: enqueue when NOTIFICATION_QUEUE_ENABLED (falling back to inline
+    processing if redis is unavailable), otherwise process inline.
+    """
+    if current_app.config.get('NOTIFICATION_QUEUE_ENABLED', False):
+        try:
+            enqueue_notification(id, definition_id)
+            return
+        except Exception as err:
+            message = 'Failed to enqueue notification for alert_alarm (id: %d), sending inline. %s' % (id, err.message)
+            current_app.logger.info(message)
+    handle_notifications(id)
+
+
+def enqueue_notification(id, definition_id):
+    """ Add alert_alarm id to the pending notifications of its definition; queue the definition unless it is queued.
+    """
+    pipe = redis_store.pipeline()
+    pipe.rpush(PENDING_PREFIX + str(definition_id), id)
+    pipe.sadd(QUEUED_KEY, definition_id)
+    added = pipe.execute()[1]
+    if added:
+        redis_store.rpush(QUEUE_KEY, definition_id)
+
+
+def get_notification_queue_status():
+    """ Queue lengths and the dead-letter list.
+    """
+    retrying = {}
+    for definition_id, value in redis_store.hgetall(RETRY_KEY).iteritems():
+        retrying[definition_id] = json.loads(value)
+    dead = [json.loads(value) for value in redis_store.lrange(DEAD_KEY, 0, -1)]
+    return {'queued': redis_store.llen(QUEUE_KEY), 'retrying': retrying, 'dead': dead}
+
+
+def dispatch_notifications():
+    """ Send the queued notifications; returns counts of sent, retrying and dead notifications, or None when
+    another dispatch is running.
+    """
+    token = '%d:%s' % (os.getpid(), uuid.uuid4().hex)
+    if not redis_store.set(LOCK_KEY, token, nx=True, ex=LOCK_TIMEOUT):
+        return None
+    counts = {'sent': 0, 'retrying': 0, 'dead': 0}
+    try:
+        _requeue_unfinished()
+        _requeue_due_retries()
+        definition_ids = []
+        while True:
+            definition_id = redis_store.lpop(QUEUE_KEY)
+            if definition_id is None:
+                break
+            redis_store.srem(QUEUED_KEY, definition_id)
+            definition_ids.append(int(definition_id))
+        if not definition_ids:
+            return counts
+
+        app = current_app._get_current_object()
+        workers = int(current_app.config.get('NOTIFICATION_WORKERS', 4))
+        pool = ThreadPool(max(1, min(workers, len(definition_ids))))
+        try:
+            results = pool.map(lambda definition_id: _dispatch_definition(app, definition_id, token),
+                               definition_ids)
+        finally:
+            pool.close()
+            pool.join()
+        for result in results:
+            for name in counts:
+                counts[name] += result[name]
+        return counts
+    finally:
+        redis_store.eval(RELEASE_LOCK_SCRIPT, 1, LOCK_KEY, token)
+
+
+def _queue_definition(definition_id):
+    if redis_store.sadd(QUEUED_KEY, definition_id):
+        redis_store.rpush(QUEUE_KEY, definition_id)
+
+
+def _requeue_unfinished():
+    """ Queue the definitions with a batch left in processing by a dispatch which died (this dispatch holds the lock).
+    """
+    for key in redis_store.scan_iter(PROCESSING_PREFIX + '*'):
+        _queue_definition(int(key[len(PROCESSING_PREFIX):]))
+
+
+def _requeue_due_retries():
+    """ Put the failed batches which are due back in front of their pending alert_alarms and queue them.
+    """
+    now = time.time()
+    for definition_id, value in redis_store.hgetall(RETRY_KEY).iteritems():
+        retry = json.loads(value)
+        if retry['due'] > now:
+            continue
+        pipe = redis_store.pipeline()
+        pipe.hdel(RETRY_KEY, definition_id)
+        for id in reversed(retry['ids']):
+            pipe.lpush(PENDING_PREFIX + str(definition_id), id)
+        pipe.execute()
+        _queue_definition(definition_id)
+
+
+def _take_pending(definition_id):
+    """ alert_alarm ids of the batch being processed for a definition; the pending ones when there is no batch.
+    """
+    ids = redis_store.eval(TAKE_PENDING_SCRIPT, 2, PENDING_PREFIX + str(definition_id),
+                           PROCESSING_PREFIX + str(definition_id))
+    return [int(id) for id in ids]
+
+
+def _sent(definition_id):
+    """ Remove the first alert_alarm of the batch being processed (it has been sent or dead-lettered).
+    """
+    redis_store.lpop(PROCESSING_PREFIX + str(definition_id))
+
+
+def _extend_lock(token):
+    """ Renew the dispatch lock for LOCK_TIMEOUT seconds; False when it expired and may be held by another dispatch.
+    """
+    return bool(redis_store.eval(EXTEND_LOCK_SCRIPT, 1, LOCK_KEY, token, LOCK_TIMEOUT))
+
+
+def _dispatch_definition(app, definition_id, token):
+    """ Process the pending alert_alarms of one definition, in order. Only the last of the batch sends a
+    red mine 'update_notification'. Stops when the dispatch lock is lost; the rest of the batch stays in processing
+    for the dispatch holding the lock.
+    """
+    counts = {'sent': 0, 'retrying': 0, 'dead': 0}
+    with app.app_context():
+        try:
+            # A batch waiting to be retried goes first; newer alert_alarms stay pending until then.
+            if redis_store.hexists(RETRY_KEY, definition_id):
+                return counts
+            ids = _take_pending(definition_id)
+            index = 0
+            while index < len(ids):
+                id = ids[index]
+                if not _extend_lock(token):
+                    message = 'Notification dispatch lock lost; leaving %d alert_alarms of definition %d.' % \
+                              (len(ids) - index, definition_id)
+                    current_app.logger.info(message)
+                    break
+                try:
+                    process_notifications(id, update=(index == len(ids) - 1))
+                    _sent(definition_id)
+                    redis_store.hdel(ATTEMPTS_KEY, id)
+                    counts['sent'] += 1
+                except Exception as err:
+                    db.session.rollback()
+                    if _failed(definition_id, id, ids[index:], err):
+                        counts['retrying'] += len(ids) - index
+                        break
+                    counts['dead'] += 1
+                index += 1
+        finally:
+            db.session.remove()
+    return counts
+
+
+def _failed(definition_id, id, ids, err):
+    """ Record a failed notification. Returns True when ids (id and the rest of its batch) are to be retried,
+    False when id has been dead-lettered.
+    """
+    message = 'Failed to send notification for alert_alarm (id: %d). %s' % (id, err.message)
+    current_app.logger.info(message)
+    attempts = redis_store.hincrby(ATTEMPTS_KEY, id, 1)
+    max_attempts = int(current_app.config.get('NOTIFICATION_MAX_ATTEMPTS', 5))
+    if attempts < max_attempts:
+        delay = float(current_app.config.get('NOTIFICATION_RETRY_DELAY', 30)) * 2 ** (attempts - 1)
+        retry = {'ids': ids, 'due': time.time() + delay, 'attempts': attempts, 'error': message}
+        # the retry entry now holds the rest of the batch
+        pipe = redis_store.pipeline()
+        pipe.hset(RETRY_KEY, definition_id, json.dumps(retry))
+        pipe.delete(PROCESSING_PREFIX + str(definition_id))
+        pipe.execute()
+        return True
+    dead = {'id': id, 'definition_id': definition_id, 'attempts': attempts, 'error': message,
+            'timestamp': time.time()}
+    pipe = redis_store.pipeline()
+    pipe.rpush(DEAD_KEY, json.dumps(dead))
+    pipe.hdel(ATTEMPTS_KEY, id)
+    pipe.lpop(PROCESSING_PREFIX + str(definition_id))
+    pipe.execute()
+    return False
@@ -6,17 +6,17 @@ __author__ = 'Edna Donoughe'
 
 from flask import (current_app)
 from ooiservices.app import db
-from ooiservices.app.models import (User, SystemEvent, UserEventNotification, SystemEventDefinition)
+from ooiservices.app.models import (User, SystemEvent, SystemEventEscalation, UserEventNotification,
+                                    SystemEventDefinition)
 from ooiservices.app.redmine.routes import (create_redmine_ticket_for_notification, get_redmine_users_by_project,
-                                            update_redmine_ticket_for_notification, get_redmine_ticket_for_notification)
+                                            append_redmine_ticket_for_notification, get_redmine_ticket_for_notification)
 import datetime as dt
-from sqlalchemy import desc
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # Escalation notification using Red Mine
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-def handle_redmine_notifications(id):
+def handle_redmine_notifications(id, update=True):
     """
     Escalation notification processing is handled here for red mine.
 
@@ -24,6 +24,9 @@ def handle_redmine_notifications(id):
     For each of the three escalation states ('begin_notification', 'update_notification', 'reissue_notification'),
     there is a corresponding function (of the same name) which process the notification for that state.
     Each of these functions handles the case when use_redmine is either enabled or disabled (both are required).
+
+    When update is False an 'update_notification' is skipped; the notification queue passes False for all but the
+    last alert of a definition dispatched together, so a burst of alerts updates the red mine ticket once.
     """
     try:
         # Get alert_alarm using id provided
@@ -63,8 +66,11 @@ def handle_redmine_notifications(id):
 
                     # Update notification
                     elif action == 'update_notification':
-                        ticket_id = update_notification(alert_alarm, alert_alarm_definition, user_event_notification)
-                        if ticket_id is None:
+                        ticket_id = None
+                        if update:
+                            ticket_id = update_notification(alert_alarm, alert_alarm_definition,
+                                                            user_event_notification)
+                        if update and ticket_id is None:
                             message ='Failed to update notification for alert notification (id:%d)' % alert_alarm.id
                             current_app.logger.info(message)
 
@@ -269,20 +275,9 @@ def update_notification_redmine(alert, definition, notification):
                 ts_escalated = dt.datetime.strftime(dt.datetime.now(), "%Y-%m-%dT%H:%M:%S")
                 SystemEvent.update_alert_alarm_escalation(id=alert.id, ticket_id=ticket_id,
                                                           escalated=escalated, ts_escalated=ts_escalated)
-        # Get existing redmine ticket
-        redmine_ticket = get_redmine_ticket_for_notification(ticket_id)
-
-        # Set fields for update
-        project = redmine_ticket['project']
-        subject = redmine_ticket['subject']
-        description = redmine_ticket['description']
-        priority = redmine_ticket['priority']
-        if 'assigned_to' in redmine_ticket:
-            assigned_id = redmine_ticket['assigned_to']
-
-        # Update subject for recent receipt of alert (not past escalate boundary yet)
-        description += update_info
-        result = update_redmine_ticket_for_notification(ticket_id, project, subject, description, priority, assigned_id)
+        # Update description of existing redmine ticket for recent receipt of alert (not past escalate boundary yet);
+        # the ticket is assigned to assigned_id if it is unassigned.
+        result = append_redmine_ticket_for_notification(ticket_id, update_info, assigned_id)
         if result is None:
             message = 'Failed to update redmine ticket (ticket_id: %d)' % ticket_id
             current_app.logger.info(message)
@@ -470,10 +465,11 @@ def alert_escalation_state(id):
 
 def determine_action(id):
     """ For alert id, determine which valid action (or None) is next; return action. If exception, log exception.
+
+    The escalation state of the definition (SystemEventEscalation: start of the escalation period, escalated and
+    current ticket) is read and updated in one row, instead of reviewing all alerts for the definition.
     """
     action = None
-    previous_alert = None
-    previously_escalated = False
     try:
         # Get alert
         alert = SystemEvent.query.get(id)
@@ -489,112 +485,67 @@ def determine_action(id):
             current_app.logger.info('[determine_action] %s ' % message)
             return action
 
-        # Get associated alerts back to when ts_start is not None (ts_start set to timestamp when
-        # this alert first arrived).
-        alerts = SystemEvent.query.filter_by(
-            system_event_definition_id=alert.system_event_definition_id).order_by(desc(SystemEvent.id)).all()
-
-        # Determine whether additional alerts have arrived since first alert
-        found_alerts = False
-        if alerts is not None:
-            for item in alerts:
-                if item.id == alert.id:
-                    pass
-                else:
-                    found_alerts = True
-
-        # If this is the FIRST alert for this definition, set ts_start to current datetime, return None
-        if not found_alerts:
+        # Get escalation state for the definition (locked until commit).
+        state = SystemEventEscalation.get_or_build(alert.system_event_definition_id)
+        if state is None:
+            message = 'Failed to determine escalation state for system_event_definition: %d' % \
+                      alert.system_event_definition_id
+            raise Exception(message)
+
+        # If this is the FIRST alert for this definition (ts_start set when it was received), return None.
+        # (State built for an alert history without ts_start also starts its escalation period here.)
+        if state.ts_start is None:
             alert.ts_start = alert.event_time
-            try:
-                db.session.add(alert)
-                db.session.commit()
-            except Exception as err:
-                current_app.logger.info('[determine_action][1] %s ' % err.message)
+            state.start_event_id = alert.id
+            state.ts_start = alert.event_time
+            db.session.add(alert)
+            db.session.add(state)
+            db.session.commit()
+            return action
+        if state.start_event_id == alert.id:
+            db.session.commit()
             return action
 
         # Not the first alert received for this definition, evaluate this alert to determine whether to escalate.
         # Or if escalated == True, then have we exceeded the escalate boundary (if so, re-issue ticket)
-        else:
-            # Determine if previously escalated, review previous alert to see if escalated is True. Save previous_alert.
-            previously_escalated = False
-            inx = 1
-            for item in alerts:
-                if inx > 1:
-                    if item.escalated == True:
-                        previously_escalated = True
-                        previous_alert = item
-                        break
-                inx += 1
-
-            # Determine start_alert (ts_start is not None)
-            start_alert = None
-            for item in alerts:
-                if item.ts_start is not None:
-                    start_alert = item
-                    break
-
-            # Now have initial alert which kicked off (start_alert)
-            # Evaluate time delta (event_time) of this alert versus start_alert
-            delta = (alert.event_time - start_alert.ts_start).total_seconds()
-
-            # if delta is greater than escalate_on value (from definition), has alert been previously escalated?
-            if delta <= alert_alarm_definition.escalate_on:
-                pass
-            elif delta > alert_alarm_definition.escalate_on:
-
-                # if alert hasn't been previously escalated, begin escalation
-                if not previously_escalated: #alert.escalated:
-                    action = 'begin_notification'
-                    return action
-
-                else:
-                    # if alert previously escalated, determine if we have crossed escalate_boundary.
-                    # If escalate boundary is crossed:
-                    #     First:
-                    #        reset start_alert.ts_start - None
-                    #        alert.ts_start - event_time
-                    #     Proceed to reissue ticket where:
-                    #      escalated True, timestamp None
-                    #      update ticket_id to be for new ticket_id created
-                    # Carry forward some escalation data from previous alert...
-                    try:
-                        alert.escalated = previous_alert.escalated
-                        alert.ts_escalated = previous_alert.ts_escalated
-                        alert.ticket_id = previous_alert.ticket_id
-                        db.session.add(alert)
-                        db.session.commit()
-                    except Exception as err:
-                        message = '[determine_action][2] (Escalate boundary has been crossed) %s ' % err.message
-                        current_app.logger.info(message)
-                    # If boundary has not been crossed, update existing ticket
-                    if delta <= alert_alarm_definition.escalate_boundary:
-                        # Escalate boundary has not been crossed, update existing ticket
-                        action = 'update_notification'
-                        return action
-
-                    elif delta > alert_alarm_definition.escalate_boundary:
-                        # Escalate boundary has been crossed, issue new ticket 'reissue_notification_ticket'
-                        action = 'reissue_notification'
-                        start_alert.ts_start = None
-                        try:
-                            db.session.add(start_alert)
-                            db.session.commit()
-                        except Exception as err:
-                            message = '[determine_action][3] (Escalate boundary has been crossed) (1) %s ' % err.message
-                            current_app.logger.info(message)
+        # Evaluate time delta (event_time) of this alert versus start of escalation period
+        delta = (alert.event_time - state.ts_start).total_seconds()
 
-                        alert.ts_start = alert.event_time
-                        try:
-                            db.session.add(alert)
-                            db.session.commit()
-                        except Exception as err:
-                            message = '[determine_action][4] (Escalate boundary has been crossed) [2] %s ' % err.message
-                            current_app.logger.info(message)
-                        return action
+        # if delta is greater than escalate_on value (from definition), has alert been previously escalated?
+        if delta <= alert_alarm_definition.escalate_on:
+            pass
+
+        # if alert hasn't been previously escalated, begin escalation
+        elif not state.escalated:
+            action = 'begin_notification'
 
+        else:
+            # if alert previously escalated, determine if we have crossed escalate_boundary.
+            # Carry forward escalation data of the definition (current ticket) to this alert...
+            alert.escalated = state.escalated
+            alert.ts_escalated = state.ts_escalated
+            alert.ticket_id = state.ticket_id
+
+            # If boundary has not been crossed, update existing ticket
+            if delta <= alert_alarm_definition.escalate_boundary:
+                action = 'update_notification'
+
+            # Escalate boundary has been crossed, issue new ticket; this alert starts the next escalation period:
+            #   start alert ts_start - None
+            #   alert.ts_start - event_time
+            else:
+                action = 'reissue_notification'
+                if state.start_event_id is not None:
+                    SystemEvent.query.filter_by(id=state.start_event_id).update({'ts_start': None})
+                alert.ts_start = alert.event_time
+                state.start_event_id = alert.id
+                state.ts_start = alert.event_time
+            db.session.add(alert)
+            db.session.add(state)
+        db.session.commit()
         return action
 
     except Exception as err:
+        db.session.rollback()
         current_app.logger.info('[determine_action] %s ' % err.message)
         return action
\ No newline at end of file
@@ -7,10 +7,9 @@ __author__ = 'M@Campbell'
 
 from flask import jsonify, request
 from ooiservices.app.main import api
-from ooiservices.app.models import Array, PlatformDeployment, Platformname
-from ooiservices.app.models import VocabNames
-from ooiservices.app.models import Stream, StreamParameter, \
-    Organization, Instrumentname
+from ooiservices.app import vocab_resolver
+from ooiservices.app.models import Array, PlatformDeployment
+from ooiservices.app.models import Stream, StreamParameter, Organization
 # from netCDF4 import num2date, date2index
 
 
@@ -81,10 +80,7 @@ def _array_name(ref_des):
     ''' M@Campbell 12/21/2015 '''
     array_des = ref_des[:2]
     try:
-        array = VocabNames.query.with_entities(VocabNames.level_one).\
-            filter_by(reference_designator=array_des).first()
-        if array is not None:
-            return array.level_one
+        return vocab_resolver.vocab_level(array_des, 1)
     except Exception as e:
         print 'Unhandled exception in:'\
             'ooiuiserivces.main.routes._array_name: %s.' % e
@@ -94,10 +90,7 @@ def _platform_name(ref_des):
     ''' M@Campbell 12/21/2015 '''
     platform_des = ref_des[:8]
     try:
-        platform = VocabNames.query.with_entities(VocabNames.level_two).\
-            filter_by(reference_designator=platform_des).first()
-        if platform is not None:
-            return platform.level_two
+        return vocab_resolver.vocab_level(platform_des, 2)
     except Exception as e:
         print 'Unhandled exception in:'\
             'ooiuiserivces.main.routes._platform_name: %s.' % e
@@ -107,10 +100,7 @@ def _assembly_name(ref_des):
     ''' M@Campbell 12/21/2015 '''
     assembly_des = ref_des[:14]
     try:
-        assembly = VocabNames.query.with_entities(VocabNames.level_three).\
-            filter_by(reference_designator=assembly_des).first()
-        if assembly is not None:
-            return assembly.level_three
+        return vocab_resolver.vocab_level(assembly_des, 3)
     except Exception as e:
         print 'Unhandled exception in:'\
             'ooiuiserivces.main.routes._assembly_name: %s.' % e
@@ -120,10 +110,7 @@ def _instrument_name(ref_des):
     ''' M@Campbell 12/21/2015 '''
     instrument_des = ref_des[:27]
     try:
-        instrument = VocabNames.query.with_entities(VocabNames.level_four).\
-            filter_by(reference_designator=instrument_des).first()
-        if instrument is not None:
-            return instrument.level_four
+        return vocab_resolver.vocab_level(instrument_des, 4)
     except Exception as e:
         print 'Unhandled exception in:'\
             'ooiuiserivces.main.routes._instrument_name: %s.' % e
@@ -149,15 +136,7 @@ def get_display_name_by_rd(reference_designator):
 
 def get_long_display_name_by_rd(reference_designator):
     try:
-        display_name = VocabNames.query.\
-            filter_by(reference_designator=reference_designator).first()
-
-        if display_name is not None:
-            display_name = ' '.join((display_name.level_one or "",
-                                     display_name.level_two or "",
-                                     display_name.level_three or "",
-                                     display_name.level_four or ""))
-        return display_name
+        return vocab_resolver.long_display_name(reference_designator)
     except Exception as e:
         print 'Unhandled exception in:'\
                 'ooiservices.main.routes.get_long_display_name_by_rd: %s' % e
@@ -165,7 +144,7 @@ def get_long_display_name_by_rd(reference_designator):
 
 
 def get_platform_display_name_by_rd(reference_designator):
-    platform = Platformname.query.filter_by(reference_designator=reference_designator[:14]).first()
+    platform = vocab_resolver.platform_name(reference_designator)
     if platform is None:
         return None
     platform_display_name = platform.platform
@@ -174,23 +153,11 @@ def get_platform_display_name_by_rd(reference_designator):
 
 
 def get_parameter_name_by_parameter(stream_parameter_name):
-    streamParameter = StreamParameter.query.filter_by(stream_parameter_name = stream_parameter_name).first()
-    if streamParameter is None or streamParameter is []:
-        return None
-
-    stream_display_name = streamParameter.standard_name
-
-    return stream_display_name
+    return vocab_resolver.parameter_name(stream_parameter_name)
 
 
 def get_stream_name_by_stream(stream):
-    stream = Stream.query.filter_by(stream=stream).first()
-    if stream is None or stream is []:
-        return None
-
-    stream_display_name = stream.concatenated_name
-
-    return stream_display_name
+    return vocab_resolver.stream_name(stream)
 
 
 @api.route('/display_name', methods=['GET'])
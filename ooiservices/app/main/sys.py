@@ -7,6 +7,8 @@ __author__ = 'M@Campbell'
 
 from flask import jsonify, current_app, request
 from ooiservices.app.main import api
+from ooiservices.app import uframe_client, plot_cache, blob_cache
+from ooiservices.app.blob_cache import BLOB_PREFIX
 from celery.task.control import discard_all
 import urllib
 import subprocess
@@ -31,6 +33,37 @@ def list_routes():
     return jsonify({'routes': routes})
 
 
+@api.route('/uframe_client_stats', methods=['GET'])
+def uframe_client_stats():
+    '''
+    Per-endpoint latency and connection pool usage counters of the shared
+    uFrame client, for the worker process answering this request.
+    '''
+    return jsonify(uframe_client.stats())
+
+
+@api.route('/plot_cache_stats', methods=['GET', 'DELETE'])
+def plot_cache_stats():
+    '''
+    Hit/miss counters of the rendered plot cache (all workers); DELETE
+    resets them.
+    '''
+    if request.method == 'DELETE':
+        plot_cache.reset_stats()
+    return jsonify(plot_cache.stats())
+
+
+@api.route('/blob_cache_stats', methods=['GET', 'DELETE'])
+def blob_cache_stats():
+    '''
+    Serialized size, encode and decode times of the large cached collections
+    (all workers); DELETE resets the counters.
+    '''
+    if request.method == 'DELETE':
+        blob_cache.reset_stats()
+    return jsonify(blob_cache.stats())
+
+
 @api.route('/cache_keys', methods=['GET'])
 @api.route('/cache_keys/<string:key>', methods=['DELETE'])
 def cache_list(key=None):
@@ -64,6 +97,11 @@ def cache_list(key=None):
                 temp_list.append({'key': cache_key,
                                   'name': cache_key.split('_')[2]
                                   })
+            # compressed collections (blob_cache); deleting the manifest drops a sharded one
+            elif cache_key.startswith(BLOB_PREFIX) and ':shard:' not in cache_key:
+                temp_list.append({'key': cache_key,
+                                  'name': cache_key[len(BLOB_PREFIX):].split(':')[0]
+                                  })
 
         # assign the list to the main bin
         flask_cache = temp_list
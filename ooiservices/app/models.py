@@ -17,6 +17,7 @@ from werkzeug.security import check_password_hash
 from wtforms import ValidationError
 from geoalchemy2.types import Geometry
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy_searchable import make_searchable, SearchQueryMixin
 from sqlalchemy_utils.types import TSVectorType
 from datetime import datetime
@@ -625,12 +626,13 @@ class PlatformDeployment(db.Model, DictSerializableMixin):
         '''
 
         import re
+        from ooiservices.app import vocab_resolver
         if not reference_designator:
             return None
 
         rd_len = len(reference_designator)
 
-        p_n = Platformname.query.filter(Platformname.reference_designator == reference_designator[:14]).first()
+        p_n = vocab_resolver.platform_name(reference_designator)
         if not p_n:
             return reference_designator
 
@@ -658,11 +660,11 @@ class PlatformDeployment(db.Model, DictSerializableMixin):
             else:
                 platform_text = p_n.assembly
 
-            i_n = Instrumentname.query.filter(Instrumentname.instrument_class == inst).first()
+            i_n = vocab_resolver.instrument_name(inst)
             if not i_n:
                 return cls._f_concat_rd(p_n.array_type, p_n.array_name, p_n.site, p_n.platform, platform_text, inst)
 
-            return cls._f_concat_rd(p_n.array_type, p_n.array_name, p_n.site, p_n.platform, platform_text, i_n.display_name)
+            return cls._f_concat_rd(p_n.array_type, p_n.array_name, p_n.site, p_n.platform, platform_text, i_n)
         return None
 
     def __repr__(self):
@@ -775,7 +777,14 @@ class SystemEventDefinition(db.Model):
     eventReceiptDelta: (int) used (by admin) to provide control to throttle excess uframe topic generation (jms issue)
     """
     __tablename__ = 'system_event_definitions'
-    __table_args__ = {u'schema': __schema__}
+    __table_args__ = (
+        # alert_alarm listing and status filters
+        db.Index('ix_system_event_definitions_reference_designator', 'reference_designator'),
+        db.Index('ix_system_event_definitions_array_name', 'array_name'),
+        db.Index('ix_system_event_definitions_platform_name', 'platform_name'),
+        db.Index('ix_system_event_definitions_instrument_name', 'instrument_name'),
+        db.Index('ix_system_event_definitions_retired_active', 'retired', 'active'),
+        {u'schema': __schema__})
 
     id = db.Column(db.Integer, primary_key=True)
     uframe_filter_id = db.Column(db.Integer, nullable=False)
@@ -872,7 +881,13 @@ class SystemEvent(db.Model):
     ts_escalated:       datetime when first red mine ticket is created
     """
     __tablename__ = 'system_events'
-    __table_args__ = {u'schema': __schema__}
+    __table_args__ = (
+        # join to the definition and the alert_alarm listing filters, each with id for keyset pagination
+        db.Index('ix_system_events_definition_id', 'system_event_definition_id', 'id'),
+        db.Index('ix_system_events_acknowledged', 'acknowledged', 'id'),
+        db.Index('ix_system_events_event_type', 'event_type', 'id'),
+        db.Index('ix_system_events_method_deployment', 'method', 'deployment'),
+        {u'schema': __schema__})
 
     id = db.Column(db.Integer, primary_key=True)
     system_event_definition_id = db.Column(db.ForeignKey(u'' + __schema__ + '.system_event_definitions.id'), nullable=False)
@@ -906,6 +921,8 @@ class SystemEvent(db.Model):
             event.escalated = escalated
             event.ts_escalated = ts_escalated
             db.session.add(event)
+            if event.event_type == 'alert':
+                SystemEventEscalation.record_escalation(event)
             db.session.commit()
             db.session.flush()
             return
@@ -950,6 +967,99 @@ class SystemEvent(db.Model):
         return str(v)
 
 
+class SystemEventEscalation(db.Model):
+    """
+    Escalation state of the alerts for one SystemEventDefinition, so an escalation decision reads one row
+    instead of the alert history (see notifications_redmine.determine_action).
+
+    start_event_id:     alert which started the current escalation period (the alert with ts_start set)
+    ts_start:           event_time of start_event_id; escalate_on and escalate_boundary are measured from it
+    last_event_id:      most recent alert received for the definition
+    escalated:          true once a red mine ticket has been created for the definition
+    ts_escalated:       datetime when the current red mine ticket was created
+    ticket_id:          current red mine ticket id (0 when red mine is not used)
+    """
+    __tablename__ = 'system_event_escalations'
+    __table_args__ = {u'schema': __schema__}
+
+    system_event_definition_id = db.Column(db.ForeignKey(u'' + __schema__ + '.system_event_definitions.id'),
+                                           primary_key=True, autoincrement=False)
+    start_event_id = db.Column(db.Integer, nullable=True)
+    ts_start = db.Column(db.DateTime(True), nullable=True)
+    last_event_id = db.Column(db.Integer, nullable=False)
+    escalated = db.Column(db.Boolean, nullable=False, server_default=db.text("false"))
+    ts_escalated = db.Column(db.DateTime(False), nullable=True)
+    ticket_id = db.Column(db.Integer, nullable=False, server_default=db.text("0"))
+
+    @staticmethod
+    def get_for_update(definition_id):
+        return SystemEventEscalation.query.filter_by(system_event_definition_id=definition_id)\
+            .with_for_update().first()
+
+    @staticmethod
+    def build(definition_id):
+        """ Escalation state of a definition from its alert history; None when it has no alerts.
+        """
+        alerts = SystemEvent.query.filter_by(system_event_definition_id=definition_id, event_type='alert')\
+            .order_by(SystemEvent.id.desc())
+        last = alerts.first()
+        if last is None:
+            return None
+        state = SystemEventEscalation(system_event_definition_id=definition_id, last_event_id=last.id,
+                                      escalated=False, ticket_id=0)
+        start = alerts.filter(SystemEvent.ts_start.isnot(None)).first()
+        if start is not None:
+            state.start_event_id = start.id
+            state.ts_start = start.ts_start
+        escalated = alerts.filter(SystemEvent.escalated == True).first()
+        if escalated is not None:
+            state.escalated = True
+            state.ts_escalated = escalated.ts_escalated
+            state.ticket_id = escalated.ticket_id
+        return state
+
+    @staticmethod
+    def get_or_build(definition_id):
+        """ Locked escalation state of a definition, built from its history when there is no row yet.
+        """
+        state = SystemEventEscalation.get_for_update(definition_id)
+        if state is None:
+            state = SystemEventEscalation.build(definition_id)
+            if state is None:
+                return None
+            try:
+                # another alert for this definition may insert the row concurrently
+                with db.session.begin_nested():
+                    db.session.add(state)
+            except IntegrityError:
+                state = SystemEventEscalation.get_for_update(definition_id)
+        return state
+
+    @staticmethod
+    def record_alert(alert):
+        """ Record a new alert (added to the session, not yet committed) so it is committed with the alert.
+        The first alert of a definition starts the escalation period.
+        """
+        db.session.flush()
+        state = SystemEventEscalation.get_or_build(alert.system_event_definition_id)
+        if state.ts_start is None:
+            alert.ts_start = alert.event_time
+            state.start_event_id = alert.id
+            state.ts_start = alert.event_time
+        state.last_event_id = alert.id
+        db.session.add(state)
+
+    @staticmethod
+    def record_escalation(alert):
+        """ Record the red mine ticket created for alert (not committed).
+        """
+        db.session.flush()
+        state = SystemEventEscalation.get_or_build(alert.system_event_definition_id)
+        state.escalated = alert.escalated
+        state.ts_escalated = alert.ts_escalated
+        state.ticket_id = alert.ticket_id
+        db.session.add(state)
+
 class UserEventNotification(db.Model):
     """
     User notification of Alerts/Alarms from uFrame
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+'''
+ooiservices.app.plot_cache
+
+Cache of rendered plots.  Entries are keyed by a hash of the normalized plot
+request (instrument, stream and the query arguments which change the image)
+and held in redis, with a copy on local disk so a redis flush or eviction
+does not force a re-render.  The ETag of an entry is the hash of the image,
+so clients revalidate with If-None-Match.  Plots whose end date has settled
+are kept for PLOT_CACHE_TIMEOUT_HISTORICAL, others for PLOT_CACHE_TIMEOUT_RECENT.
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from dateutil.parser import parse as parse_date
+
+PLOT_CACHE_PREFIX = 'plot_cache:'
+PLOT_CACHE_STATS_KEY = 'plot_cache_stats'
+
+# query arguments which change the rendered plot, and their defaults
+PLOT_ARGS = {'format': 'svg', 'plotLayout': 'timeseries', 'xvar': 'time', 'yvar': '',
+             'scatter': 'true', 'event': 'true', 'qaqc': '0', 'profileId': '',
+             'height': '100', 'width': '100', 'startdate': '', 'enddate': '',
+             'dpa_flag': '0', 'points': '', 'decimation': '', 'x_units': '', 'y_units': ''}
+BOOLEAN_ARGS = ('scatter', 'event', 'dpa_flag')
+
+
+class PlotEntry(object):
+    def __init__(self, body, etag, content_type, expires):
+        self.body = body
+        self.etag = etag
+        self.content_type = content_type
+        self.expires = expires
+
+    @property
+    def max_age(self):
+        return max(0, int(self.expires - time.time()))
+
+    def dumps(self):
+        header = json.dumps({'etag': self.etag, 'content_type': self.content_type, 'expires': self.expires})
+        return header + '\n' + self.body
+
+    @classmethod
+    def loads(cls, payload):
+        header, body = payload.split('\n', 1)
+        header = json.loads(header)
+        return cls(body, header['etag'], header['content_type'], header['expires'])
+
+
+class PlotCache(object):
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.directory = None
+        self.timeout_recent = 300
+        self.timeout_historical = 7 * 86400
+        self.settle = 86400
+        self.prune_interval = 3600
+        self._pruned_at = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = bool(config.get('PLOT_CACHE_ENABLED', self.enabled))
+        self.directory = config.get('PLOT_CACHE_DIR', self.directory)
+        self.timeout_recent = int(config.get('PLOT_CACHE_TIMEOUT_RECENT', self.timeout_recent))
+        self.timeout_historical = int(config.get('PLOT_CACHE_TIMEOUT_HISTORICAL', self.timeout_historical))
+        self.settle = int(config.get('PLOT_CACHE_SETTLE', self.settle))
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['plot_cache'] = self
+
+    @staticmethod
+    def request_key(instrument, stream, args):
+        '''
+        Hash of the normalized plot request: defaults filled in, booleans
+        lower cased, unrelated arguments (cache busters, tokens) dropped.
+        '''
+        normalized = {'instrument': instrument, 'stream': stream}
+        for name, default in PLOT_ARGS.iteritems():
+            value = args.get(name, default)
+            if name in BOOLEAN_ARGS:
+                value = str(value).lower() in ('1', 'true', 't', 'yes', 'y')
+            normalized[name] = value
+        return hashlib.sha1(json.dumps(normalized, sort_keys=True)).hexdigest()
+
+    def timeout_for(self, end_date):
+        '''
+        Historical plots (end date older than PLOT_CACHE_SETTLE seconds) do not
+        change and are kept long; anything else may still get new data.
+        '''
+        try:
+            end = parse_date(end_date)
+        except (ValueError, OverflowError, AttributeError, TypeError):
+            return self.timeout_recent
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=pytz.utc)
+        if end < datetime.now(pytz.utc) - timedelta(seconds=self.settle):
+            return self.timeout_historical
+        return self.timeout_recent
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    @staticmethod
+    def _count(name):
+        from ooiservices.app import redis_store
+        try:
+            redis_store.hincrby(PLOT_CACHE_STATS_KEY, name, 1)
+        except Exception:
+            pass
+
+    def get(self, key):
+        '''
+        Cached PlotEntry for the request key, from redis and then disk, or None.
+        '''
+        if not self.enabled:
+            return None
+        from ooiservices.app import redis_store
+        try:
+            payload = redis_store.get(PLOT_CACHE_PREFIX + key)
+        except Exception:
+            payload = None
+        if payload is not None:
+            self._count('hits_redis')
+            return PlotEntry.loads(payload)
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._count('hits_disk')
+            try:
+                redis_store.setex(PLOT_CACHE_PREFIX + key, entry.max_age or 1, entry.dumps())
+            except Exception:
+                pass
+            return entry
+
+        self._count('misses')
+        return None
+
+    def set(self, key, body, content_type, end_date):
+        '''
+        Store a rendered plot; returns its PlotEntry (the etag is returned even
+        when caching is disabled).
+        '''
+        timeout = self.timeout_for(end_date)
+        etag = hashlib.sha1(body).hexdigest()
+        entry = PlotEntry(body, etag, content_type, time.time() + timeout)
+        if not self.enabled:
+            return entry
+        from ooiservices.app import redis_store
+        try:
+            redis_store.setex(PLOT_CACHE_PREFIX + key, timeout, entry.dumps())
+        except Exception:
+            pass
+        self._write_disk(key, entry)
+        self._count('stores')
+        return entry
+
+    def not_modified(self):
+        self._count('not_modified')
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = PlotEntry.loads(f.read())
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        if entry.expires < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            # write aside and rename, so readers never see a partial file
+            temp = '%s.%d.%d' % (path, os.getpid(), threading.current_thread().ident)
+            with open(temp, 'wb') as f:
+                f.write(entry.dumps())
+            os.rename(temp, path)
+        except (IOError, OSError):
+            return
+        self._prune()
+
+    def _prune(self):
+        '''
+        Remove expired files, at most once every prune_interval per process.
+        '''
+        now = time.time()
+        with self._lock:
+            if now - self._pruned_at < self.prune_interval:
+                return
+            self._pruned_at = now
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > self.timeout_historical:
+                        # older than any timeout (or an abandoned temp file)
+                        os.remove(path)
+                    elif '.' not in name:
+                        # reading an expired entry removes it
+                        self._read_disk(name)
+                except OSError:
+                    pass
+
+    def stats(self):
+        from ooiservices.app import redis_store
+        try:
+            counters = redis_store.hgetall(PLOT_CACHE_STATS_KEY) or {}
+        except Exception:
+            counters = {}
+        stats = dict((name, int(value)) for name, value in counters.iteritems())
+        for name in ('hits_redis', 'hits_disk', 'misses', 'stores', 'not_modified'):
+            stats.setdefault(name, 0)
+        lookups = stats['hits_redis'] + stats['hits_disk'] + stats['misses']
+        stats['hit_ratio'] = (float(stats['hits_redis'] + stats['hits_disk']) / lookups) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['directory'] = self.directory
+        return stats
+
+    def reset_stats(self):
+        from ooiservices.app import redis_store
+        try:
+            redis_store.delete(PLOT_CACHE_STATS_KEY)
+        except Exception:
+            pass
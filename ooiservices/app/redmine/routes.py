@@ -8,8 +8,8 @@ from flask import (jsonify, request, Response, current_app)
 from ooiservices.app.redmine import redmine as api
 from ooiservices.app.main.authentication import auth
 from ooiservices.app.decorators import scope_required
+from ooiservices.app import redmine_client
 from collections import OrderedDict
-from redmine import Redmine
 import json
 
 
@@ -20,10 +20,8 @@ issue_fields = ['id', 'assigned_to', 'author', 'created_on', 'description', 'don
 
 
 def redmine_login():
-    key = current_app.config['REDMINE_KEY']
-    redmine = Redmine(current_app.config['REDMINE_URL'],
-                      key=key, requests={'verify': False})
-    return redmine
+    # Shared, long-lived connection (see redmine_client)
+    return redmine_client.redmine
 
 
 @api.route('/ticket', methods=['POST'])
@@ -57,23 +55,15 @@ def create_redmine_ticket():
         if field in dataDict:
             fields[field] = dataDict[field]
     try:
-        # Log into Redmine
-        redmine = redmine_login()
-
-        # Create new issue
-        issue = redmine.issue.new()
-        # Get the list of ticker Trackers
-        trackers = list(redmine.tracker.all())
-        # Find the REDMINE_TRACKER (like 'Support') and get the id
+        # Find the REDMINE_TRACKER (like 'Support') and get the id (cached)
         # This make a difference for field validation and proper tracker assignment
-        config_redmine_tracker = current_app.config['REDMINE_TRACKER']
-        tracker_id = [tracker.id for tracker in trackers if tracker.name == config_redmine_tracker][0]
-        issue.tracker_id = tracker_id
+        ticket_fields = {'tracker_id': redmine_client.tracker_id(current_app.config['REDMINE_TRACKER'])}
         for key, value in fields.iteritems():
             if value is not None:
-                setattr(issue, key, value)
+                ticket_fields[key] = value
 
-        issue.save()
+        # Create new issue
+        redmine_client.create_issue(ticket_fields)
 
         return data, 201
     except Exception as e:
@@ -147,15 +137,8 @@ def update_redmine_ticket():
         if field in dataDict:
             fields[field] = dataDict[field]
 
-    # Log into Redmine
-    redmine = redmine_login()
-
-    # Get the issue, update all fields except the issue resource id
-    issue = redmine.issue.get(dataDict['resource_id'])
-    for key, value in fields.iteritems():
-        if 'resource_id' != key:
-            setattr(issue, key, value)
-    issue.save()
+    # Update all fields except the issue resource id
+    redmine_client.update_issue(dataDict['resource_id'], fields)
 
     return data, 201
 
@@ -167,12 +150,11 @@ def get_redmine_ticket():
     '''
     Get a specific ticket by id
     '''
-    redmine = redmine_login()
     if 'id' not in request.args:
         return Response(response="{error: id not defined}", status=400, mimetype="application/json")
 
     issue_id = request.args['id']
-    issue = redmine.issue.get(issue_id, include='children,journals,watchers')
+    issue = redmine_client.get_issue(issue_id, include='children,journals,watchers')
 
     details = OrderedDict()
     for field in issue_fields:
@@ -200,6 +182,31 @@ def get_redmine_users():
 
     return jsonify(users)
 
+
+@api.route('/metadata', methods=['GET'])
+@auth.login_required
+@scope_required('redmine')
+def get_redmine_metadata():
+    '''
+    Get the cached Red Mine trackers, issue priorities and projects.
+    '''
+    try:
+        return jsonify(redmine_client.metadata())
+    except Exception as e:
+        current_app.logger.exception('[get_redmine_metadata] %s ' % e.message)
+        return Response(response='{"error":"'+e.message+'"}', status=400, mimetype="application/json")
+
+
+@api.route('/metadata/refresh', methods=['POST'])
+@auth.login_required
+@scope_required('redmine')
+def refresh_redmine_metadata():
+    '''
+    Drop the cached Red Mine trackers, issue priorities, projects and users; they are fetched again on next use.
+    '''
+    redmine_client.refresh()
+    return jsonify({}), 200
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # redmine methods for alert and alarm notifications
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -227,21 +234,10 @@ def create_redmine_ticket_for_notification(project_id, subject, description, pri
             if field in data:
                 fields[field] = data[field]
 
-        # Log into Redmine
-        redmine = redmine_login()
-        issue = redmine.issue.new()
-        # Get the list of ticker Trackers
-        trackers = list(redmine.tracker.all())
-        # Find the REDMINE_TRACKER (like 'Support') and get the id
+        # Find the REDMINE_TRACKER (like 'Support') and get the id (cached)
         # This make a difference for field validation and proper tracker assignment
-        config_redmine_tracker = current_app.config['REDMINE_TRACKER']
-        tracker_id = [tracker.id for tracker in trackers if tracker.name == config_redmine_tracker][0]
-        issue.tracker_id = tracker_id # support
-        for key, value in fields.iteritems():
-            setattr(issue, key, value)
-
-        if issue.save():
-            ticket_id = issue.id
+        fields['tracker_id'] = redmine_client.tracker_id(current_app.config['REDMINE_TRACKER'])
+        ticket_id = redmine_client.create_issue(fields)
 
     except Exception as err:
         current_app.logger.exception('[create_redmine_ticket_for_notification] %s ' % err.message)
@@ -262,22 +258,15 @@ def get_redmine_users_by_project(project_id):
     if project_id not in projects:
         return []
     '''
-    redmine = redmine_login()
-    all_users = redmine.user.all(offset=1, limit=100, project_id=project_id)
-    users = dict(users=[])
-    for n in xrange(len(all_users)):
-      user = str(all_users[n])
-      user_id = int(all_users[n]['id'])
-      users['users'].append([user,user_id])
-    return users
+    # Users of the project are cached (see redmine_client)
+    return redmine_client.users(project_id)
 
 def get_redmine_ticket_for_notification(id):
     ''' Get a specific ticket by id for alert notification. Success return ticket_id; if error, return None.
     '''
     details = None
     try:
-        redmine = redmine_login()
-        issue = redmine.issue.get(id, include='children,journals,watchers')
+        issue = redmine_client.get_issue(id, include='children,journals,watchers')
         details = {}
         for field in issue_fields:
             if hasattr(issue, field):
@@ -312,18 +301,23 @@ def update_redmine_ticket_for_notification(resource_id, project_id, subject, des
             if field in data:
                 fields[field] = data[field]
 
-        # Log into Redmine
-        redmine = redmine_login()
-
-        # Get the issue; update all fields except the issue resource id
-        issue = redmine.issue.get(data['resource_id'])
-        for key, value in fields.iteritems():
-            if 'resource_id' != key:
-                setattr(issue, key, value)
-        if issue.save():
-            ticket_id = issue.id
+        # Update all fields except the issue resource id
+        ticket_id = redmine_client.update_issue(data['resource_id'], fields)
 
     except Exception as err:
         current_app.logger.exception('[update_redmine_ticket_for_notification] %s ' % err.message)
     finally:
         return ticket_id
+
+
+def append_redmine_ticket_for_notification(resource_id, update_info, assigned_id):
+    ''' Append update_info to the description of a ticket for alert notification (assigning it to assigned_id
+    if it is unassigned) in one fetch and save. Success return ticket_id, if error return None.
+    '''
+    ticket_id = None
+    try:
+        ticket_id = redmine_client.append_issue(resource_id, update_info, assign=assigned_id)
+    except Exception as err:
+        current_app.logger.exception('[append_redmine_ticket_for_notification] %s ' % err.message)
+    finally:
+        return ticket_id
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+'''
+ooiservices.app.redmine_client
+
+Long-lived Red Mine client shared by the redmine endpoints and the alert/alarm
+notification tickets. One Redmine connection per process; the tracker,
+issue priority, project and project user tables are fetched once and kept
+for REDMINE_METADATA_TTL seconds (refresh() drops them), and concurrent misses
+of a table wait for a single fetch. At most REDMINE_CONCURRENCY requests are
+made toward Red Mine at once from a process. Notification appends to one ticket
+made while an append to that ticket is in flight are saved together; field
+updates are saved as given.
+'''
+
+import threading
+import time
+
+from redmine import Redmine
+
+
+class RedmineClient(object):
+
+    def __init__(self, app=None):
+        self.url = None
+        self.key = None
+        self.ttl = 3600
+        self.concurrency = 4
+        self._redmine = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._tables = {}
+        self._loading = {}
+        self._updates = {}
+        self._issue_locks = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''
+        Read the Red Mine settings from the application config.
+        '''
+        config = app.config
+        self.url = config.get('REDMINE_URL')
+        self.key = config.get('REDMINE_KEY')
+        self.ttl = int(config.get('REDMINE_METADATA_TTL', self.ttl))
+        self.concurrency = max(1, int(config.get('REDMINE_CONCURRENCY', self.concurrency)))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['redmine_client'] = self
+        with self._lock:
+            self._redmine = None
+        self.refresh()
+
+    @property
+    def redmine(self):
+        if self._redmine is None:
+            with self._lock:
+                if self._redmine is None:
+                    self._redmine = Redmine(self.url, key=self.key, requests={'verify': False})
+        return self._redmine
+
+    def call(self, fn, *args, **kwargs):
+        '''
+        Call fn (a Red Mine request) within the concurrency limit.
+        '''
+        with self._slots:
+            return fn(*args, **kwargs)
+
+    def _table(self, name, load):
+        entry = self._tables.get(name)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:
+            # another thread may have loaded it while this one waited
+            entry = self._tables.get(name)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                return entry[1]
+            value = self.call(load)
+            self._tables[name] = (time.time(), value)
+            return value
+
+    def refresh(self, name=None):
+        '''
+        Drop the cached table name (e.g. 'trackers', 'users:<project>'), or all of them.
+        '''
+        with self._lock:
+            if name is None:
+                self._tables = {}
+            else:
+                self._tables.pop(name, None)
+
+    def trackers(self):
+        ''' {tracker name: id} '''
+        return self._table('trackers', lambda: dict((tracker.name, tracker.id)
+                                                    for tracker in self.redmine.tracker.all()))
+
+    def tracker_id(self, name):
+        trackers = self.trackers()
+        if name not in trackers:
+            raise Exception('Red Mine tracker not found: %s' % name)
+        return trackers[name]
+
+    def priorities(self):
+        ''' {issue priority name: id} '''
+        return self._table('priorities', lambda: dict((priority.name, priority.id) for priority in
+                                                      self.redmine.enumeration.filter(resource='issue_priorities')))
+
+    def projects(self):
+        ''' {project identifier: name} '''
+        return self._table('projects', lambda: dict((project.identifier, project.name)
+                                                    for project in self.redmine.project.all()))
+
+    def users(self, project_id):
+        ''' {'users': [[name, id], ...]} for project_id '''
+        def load():
+            all_users = self.redmine.user.all(offset=1, limit=100, project_id=project_id)
+            return {'users': [[str(user), int(user['id'])] for user in all_users]}
+        return self._table('users:%s' % project_id, load)
+
+    def metadata(self):
+        return {'trackers': self.trackers(), 'priorities': self.priorities(), 'projects': self.projects()}
+
+    def create_issue(self, fields):
+        '''
+        Create an issue from fields; returns the issue id or None.
+        '''
+        def create():
+            issue = self.redmine.issue.new()
+            for key, value in fields.iteritems():
+                setattr(issue, key, value)
+            if issue.save():
+                return issue.id
+            return None
+        return self.call(create)
+
+    def get_issue(self, resource_id, **kwargs):
+        return self.call(self.redmine.issue.get, resource_id, **kwargs)
+
+    def _issue_lock(self, resource_id):
+        with self._lock:
+            return self._issue_locks.setdefault(resource_id, threading.Lock())
+
+    def update_issue(self, resource_id, fields):
+        '''
+        Set fields on issue resource_id as given (not merged with other updates); returns the issue id or None.
+        '''
+        def update():
+            issue = self.redmine.issue.get(resource_id)
+            for key, value in fields.iteritems():
+                setattr(issue, key, value)
+            if issue.save():
+                return issue.id
+            return None
+        with self._issue_lock(resource_id):
+            return self.call(update)
+
+    def append_issue(self, resource_id, append, assign=None):
+        '''
+        Append text to the description of issue resource_id and assign it to user id assign when it is
+        unassigned; returns the issue id or None.
+        Appends arriving while an append to the same issue is in flight are saved together, in order.
+        '''
+        with self._lock:
+            batch = self._updates.get(resource_id)
+            leader = batch is None
+            if leader:
+                batch = {'append': [], 'assign': None, 'done': threading.Event(), 'result': None}
+                self._updates[resource_id] = batch
+            batch['append'].append(append)
+            if assign is not None:
+                batch['assign'] = assign
+        if not leader:
+            batch['done'].wait()
+            return batch['result']
+
+        try:
+            with self._issue_lock(resource_id):
+                # close the batch; later appends start the next one
+                with self._lock:
+                    self._updates.pop(resource_id, None)
+
+                def update():
+                    issue = self.redmine.issue.get(resource_id)
+                    description = issue.description if hasattr(issue, 'description') else None
+                    issue.description = (description or '') + ''.join(batch['append'])
+                    if batch['assign'] is not None and not hasattr(issue, 'assigned_to'):
+                        issue.assigned_to_id = batch['assign']
+                    if issue.save():
+                        return issue.id
+                    return None
+                batch['result'] = self.call(update)
+        finally:
+            with self._lock:
+                if self._updates.get(resource_id) is batch:
+                    self._updates.pop(resource_id, None)
+            batch['done'].set()
+        return batch['result']
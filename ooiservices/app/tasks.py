@@ -1,9 +1,8 @@
 
 __author__ = 'M@Campbell'
 
-from ooiservices.app import create_celery_app
+from ooiservices.app import create_celery_app, uframe_client, blob_cache
 from flask.globals import current_app
-import requests
 from flask.ext.cache import Cache
 
 
@@ -24,10 +23,13 @@ Define the list of processes to run either on a heartbeat or simply waiting for
 
 from ooiservices.app.uframe.assetController import _compile_assets
 from ooiservices.app.uframe.assetController import _compile_events
+from ooiservices.app.uframe.events import store_events
 from ooiservices.app.uframe.controller import dfs_streams
+from ooiservices.app.uframe.stream_catalog import STREAM_LIST_KEY
 from ooiservices.app.uframe.controller import _compile_glider_tracks
 from ooiservices.app.uframe.controller import _compile_cam_images
 from ooiservices.app.uframe.controller import _compile_large_format_files
+from ooiservices.app.main.notification_queue import dispatch_notifications as _dispatch_notifications
 
 
 @celery.task(name='tasks.compile_assets')
@@ -38,12 +40,12 @@ def compile_assets():
         cache.init_app(current_app)
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s' % ('assets')
-        payload = requests.get(url)
+        payload = uframe_client.get(url)
         if payload.status_code is 200:
             data = payload.json()
             assets = _compile_assets(data)
             if "error" not in assets:
-                cache.set('asset_list', assets, timeout=CACHE_TIMEOUT)
+                blob_cache.set('asset_list', assets, timeout=CACHE_TIMEOUT)
                 print "[+] Asset cache reset"
             else:
                 print "[-] Error in cache update"
@@ -59,7 +61,8 @@ def compile_streams():
         streams = dfs_streams()
 
         if "error" not in streams:
-            cache.set('stream_list', streams, timeout=CACHE_TIMEOUT)
+            # web workers drop their in-process copy and reindex their stream catalog
+            blob_cache.set(STREAM_LIST_KEY, streams, timeout=CACHE_TIMEOUT)
             print "[+] Streams cache reset."
         else:
             print "[-] Error in cache update"
@@ -74,13 +77,13 @@ def compile_events():
 
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s' % ('events')
-        payload = requests.get(url)
+        payload = uframe_client.get(url)
         if payload.status_code is 200:
             data = payload.json()
             events = _compile_events(data)
 
             if "error" not in events:
-                cache.set('event_list', events, timeout=CACHE_TIMEOUT)
+                store_events(events, CACHE_TIMEOUT)
                 print "[+] Events cache reset."
             else:
                 print "[-] Error in cache update"
@@ -93,10 +96,10 @@ def compile_glider_tracks():
         cache = Cache(config={'CACHE_TYPE': 'redis', 'CACHE_REDIS_DB': 0})
         cache.init_app(current_app)
 
+        # compiling stores the gliders as 'glider_tracks'
         glider_tracks = _compile_glider_tracks(True)
 
         if "error" not in glider_tracks:
-            cache.set('glider_tracks', glider_tracks, timeout=CACHE_TIMEOUT)
             print "[+] Glider tracks cache reset."
         else:
             print "[-] Error in cache update"
@@ -109,7 +112,7 @@ def compile_cam_images():
         cache = Cache(config={'CACHE_TYPE': 'redis', 'CACHE_REDIS_DB': 0})
         cache.init_app(current_app)
 
-        cam_images = __compile_cam_images()
+        cam_images = _compile_cam_images(processes=True)
 
         if "error" not in cam_images:
             cache.set('cam_images', cam_images, timeout=CACHE_TIMEOUT)
@@ -118,7 +121,7 @@ def compile_cam_images():
             print "[-] Error in cache update"
 
 @celery.task(name='tasks.compile_large_format_files')
-def compile_cam_images():
+def compile_large_format_files():
     with current_app.test_request_context():
         print "[+] Starting large format file cache reset..."
         cache = Cache(config={'CACHE_TYPE': 'redis', 'CACHE_REDIS_DB': 0})
@@ -127,7 +130,15 @@ def compile_cam_images():
         data = _compile_large_format_files()
 
         if "error" not in data:
-            cache.set('large_format', data, timeout=CACHE_TIMEOUT)
+            blob_cache.set('large_format', data, timeout=CACHE_TIMEOUT)
             print "[+] large format files updated."
         else:
             print "[-] Error in large file format update"
+
+
+@celery.task(name='tasks.dispatch_notifications')
+def dispatch_notifications():
+    with current_app.test_request_context():
+        counts = _dispatch_notifications()
+        if counts is not None and any(counts.values()):
+            print "[+] Notifications sent: %(sent)d, retrying: %(retrying)d, dead: %(dead)d" % counts
@@ -6,19 +6,18 @@ uframe assets and events endpoint and class definition.
 '''
 __author__ = 'M@Campbell'
 
-from flask import jsonify, current_app, request
+from flask import jsonify, current_app, request, has_request_context
 from ooiservices.app.uframe import uframe as api
 from ooiservices.app.main.routes import\
     get_display_name_by_rd as get_dn_by_rd,\
     get_long_display_name_by_rd as get_ldn_by_rd
-import requests
 import re
 import math
-from netCDF4 import num2date
+from datetime import datetime
 from operator import itemgetter
-from ooiservices.app import cache
+from multiprocessing.pool import ThreadPool
+from ooiservices.app import cache, uframe_client
 
-requests.adapters.DEFAULT_RETRIES = 2
 CACHE_TIMEOUT = 86400
 
 
@@ -30,7 +29,73 @@ def _compile_events(data):
     return data
 
 
+def _event_ref_des(row):
+    '''
+    Reference designator of a compiled event, from the event itself or its
+    asset's 'Ref Des' metadata.
+    '''
+    if 'referenceDesignator' in row and row['referenceDesignator']['full']:
+        return (row['referenceDesignator']['subsite'] + '-' + row['referenceDesignator']['node'] +
+                '-' + row['referenceDesignator']['sensor'])
+    ref_des = ""
+    if row['asset']['metaData']:
+        for metaData in row['asset']['metaData']:
+            if metaData['key'] == 'Ref Des':
+                ref_des = metaData['value']
+    return ref_des
+
+
+def _format_event_date(millis):
+    return datetime.utcfromtimestamp(float(millis)/1000).strftime("%B %d %Y, %I:%M:%S %p")
+
+
+def _format_event(row, ref_des):
+    '''
+    The event as returned by /events?ref_des= and drawn on plots.
+    '''
+    temp_dict = {}
+    temp_dict['ref_des'] = ref_des
+    temp_dict['id'] = row['id']
+    temp_dict['eventClass'] = row['eventClass']
+    if row['eventClass'] == '.DeploymentEvent':
+        temp_dict['cruise_number'] = row['cruiseNumber']
+        temp_dict['cruise_plan_doc'] = row['cruisePlanDocument']
+        temp_dict['depth'] = row['depth']
+        temp_dict['lat_lon'] = row['locationLonLat']
+        temp_dict['deployment_number'] = row['deploymentNumber']
+    temp_dict['tense'] = row['tense']
+    temp_dict['start_date'] = _format_event_date(row['startDate'])
+    if row['endDate'] is not None:
+        temp_dict['end_date'] = _format_event_date(row['endDate'])
+    temp_dict['event_description'] = row['eventDescription']
+    temp_dict['event_type'] = row['eventType']
+    temp_dict['notes'] = row['notes']
+    return temp_dict
+
+
+def _index_events(data):
+    '''
+    Index the compiled event list by reference designator:
+
+        events       ref_des -> formatted events, in event list order
+        deployments  ref_des -> the current (PRESENT) deployment event
+    '''
+    events = {}
+    deployments = {}
+    for row in data:
+        try:
+            ref_des = _event_ref_des(row)
+            event = _format_event(row, ref_des)
+        except (KeyError, TypeError, ValueError):
+            continue
+        events.setdefault(ref_des, []).append(event)
+        if event['eventClass'] == '.DeploymentEvent' and event['tense'] == 'PRESENT':
+            deployments[ref_des] = event
+    return {'events': events, 'deployments': deployments}
+
+
 def _compile_assets(data):
+    asset_events = _associate_asset_events(data)
     for row in data:
         latest_deployment = None
         lat = ""
@@ -42,7 +107,7 @@ def _compile_assets(data):
             if 'assetId' in row:
                 row['id'] = row.pop('assetId')
             row['asset_class'] = row.pop('@class')
-            row['events'] = associate_events(row['id'])
+            row['events'] = asset_events.get(row['id'], [])
             if len(row['events']) == 0:
                 row['events'] = []
             row['tense'] = None
@@ -128,7 +193,7 @@ def _uframe_collection(uframe_url):
     the heavy lifting of contacting uframe and either
     getting the json back, or returning a 500 error.
     '''
-    data = requests.get(uframe_url)
+    data = uframe_client.get(uframe_url)
 
     if (data.status_code == 200):
         return data
@@ -294,101 +359,182 @@ def associate_events(id):
     '''
     uframe_url = current_app.config['UFRAME_ASSETS_URL'] + \
         '/assets/%s/events' % (id)
-    result = []
-    payload = requests.get(uframe_url)
+    return _fetch_asset_events(uframe_url, _event_sort_key())
+
+
+def _fetch_asset_events(uframe_url, sort_by):
+    '''
+    GET the events of a single asset and summarize them.  Safe to call
+    from a worker thread; no request context is needed.
+    '''
+    payload = uframe_client.get(uframe_url)
     if payload.status_code != 200:
         return [{"error": "server responded with error code: %s" %
                 payload.status_code}]
 
-    json_data = payload.json()
-    for row in json_data:
-        try:
+    result = [_event_summary(row) for row in payload.json()]
+    return _sort_events(result, sort_by)
 
-            d = {}
-            # set up some static keys
-            d['locationLonLat'] = []
-
-            d['eventId'] = row['eventId']
-            d['eventClass'] = row['@class']
-            d['notes'] = len(row['notes'])
-            d['startDate'] = row['startDate']
-            d['endDate'] = row['endDate']
-            d['tense'] = row['tense']
-            if d['eventClass'] == '.CalibrationEvent':
-                d['calibrationCoefficient'] = row['calibrationCoefficient']
-                lon = 0.0
-                lat = 0.0
-                for cal_coef in d['calibrationCoefficient']:
-                    if cal_coef['name'] == 'CC_lon':
-                        lon = cal_coef['values']
-                    if cal_coef['name'] == 'CC_lat':
-                        lat = cal_coef['values']
-                if lon is not None and lat is not None:
-                    d['locationLonLat'] = convert_lat_lon(lat, lon)
-            if d['evetClass'] == '.DeploymentEvent':
-                d['deploymentDepth'] = row['deploymentDepth']
-                if row['locationLonLat']:
-                    d['locationLonLat'] = convert_lat_lon(
-                        row['locationLonLat'][1],
-                        row['locationLonLat'][0])
-                d['deploymentNumber'] = row['deploymentNumber']
-        except KeyError:
-            pass
-        result.append(d)
 
+def _event_summary(row):
+    '''
+    Reduce a uframe event to the summary stored on an asset.
+    '''
+    d = {}
     try:
-        if request.args.get('sort') and request.args.get('sort') != "":
-            sort_by = request.args.get('sort')
-        else:
-            sort_by = 'eventId'
-        result = sorted(result, key=itemgetter(sort_by))
-    except (TypeError, KeyError) as e:
-        raise
+        # set up some static keys
+        d['locationLonLat'] = []
+
+        d['eventId'] = row['eventId']
+        d['eventClass'] = row['@class']
+        d['notes'] = len(row['notes'])
+        d['startDate'] = row['startDate']
+        d['endDate'] = row['endDate']
+        d['tense'] = row['tense']
+        if d['eventClass'] == '.CalibrationEvent':
+            d['calibrationCoefficient'] = row['calibrationCoefficient']
+            lon = 0.0
+            lat = 0.0
+            for cal_coef in d['calibrationCoefficient']:
+                if cal_coef['name'] == 'CC_lon':
+                    lon = cal_coef['values']
+                if cal_coef['name'] == 'CC_lat':
+                    lat = cal_coef['values']
+            if lon is not None and lat is not None:
+                d['locationLonLat'] = convert_lat_lon(lat, lon)
+        if d['eventClass'] == '.DeploymentEvent':
+            d['deploymentDepth'] = row['deploymentDepth']
+            if row['locationLonLat']:
+                d['locationLonLat'] = convert_lat_lon(
+                    row['locationLonLat'][1],
+                    row['locationLonLat'][0])
+            d['deploymentNumber'] = row['deploymentNumber']
+    except KeyError:
+        pass
+    return d
+
+
+def _event_sort_key():
+    '''
+    Events on an asset are sorted by the 'sort' request argument, or eventId.
+    '''
+    if has_request_context() and request.args.get('sort') and request.args.get('sort') != "":
+        return request.args.get('sort')
+    return 'eventId'
+
 
+def _sort_events(result, sort_by):
+    '''
+    Sort event summaries; a sort key the events do not carry (the asset
+    listing passes its own 'sort' argument through) leaves them unsorted.
+    '''
+    try:
+        result = sorted(result, key=itemgetter(sort_by))
+    except (TypeError, KeyError):
+        pass
     return result
 
 
-def get_events_by_ref_des(data, ref_des):
-    # Create the container for the processed response
-    result = []
-    # Get all the events to begin searching though...
+def _associate_asset_events(data):
+    '''
+    Build {asset id: [event summaries]} for a list of raw or compiled assets.
+
+    Large lists are joined against a single GET of the /events collection,
+    keyed on the asset id embedded in each event.  Assets are fetched one at
+    a time, through a bounded thread pool, only when the bulk fetch failed
+    (or the list is small).
+    '''
+    ids = []
     for row in data:
-        # variables used in loop
-        temp_dict = {}
-        ref_des_check = ""
         try:
+            ids.append(row['assetId'] if 'assetId' in row else row['id'])
+        except (KeyError, TypeError):
+            continue
 
-            if 'referenceDesignator' in row and row['referenceDesignator']['full']:
-                ref_des_check = (row['referenceDesignator']['subsite'] + '-' + row['referenceDesignator']['node'] +
-                                 '-' + row['referenceDesignator']['sensor'])
-            else:
-                if row['asset']['metaData']:
-                    for metaData in row['asset']['metaData']:
-                        if metaData['key'] == 'Ref Des':
-                            ref_des_check = metaData['value']
-            if ref_des_check == ref_des:
-                temp_dict['ref_des'] = ref_des_check
-                temp_dict['id'] = row['id']
-                temp_dict['eventClass'] = row['eventClass']
-                if row['eventClass'] == '.DeploymentEvent':
-                    temp_dict['cruise_number'] = row['cruiseNumber']
-                    temp_dict['cruise_plan_doc'] = row['cruisePlanDocument']
-                    temp_dict['depth'] = row['depth']
-                    temp_dict['lat_lon'] = row['locationLonLat']
-                    temp_dict['deployment_number'] = row['deploymentNumber']
-                temp_dict['tense'] = row['tense']
-                start_date = num2date(float(row['startDate'])/1000, units='seconds since 1970-01-01 00:00:00', calendar='gregorian')
-                temp_dict['start_date'] = start_date.strftime("%B %d %Y, %I:%M:%S %p")
-                if row['endDate'] is not None:
-                    end_date = num2date(float(row['endDate'])/1000, units='seconds since 1970-01-01 00:00:00', calendar='gregorian')
-                    temp_dict['end_date'] = end_date.strftime("%B %d %Y, %I:%M:%S %p")
-                temp_dict['event_description'] = row['eventDescription']
-                temp_dict['event_type'] = row['eventType']
-                temp_dict['notes'] = row['notes']
-                result.append(temp_dict)
-                temp_dict = {}
+    sort_by = _event_sort_key()
+    result = {}
+    complete = False
+    if len(ids) > current_app.config.get('UFRAME_ASSET_EVENT_BULK_THRESHOLD', 10):
+        result, complete = _bulk_asset_events(sort_by)
+
+    missing = [id for id in ids if id not in result]
+    if missing and not complete:
+        result.update(_fetch_asset_events_concurrently(missing, sort_by))
+    return result
+
+
+def _bulk_asset_events(sort_by):
+    '''
+    One GET of the full /events collection, grouped by asset id.  Returns
+    (events by asset id, complete) where complete is False if the fetch
+    failed.  Events without an asset id belong to no asset; they are counted
+    in the log and ignored.
+    '''
+    uframe_url = current_app.config['UFRAME_ASSETS_URL'] + '/events'
+    try:
+        payload = uframe_client.get(uframe_url)
+        if payload.status_code != 200:
+            current_app.logger.info('Bulk event fetch returned %s; falling back per asset.'
+                                    % payload.status_code)
+            return {}, False
+        events = payload.json()
+    except Exception as err:
+        current_app.logger.info('Bulk event fetch failed (%s); falling back per asset.' % err.message)
+        return {}, False
+
+    if not isinstance(events, list):
+        current_app.logger.info('Bulk event fetch returned no event list; falling back per asset.')
+        return {}, False
+
+    grouped = {}
+    unattributed = 0
+    for row in events:
+        try:
+            asset_id = row['asset']['assetId']
         except (KeyError, TypeError):
-            raise
+            unattributed += 1
+            continue
+        grouped.setdefault(asset_id, []).append(_event_summary(row))
+    if unattributed:
+        current_app.logger.info('Bulk event fetch: ignored %d events without an asset id.' % unattributed)
+
+    for asset_id in grouped:
+        grouped[asset_id] = _sort_events(grouped[asset_id], sort_by)
+    return grouped, True
+
+
+def _fetch_asset_events_concurrently(ids, sort_by):
+    '''
+    Per asset event fetch for the ids the bulk join missed, limited to
+    UFRAME_ASSET_EVENT_WORKERS requests in flight.
+    '''
+    app = current_app._get_current_object()
+    base_url = app.config['UFRAME_ASSETS_URL'] + '/assets/%s/events'
+
+    def fetch(id):
+        with app.app_context():
+            try:
+                return id, _fetch_asset_events(base_url % id, sort_by)
+            except Exception as err:
+                return id, [{"error": "%s" % err}]
+
+    workers = min(len(ids), app.config.get('UFRAME_ASSET_EVENT_WORKERS', 8))
+    if workers <= 1:
+        return dict(fetch(id) for id in ids)
+    pool = ThreadPool(workers)
+    try:
+        return dict(pool.map(fetch, ids))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def get_events_by_ref_des(data, ref_des):
+    '''
+    Formatted events for one reference designator, from the compiled event
+    list.  Prefer _index_events (cached as 'event_index') over scanning.
+    '''
+    result = [_format_event(row, ref_des) for row in data if _event_ref_des(row) == ref_des]
     result = jsonify({ 'events' : result })
     return result
 
@@ -2,7 +2,7 @@ from flask import request, jsonify, make_response, current_app
 from ooiservices.app.uframe import uframe as api
 from ooiservices.app.uframe.assetController import _compile_assets
 from ooiservices.app.uframe.assetController import _uframe_headers
-from ooiservices.app import cache
+from ooiservices.app import blob_cache, uframe_client
 from operator import itemgetter
 from copy import deepcopy
 
@@ -10,8 +10,10 @@ import json
 import requests
 import sys
 
-requests.adapters.DEFAULT_RETRIES = 2
 CACHE_TIMEOUT = 172800
+# asset fields left out of ?min=True responses
+MIN_EXCLUDE = ('metaData', 'events', 'manufactureInfo', 'notes', 'physicalInfo',
+               'attachments', 'purchaseAndDeliveryInfo', 'lastModifiedTimestamp')
 
 
 @api.route('/assets', methods=['GET'])
@@ -21,7 +23,7 @@ def get_assets(use_min=False, normal_data=False, reset=False):
     add in helped params to bypass the json response and minification
     '''
     try:
-        cached = cache.get('asset_list')
+        cached = blob_cache.get('asset_list')
 
         if cached and reset is not True:
             data = cached
@@ -30,7 +32,7 @@ def get_assets(use_min=False, normal_data=False, reset=False):
             url = current_app.config['UFRAME_ASSETS_URL']\
                 + '/%s' % ('assets')
 
-            payload = requests.get(url)
+            payload = uframe_client.get(url)
 
             if payload.status_code != 200:
                 try:
@@ -50,7 +52,7 @@ def get_assets(use_min=False, normal_data=False, reset=False):
             data = _compile_assets(data)
 
             if "error" not in data:
-                cache.set('asset_list', data, timeout=CACHE_TIMEOUT)
+                blob_cache.set('asset_list', data, timeout=CACHE_TIMEOUT)
 
     except requests.exceptions.ConnectionError as e:
         error = "Error: Cannot connect to uframe.  %s" % e
@@ -71,37 +73,18 @@ def get_assets(use_min=False, normal_data=False, reset=False):
 
     if request.args.get('min') == 'True' or use_min is True:
         showDeployments = False
-        deploymentEvents = []
         if request.args.get('deployments') == 'True':
             showDeployments = True
+        # the cached assets are shared (blob_cache L1); build trimmed copies
+        min_data = []
         for obj in data:
-            try:
-                if 'metaData' in obj:
-                    del obj['metaData']
-                if 'events' in obj:
-                    if showDeployments and obj['events'] is not None:
-                        for event in obj['events']:
-                            if event['eventClass'] == '.DeploymentEvent':
-                                deploymentEvents.append(event)
-                        del obj['events']
-                        obj['events'] = deploymentEvents
-                        deploymentEvents = []
-                    else:
-                        del obj['events']
-                if 'manufactureInfo' in obj:
-                    del obj['manufactureInfo']
-                if 'notes' in obj:
-                    del obj['notes']
-                if 'physicalInfo' in obj:
-                    del obj['physicalInfo']
-                if 'attachments' in obj:
-                    del obj['attachments']
-                if 'purchaseAndDeliveryInfo' in obj:
-                    del obj['purchaseAndDeliveryInfo']
-                if 'lastModifiedTimestamp' in obj:
-                    del obj['lastModifiedTimestamp']
-            except Exception:
-                raise
+            min_obj = dict((key, value) for key, value in obj.iteritems()
+                           if key not in MIN_EXCLUDE)
+            if showDeployments and obj.get('events') is not None:
+                min_obj['events'] = [event for event in obj['events']
+                                     if event['eventClass'] == '.DeploymentEvent']
+            min_data.append(min_obj)
+        data = min_data
 
     if request.args.get('concepts') and request.args.get('concepts') != "":
         return_list = []
@@ -205,7 +188,7 @@ def get_asset(id):
     try:
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('assets', id)
-        payload = requests.get(url)
+        payload = uframe_client.get(url)
 
         data = payload.json()
         data_list = []
@@ -224,7 +207,7 @@ def get_asset_events(id):
     try:
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s/%s' % ('assets', id, 'events')
-        response = requests.get(url,
+        response = uframe_client.get(url,
                                 headers=_uframe_headers())
         data = response.json()
         for each in data:
@@ -255,7 +238,7 @@ def create_asset():
         if 'asset_class' in data:
             data['@class'] = data.pop('asset_class')
 
-        response = requests.post(url,
+        response = uframe_client.post(url,
                                  data=json.dumps(data),
                                  headers=_uframe_headers())
 
@@ -267,11 +250,11 @@ def create_asset():
             data_list.append(data)
             data = _compile_assets(data_list)
 
-            asset_cache = cache.get('asset_list')
+            asset_cache = blob_cache.get('asset_list', fresh=True)
             if asset_cache:
-                cache.delete('asset_list')
+                blob_cache.delete('asset_list')
                 asset_cache.append(data[0])
-                cache.set('asset_list', asset_cache, timeout=CACHE_TIMEOUT)
+                blob_cache.set('asset_list', asset_cache, timeout=CACHE_TIMEOUT)
 
         return response.text, response.status_code
 
@@ -291,23 +274,23 @@ def update_asset(id):
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('assets', id)
 
-        response = requests.put(url,
+        response = uframe_client.put(url,
                                 data=json.dumps(data),
                                 headers=_uframe_headers())
 
         if response.status_code == 200:
-            asset_cache = cache.get('asset_list')
+            asset_cache = blob_cache.get('asset_list', fresh=True)
             data_list = []
             data_list.append(data)
             data = _compile_assets(data_list)
             if asset_cache:
-                cache.delete('asset_list')
+                blob_cache.delete('asset_list')
                 for row in asset_cache:
                     if row['id'] == id:
                         row.update(data[0])
 
             if "error" not in asset_cache:
-                cache.set('asset_list', asset_cache, timeout=CACHE_TIMEOUT)
+                blob_cache.set('asset_list', asset_cache, timeout=CACHE_TIMEOUT)
         return response.text, response.status_code
 
     except requests.exceptions.ConnectionError as e:
@@ -325,17 +308,17 @@ def delete_asset(id):
     try:
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('assets', id)
-        response = requests.delete(url,
+        response = uframe_client.delete(url,
                                    headers=_uframe_headers())
 
-        asset_cache = cache.get('asset_list')
+        asset_cache = blob_cache.get('asset_list', fresh=True)
         if asset_cache:
-            cache.delete('asset_list')
+            blob_cache.delete('asset_list')
             for row in asset_cache:
                 if row['id'] == id:
                     thisAsset = row
             asset_cache.remove(thisAsset)
-            cache.set('asset_list', asset_cache, timeout=CACHE_TIMEOUT)
+            blob_cache.set('asset_list', asset_cache, timeout=CACHE_TIMEOUT)
 
         return response.text, response.status_code
 
@@ -3,8 +3,8 @@
 uframe endpoints
 '''
 # base
-from flask import jsonify, request, current_app, make_response, Response, send_file
-from ooiservices.app import cache, db
+from flask import jsonify, request, current_app, make_response, Response, send_file, url_for
+from ooiservices.app import cache, blob_cache, db, uframe_client, plot_cache
 from ooiservices.app.uframe import uframe as api
 from ooiservices.app.models import PlatformDeployment, DisabledStreams
 from ooiservices.app.main.routes import get_display_name_by_rd, get_long_display_name_by_rd,\
@@ -14,35 +14,33 @@ from ooiservices.app.main.authentication import auth
 from ooiservices.app.main.errors import internal_server_error
 # data imports
 from ooiservices.app.uframe.data import get_data, get_simple_data,\
-    find_parameter_ids, get_multistream_data
-from ooiservices.app.uframe.plotting import generate_plot
-from ooiservices.app.uframe.assetController import get_events_by_ref_des
-from ooiservices.app.uframe.events import get_events
+    find_parameter_ids, get_multistream_data, plot_point_target
+from ooiservices.app.uframe.plot_pool import plot_pool, PlotQueueFull, PlotTimeout
+from ooiservices.app.uframe.events import get_event_index
+from ooiservices.app.uframe.stream_decoder import ParticleStreamDecoder
+from ooiservices.app.uframe.dataset import ParticleDataset
+from ooiservices.app.uframe.profiles import segment_profiles, split_profiles
+from ooiservices.app.uframe.stream_catalog import stream_catalog
+from ooiservices.app.uframe.hyrax_crawler import HyraxCrawler
+from ooiservices.app.uframe.thumbnails import ThumbnailPipeline
+from ooiservices.app.uframe.glider_tracks import GliderTrackService, select_tracks, zoom_tolerance
 
 from urllib import urlencode
 from datetime import datetime
 from dateutil.parser import parse as parse_date
 import requests
 import json
-import numpy as np
 import pytz
 from contextlib import closing
 import time
 import urllib2
-from copy import deepcopy
 from operator import itemgetter
-from bs4 import BeautifulSoup
 import urllib
 import os.path
-#for image processing
-import PIL
-from PIL import Image
-from StringIO import StringIO
 
 __author__ = 'Andy Bird'
 
 
-requests.adapters.DEFAULT_RETRIES = 2
 CACHE_TIMEOUT = 172800
 COSMO_CONSTANT = 2208988800
 
@@ -55,7 +53,7 @@ def dfs_streams():
     streams = []
 
     try:
-        payload = requests.get(TOC)
+        payload = uframe_client.get(TOC)
     except requests.exceptions.ConnectionError as e:
         error = "Error: Cannot connect to uframe.  %s" % e
         return make_response(error, 500)
@@ -72,14 +70,8 @@ def dfs_streams():
 
     retval = []
 
-    # try to use the event list cache first, if not loaded...load the event cache.
-    cached = cache.get('event_list')
-    event_list = []
-    if cached:
-        event_list = cached
-    else:
-        get_events()
-        event_list = cache.get('event_list')
+    # current deployment of each reference designator, from the compiled event index
+    deployments = get_event_index()['deployments']
 
     for stream in streams:
         try:
@@ -94,15 +86,12 @@ def dfs_streams():
         retval.append(data_dict)
 
     for stream in retval:
-        response = get_events_by_ref_des(event_list, stream['reference_designator'])
-        events = json.loads(response.data)
-
-        for event in events['events']:
-            if event['eventClass'] == '.DeploymentEvent' and event['tense'] == 'PRESENT':
-                stream['depth'] = event['depth']
-                stream['lat_lon'] = event['lat_lon']
-                stream['cruise_number'] = event['cruise_number']
-                stream['deployment_number'] = event['deployment_number']
+        event = deployments.get(stream['reference_designator'])
+        if event is not None:
+            stream['depth'] = event['depth']
+            stream['lat_lon'] = event['lat_lon']
+            stream['cruise_number'] = event['cruise_number']
+            stream['deployment_number'] = event['deployment_number']
 
     return retval
 
@@ -244,50 +233,24 @@ def _create_image_entry(url):
            }
     return item
 
-def _get_folder_list(url,search_filter):
+def _compile_cam_images(revalidate=False, processes=False):
     '''
-    get url folder link list
+    Crawl the HYRAX store for the camera images available (url>ref>year>month>day>image)
+    and make their thumbnails; revalidate rechecks the images already thumbnailed.
+    Thumbnails are resized in threads unless processes is set (celery task; a web
+    request must not fork).
     '''
-    r = requests.get(url)
-    soup = BeautifulSoup(r.content, "html.parser")
-    ss = soup.findAll('a')
-    url_list = []
-    for s in ss:
-        if 'href' in s.attrs:
-            if search_filter in s.attrs['href']:
-                url_list.append(url.split('contents.html')[0]+s.attrs['href'])
-    return url_list
+    crawler = HyraxCrawler.from_config(current_app, uframe_client)
+    files = crawler.crawl(current_app.config['IMAGE_CAMERA_STORE'],
+                          lambda href: '-CAMDS' in href, ['.png'])
+    crawler.save()
 
-def _compile_cam_images():
-    '''
-    Loop over a directory list to get the images available (url>ref>year>month>day>image)
-    '''
-    url = current_app.config['IMAGE_CAMERA_STORE']
-    r = requests.get(url)
-
-    soup = BeautifulSoup(r.content, "html.parser")
-    ss = soup.findAll('a')
     data_image_list = []
-
-    for s in ss:
-        if 'href' in s.attrs:
-            if '-CAMDS' in s.attrs['href']:
-                #print s.attrs['href']
-                d_url = url+s.attrs['href']
-                url_list = _get_folder_list(d_url,'contents.html')
-                #year
-                for d_url in url_list:
-                    url_list1 = _get_folder_list(d_url,'contents.html')
-                    #month
-                    for d_url1 in url_list1:
-                        #day
-                        url_list2 = _get_folder_list(d_url1,'contents.html')
-                        for d_url2 in url_list2:
-                            #image
-                            url_list3 = _get_folder_list(d_url2,'.png')
-                            #print "\t",len(url_list3)," images..."
-                            for im_url in url_list3:
-                                data_image_list.append(im_url)
+    for ref_des in sorted(files):
+        for year in sorted(files[ref_des]):
+            for month in sorted(files[ref_des][year]):
+                for day in sorted(files[ref_des][year][month]):
+                    data_image_list.extend(files[ref_des][year][month][day]['.png'])
 
     current_app.logger.debug("Found" + str(len(data_image_list)) + " images")
 
@@ -295,24 +258,11 @@ def _compile_cam_images():
     for data_image_url in data_image_list:
         image_dict.append(_create_image_entry(data_image_url))
 
-    completed= []
-    #ADD THE IMAGES to the folder CACHE
-    for image_item in image_dict:
-        try:
-            new_filename = image_item['filename'].split('.')[0]+"_thumbnail.png"
-            new_filepath = current_app.config['IMAGE_STORE']+"/"+new_filename
-            #check its not already added and doesnt already exist, if so download it.
-            if image_item['url'] not in completed and not os.path.isfile(new_filepath) :
-                response = requests.get(image_item['url'])
-                img = Image.open(StringIO(response.content))
-                thumb = img.copy()
-                maxsize = (200, 200)
-                thumb.thumbnail(maxsize, PIL.Image.ANTIALIAS)
-                thumb.save(new_filepath)
-                completed.append(image_item['url'])
-        except Exception,e:
-            print "Error:",str(e)
-            continue
+    # make the missing thumbnails (downloads and resizing run in parallel)
+    pipeline = ThumbnailPipeline.from_config(current_app, uframe_client, processes=processes)
+    counts = pipeline.run(image_dict, revalidate=revalidate)
+    pipeline.save()
+    current_app.logger.debug("Thumbnails: " + str(counts))
 
     #return dict
     return image_dict
@@ -323,12 +273,18 @@ def get_uframe_cam_image(image_id):
     try:
         filename = os.getcwd()+"/"+current_app.config['IMAGE_STORE']+"/"+image_id+'_thumbnail.png'
         filename = filename.replace(',','%2C')
-        print filename
+        cache_timeout = current_app.config.get('THUMBNAIL_MAX_AGE', 86400)
         if not os.path.isfile(filename):
             filename = current_app.config['IMAGE_STORE']+'/imageNotFound404.png'
+            # the thumbnail may be made soon, do not let clients hold the placeholder
+            cache_timeout = 60
+        # streamed from disk, with ETag / Last-Modified so browsers revalidate with a 304
         return send_file(filename,
                          attachment_filename='cam_image.png',
-                         mimetype='image/png')
+                         mimetype='image/png',
+                         conditional=True,
+                         add_etags=True,
+                         cache_timeout=cache_timeout)
     except Exception, e:
         return jsonify(error="image not found"), 404
 
@@ -350,7 +306,7 @@ def get_uframe_cam_images():
         if cached and not(will_reset_cache):
             data = cached
         else:
-            data = _compile_cam_images()
+            data = _compile_cam_images(revalidate=will_reset_cache)
 
             if "error" not in data:
                 cache.set('cam_images', data, timeout=CACHE_TIMEOUT)
@@ -407,94 +363,40 @@ def _create_entry(url, ext):
 
 def _compile_large_format_files(test_ref_des=None, test_date_str=None):
     '''
-    Loop over a directory list to get the files available (url>ref>year>month>day>image)
+    Crawl the HYRAX store for the files available (url>ref>year>month>day>file);
+    see hyrax_crawler.py for the concurrent, checkpointed walk.
 
     Optional arguments are for testing ONLY:
         ref_des: Pass in a reference designator to only retrieve those results
         date_str: Pass in a date string (yyyy-mm-dd) to only get data from a specific day
     '''
-    testing = False
+    path_filter = None
     if test_ref_des is not None and test_date_str is not None:
-        testing = True
-        # Get the date we're looking for
-        date = test_date_str.split('-')
-        test_year = date[0]
-        test_month = date[1]
-        test_day = date[2]
-
-    url = current_app.config['IMAGE_CAMERA_STORE']
-    r = requests.get(url)
-
-    soup = BeautifulSoup(r.content, "html.parser")
-    ss = soup.findAll('a')
+        # Only walk the reference designator and date we're looking for
+        test_path = [test_ref_des] + test_date_str.split('-')[:3]
+        path_filter = lambda path: path == test_path[:len(path)]
 
     filetypes_to_check = ['-HYD', '-OBS', '-CAMDS', '-CAMHD', '-ZPL']
     extensions_to_check = ['.mseed', '.png', '.mp4', '.mov', '.raw']
 
-    # Go fetch whatever data has already been cached
-    data_dict = {} if cache.get('large_format') is None else cache.get('large_format')
-
-    # Get the current date to use to check against the data on HYRAX server
-    current_year = datetime.utcnow().strftime('%Y')
-    current_month = datetime.utcnow().strftime('%m')
-    current_day = datetime.utcnow().strftime('%d')
-
-    # Ok let's walk the HYRAX server directory structure {ref-des > year > month > day}
-    for s in ss:
-        if 'href' in s.attrs:
-            # REF DES
-            if any(filetype in s.attrs['href'] for filetype in filetypes_to_check):
-                ref_des = s.attrs['href'].split('/')[0]
-                if (testing and test_ref_des != ref_des):
-                    continue
-                current_app.logger.debug(ref_des)
-                if ref_des not in data_dict:
-                    data_dict[ref_des] = {}
-                ref_url = url+s.attrs['href']
-                url_list = _get_folder_list(ref_url, 'contents.html')
-
-                # YEAR
-                for year_url in url_list:
-                    year = year_url.split('/contents.html')[0].split('/')[-1]
-                    if (testing and test_year != year):
-                        continue
-                    if year not in data_dict[ref_des]:
-                        data_dict[ref_des][year] = {}
-                    elif year != current_year:  # Move onto next year, this one's old!
-                        continue
-                    url_list1 = _get_folder_list(year_url, 'contents.html')
-
-                    # MONTH
-                    for month_url in url_list1:
-                        month = month_url.split('/contents.html')[0].split('/')[-1]
-                        if (testing and test_month != month):
-                            continue
-                        if month not in data_dict[ref_des][year]:
-                            data_dict[ref_des][year][month] = {}
-                        elif month != current_month:  # Move onto next month, this one's old!
-                            continue
-                        url_list2 = _get_folder_list(month_url, 'contents.html')
-
-                        # DAY
-                        for day_url in url_list2:
-                            day = day_url.split('/contents.html')[0].split('/')[-1]
-                            if (testing and test_day != day):
-                                continue
-                            if day not in data_dict[ref_des][year][month]:
-                                data_dict[ref_des][year][month][day] = []
-                            elif day != current_day:  # Move onto next day, this one's old!
-                                continue
-
-                            for ext in extensions_to_check:
-                                # file
-                                url_list3 = _get_folder_list(day_url, ext)
-                                for im_url in url_list3:
-                                    entry = _create_entry(im_url, ext)
-                                    data_dict[ref_des][year][month][day].append(entry)
-
-                # Update the cache in case the connection gets reset you don't want to lose anything
-                cache.set('large_format', data_dict, timeout=CACHE_TIMEOUT)
+    crawler = HyraxCrawler.from_config(current_app, uframe_client)
+    files = crawler.crawl(current_app.config['IMAGE_CAMERA_STORE'],
+                          lambda href: any(filetype in href for filetype in filetypes_to_check),
+                          extensions_to_check, path_filter)
+    crawler.save()
+    current_app.logger.debug('large format crawl: %s' % crawler.counts)
 
+    data_dict = {}
+    for ref_des, years in files.iteritems():
+        data_dict[ref_des] = {}
+        for year, months in years.iteritems():
+            data_dict[ref_des][year] = {}
+            for month, days in months.iteritems():
+                data_dict[ref_des][year][month] = {}
+                for day, by_ext in days.iteritems():
+                    data_dict[ref_des][year][month][day] = [_create_entry(file_url, ext)
+                                                            for ext in extensions_to_check
+                                                            for file_url in by_ext[ext]]
     return data_dict
 
 
@@ -504,7 +406,7 @@ def get_uframe_large_format_files_by_ref(ref_des, date_str):
     Walk the Hyrax server and parse out all available large format files
     '''
     try:
-        cached = cache.get('large_format')
+        cached = blob_cache.get('large_format')
 
         if cached:
             data = cached
@@ -538,585 +440,78 @@ def get_uframe_large_format_files():
     Get all available large format files
     '''
     try:
-        cached = cache.get('large_format')
+        cached = blob_cache.get('large_format')
         if cached:
             data = cached
         else:
             data = _compile_large_format_files()
             if "error" not in data:
-                cache.set('large_format', data, timeout=CACHE_TIMEOUT)
+                blob_cache.set('large_format', data, timeout=CACHE_TIMEOUT)
 
         return jsonify(data)
     except requests.exceptions.ConnectionError as e:
         error = "Error: Cannot connect to uframe.  %s" % e
         return make_response(error, 500)
 
-def _check_for_gps_position_stream(glider_url,glider_stream,glider_method):
-    '''
-        used to chck if a desired stream is available
-    '''
-    url = glider_url+"/metadata"
-    req_gps_info_list = requests.get(url)
-    metadata = req_gps_info_list.json()
-    time_list = metadata['times']
-    param_list = metadata['parameters']
-
-    selected_method = None
-    selected_stream = None
-    selected_times = None
-    selected_depth = None
-
-    for t in time_list:
-        #use the selected one when found
-        if glider_method == t['method'] and glider_stream == t['stream']:
-            selected_method = t['method']
-            selected_stream = t['stream']
-            selected_times = {'begin_time':t['beginTime'],"end_time":t['endTime'],"last_updated":None,"last_requested":None}
-            break
-
-    #WE ALWAYS NEED M_DEPTH - as its an ENG instrument
-    for p in param_list:
-        if p['stream'] == selected_stream:
-            #identify depth
-            if p['particleKey'] == "m_depth":
-                selected_depth = p
-            #available_depth_list = ['sci_water_pressure','m_pressure','m_depth','int_ctd_pressure']
-            #if p['particleKey'] in available_depth_list:
-            #    selected_depth = p
-            #    break
-
-    return selected_method,selected_stream,selected_times,selected_depth
-
-def _select_glider_method(available_glider_methods):
-    if "recovered_host" in available_glider_methods:
-        return "recovered_host",True
-    elif "telemetered" in available_glider_methods:
-        return "telemetered",False
-    return None,None
-
-def _get_glider_track_data(glider_outline,glider_cache=None):
-    '''
-        get the glider track information from uframe
-
-        glider_outline: is the currently obtained gliders from uframe
-        glider_cache  : are the cached gliders we already have in the store!
-    '''
-    gliders_to_update = []
-    glider_skips = []
-    data_limit  = 1000
-
-    if glider_cache is not None:
-        #gets the gliders to skip and update. Updated gliders will use the last updated time to update the track from
-        glider_skips, gliders_to_update = _get_existing_glider_ids_to_skip(glider_cache)
-
-    t0 = time.time()
-    for glider_track in glider_outline:
-
-        if glider_track['depth'] is not None:
-            data_request_str = "?limit="+ str(data_limit) + '&parameters='+glider_track['depth']['pdId']
-        else:
-            data_request_str = "?limit="+ str(data_limit)
-
-        if glider_track['location'] in glider_skips:
-            #get the historic data, and add it to the glider info
-            for gl in glider_cache:
-                if glider_track['location'] == gl['location']:
-                    existing_data = gl
-                    if 'track' in existing_data:
-                        glider_track['track'] = existing_data['track']
-                    if 'metadata' in existing_data:
-                        glider_track['metadata'] = existing_data['metadata']
-                    if 'times' in existing_data:
-                        glider_track['times'] = existing_data['times']
-                    break
-
-        else:
-            #if dont skip it, i.e not recovered then try processing it
-            #try and get some additional engineering data for the glider
-            glider_track = _get_additional_data(glider_track)
-
-            if glider_track['location'] not in gliders_to_update:
-                #if the glider is not in the update list get as much as we can
-                r = requests.get(glider_track['url']+data_request_str)
-                #loop through the returned data
-                track_data = _extract_glider_track_from_data(r.json(),glider_track['depth'])
-                glider_track['track'] = track_data
-                #when was the track updated
-                glider_track['times']['last_updated'] = str(datetime.utcnow())
-                #that last time of the track
-                glider_track['times']['last_requested'] = glider_track['track']['times'][-1] - COSMO_CONSTANT
-            else:
-                print "...exists already..update..."
-                #get the existing
-                existing_data = None
-                for gl in glider_cache:
-                    if glider_track['location'] == gl['location']:
-                        existing_data = gl
-                        break
-
-                dt_old = datetime.strptime(existing_data['times']['end_time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-                dt_new = datetime.strptime(glider_track['times']['end_time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-                print "old:",dt_old,"\t","new:",dt_new
-                #if the existing data, has the same stream metadata info just use the cache
-                if dt_old != dt_new: #and existing_data['track']['time'][-1] == glider_track['track']['time'][-1]:
-                    #if they dont match, get the new data using the: old end, and the new end
-                    start_req = "&startdt=" + existing_data['times']['end_time']
-                    end_req = "&enddt="   + glider_track['times']['end_time']
-
-                    r = requests.get(glider_track['url']+data_request_str+start_req+end_req)
-                    track_data = _extract_glider_track_from_data(r.json(),glider_track['depth'])
-
-                    #set, the track data to be the cache and add the new data in
-                    glider_track['track'] = existing_data['track']
-                    print "####### adding data......"
-
-                    data_keys = ['depths','coordinates','times']
-
-                    for key in glider_track['track'].keys():
-                        if key in data_keys:
-                            try:
-                                glider_track['track'][key].extend(track_data[key])
-                            except Exception,e:
-                                raise KeyError('Error adding new track data to ('+key+')')
-                else:
-                    #dont update the track use the cache
-                    glider_track['track'] = existing_data['track']
-                    glider_track['metadata'] = existing_data['metadata']
-                    glider_track['times']['last_updated'] = existing_data['times']['last_updated']
-                    glider_track['times']['last_requested'] = glider_track['track']['times'][-1] - COSMO_CONSTANT
-
-
-    t1 = time.time()
-    print t1-t0," secs to complete..."
-    return glider_outline
-
-def _get_existing_glider_ids_to_skip(glider_cache):
-    '''
-        quick pass to identify glider entries that we can skip due to it being recovered
-        also identfies gliders we wish we update, i.e telemetered gliders
-    '''
-    locations_to_skip = []
-    locations_to_update = []
-    for g in glider_cache:
-        #if its recovered we can skip it as
-        #if not we should add the most up todate date for the track
-        if g['is_recovered']:
-            #add to the skip list and move on, as its recovered
-            locations_to_skip.append(g['location'])
-            continue
-
-        #if there is no track or length (0) try and get it "all", using the default limit
-        if 'track' not in g or g['track'] is None or len(g['track']) == 0:
-            #if there was no data, dont do anything as we want another chance to get the data
-            pass
-        else:
-            locations_to_update.append(g['location'])
-
-    print "cache:",len(locations_to_update),len(locations_to_skip),len(glider_cache)
-    return locations_to_skip,locations_to_update,
-
-def _extract_glider_track_from_data(track_data,glider_depth=None):
-    '''
-        loop through the response and create the line track
-    '''
-    lat_field   = "latitude"
-    lon_field   = "longitude"
-    bar_to_m    = 0.09804139432
-
-    coors = []
-    dt = []
-    depths = []
-    glider_depth_units = None
-    has_depth = False
-
-    for row in track_data:
-        has_lon   = not np.isnan(row[lon_field])
-        if row[lon_field] >= 180 or row[lon_field] <= -180 :
-            has_lon = False
-
-        has_lat   = not np.isnan(row[lat_field])
-        if row[lat_field] >= 90 or row[lat_field] <= -90:
-            has_lon = False
-
-        if glider_depth is not None:
-            has_depth = not np.isnan(row[glider_depth['particleKey']])
-
-        if has_lat and has_lon: #and has_depth and (float(row[depth_field]) != -999):
-            #add position
-
-            coors.append([row[lon_field], row[lat_field]])
-            dt.append(row['pk']['time'])
-            #add depth if available and not nan
-            if (has_depth and
-                (float(row[glider_depth['particleKey']])) != -999 and
-                 (float(row[glider_depth['particleKey']])) != float(glider_depth['fillValue'])):
-
-                if glider_depth['units'] == "bar":
-                    depths.append(row[glider_depth['particleKey']] * bar_to_m)
-                    glider_depth_units = "m"
-                elif glider_depth_units == "m":
-                    depths.append(row[glider_depth['particleKey']])
-            else:
-                depths.append(-999)
-
-    return {"name":row['pk']['subsite']+"-"+row['pk']['node'],
-                             "reference_designator": row['pk']['subsite']+"-"+row['pk']['node']+"-"+row['pk']['sensor'],
-                             "type": "LineString",
-                             "coordinates" : coors,
-                             "times": dt,
-                             "units": glider_depth_units,
-                             "depths": depths}
-
-def _get_additional_data(glider_track):
+def _compile_glider_tracks(update_tracks):
     '''
-        get additional data for a glider stream, [battery,vacuum,m_speed[] information
+    Compile the glider tracks (see glider_tracks.py); with update_tracks the
+    stored gliders are reused or extended with their new data only.
     '''
-
-    #see if its recovered, create desired stream
-    search_stream = None
-    if glider_track['is_recovered'] == True:
-        search_stream = "glider_eng_recovered"
-        search_method = "recovered_host"
-    else:
-        search_stream = "glider_eng_telemetered"
-        search_method = "telemetered"
-
-    #check its available
-    if search_stream in glider_track['available_streams']:
-        #get the additional metadata fields
-        url = glider_track['glider_metadata_url']+"/metadata"
-        req_addit_info_list = requests.get(url)
-        metadata = req_addit_info_list.json()
-        param_list = metadata['parameters']
-
-        #get the metadata for the extra fields
-        metadata_field = []
-        parameters = []   # for the '&parameters='
-        param_request = '?limit=2'
-        for p in param_list:
-            if p['stream'] == search_stream:
-                if p['particleKey'] == 'm_battery':
-                    metadata_field.append(p)
-                    parameters.append(p['pdId'])
-                if p['particleKey'] == 'm_lithium_battery_relative_charge':
-                    metadata_field.append(p)
-                    parameters.append(p['pdId'])
-                if p['particleKey'] == 'm_speed':
-                    metadata_field.append(p)
-                    parameters.append(p['pdId'])
-                if p['particleKey'] == 'm_vacuum':
-                    metadata_field.append(p)
-                    parameters.append(p['pdId'])
-
-        if len(parameters)>0:
-            param_request += '&parameters='+",".join(parameters)
-
-        additional_data_url = glider_track['glider_metadata_url'] + "/"+ search_method +"/"+ search_stream + param_request
-        req_addit_info_data = requests.get(additional_data_url)
-        if req_addit_info_data.status_code == 200:
-            data = req_addit_info_data.json()
-            #newest should be on the top
-            data_entry = data[0]
-            #get the time
-            glider_track['metadata'] = {'time': data_entry['pk']['time']}
-            #get the fields
-            for field in metadata_field:
-                if field['particleKey'] in data_entry.keys():
-                    glider_track['metadata'][field['particleKey']] = field
-                    glider_track['metadata'][field['particleKey']]['value'] = data_entry[field['particleKey']]
-
-    return glider_track
-
-def _compile_glider_tracks(update_tracks):
-    # we will always want the telemetered data, and the engineering stream if possible
-    glider_ids = []
-    glider_locations = []
-    glider_info = []
-
-    base_url, timeout, timeout_read = get_uframe_info()
-    #get the list of mobile assets
-    r = requests.get(base_url)
-    all_platforms = r.json()
-
-    skipped_glider = 0
-
-    #glider discovery
-    for p in all_platforms:
-        if "MOAS" in p:
-            print p
-            r_p = requests.get(base_url+"/"+p)
-            try:
-                p_p = r_p.json()
-                for gl in p_p:
-                    glider_location = "/"+p+"/"+gl
-                    glider_url = base_url+glider_location
-                    #get the slider streams to see whats available
-                    req_instrument_list = requests.get(glider_url)
-                    available_instruments = req_instrument_list.json()
-                    #set some defaults, that will be overridden
-                    glider_instrument = None
-                    glider_stream = None
-                    glider_method = None
-                    glider_dates = None
-                    #assume its not recovered until we check the methods
-                    is_recovered = False
-                    #check for eng instrument
-                    if "00-ENG000000" in available_instruments:
-                        glider_instrument = "00-ENG000000"
-                    else:
-                        skipped_glider+=1
-                        #ONLY USE ENGINEERING STREAMS
-                        continue
-                        #use the first available insturment
-                        glider_instrument = available_instruments[0]
-
-
-                    #use the selected instrument to create the link, list the others to make them available
-                    glider_location+="/"+glider_instrument
-                    #update the url
-                    glider_url = base_url+glider_location
-
-                    #store the location to the metadata url
-                    glider_metadata_url = glider_url
-                    #get a list of the methods
-                    req_method_list = requests.get(glider_url)
-                    available_methods = req_method_list.json()
-                    #if its not done get the best selected
-                    if glider_method is None:
-                        glider_method,is_recovered = _select_glider_method(available_methods)
-
-                    #update the location and the url
-                    glider_location+="/"+glider_method
-                    glider_url = base_url+glider_location
-
-                    req_stream_list = requests.get(glider_url)
-                    available_streams = req_stream_list.json()
-                    if glider_stream is None:
-                        glider_stream = available_streams[0]
-                    else:
-                        available_streams.append(glider_stream)
-
-                    #used to obtain the date metadata, also used to override the stream and method for glider info
-                    glider_method, glider_stream,glider_dates,glider_depth = _check_for_gps_position_stream(glider_metadata_url,glider_stream,glider_method)
-
-                    #update the location and the url with the stream
-                    glider_location+="/"+glider_stream
-                    glider_url = base_url+glider_location
-
-                    glider_item = {"times" : glider_dates,
-                                       "url" : glider_url,
-                                       "location" : glider_location,
-                                       'instrument' : glider_instrument,
-                                       "method" : glider_method,
-                                       "stream" : glider_stream,
-                                       "depth" : glider_depth,
-                                       "available_instruments" : available_instruments,
-                                       "available_methods" : available_methods,
-                                       "available_streams" : available_streams,
-                                       "is_recovered" : is_recovered,
-                                       "glider_metadata_url" : glider_metadata_url}
-
-                    #update the content
-                    glider_info.append(glider_item)
-            except Exception,e:
-                print "error:",e, p, r_p.content
-
-
-
-    #glider_info is the glider outline
-    #check for the update flag, will try and update only those available
-    print "number of gliders:",len(glider_info)," skipped due to non ENG:",skipped_glider
-    if update_tracks:
-        _get_glider_track_data(glider_info,cache.get('glider_tracks'))
-    else:
-        _get_glider_track_data(glider_info)
-
-    #if weve come this far, update the cache with any changes
-    cache.set('glider_tracks',glider_info)
-
-    #return it so we can see it
-    return glider_info
+    service = GliderTrackService.from_config(current_app, uframe_client, cache_timeout=CACHE_TIMEOUT)
+    gliders = service.compile(update=update_tracks)
+    current_app.logger.debug('glider tracks: %s' % service.counts)
+    return gliders
 
 @api.route('/stream')
 #@auth.login_required
 def streams_list():
     '''
-    Accepts stream_name or reference_designator as a URL argument
+    Accepts stream_name or reference_designator as a URL argument.  Searching,
+    sorting and paging run against the indexed stream catalog (see
+    stream_catalog.py), which is reindexed when the cached stream list changes.
     '''
 
     if request.args.get('stream_name'):
         dict_from_stream(request.args.get('stream_name'))
 
-    cached = cache.get('stream_list')
-
-    if cached:
-        retval = cached
+    error = stream_catalog.ensure_loaded(dfs_streams, CACHE_TIMEOUT)
+    if error is not None:
+        return error
+    # positions are only valid against the list they came from; a concurrent reindex swaps in another
+    catalog = stream_catalog.data()
+
+    is_reverse = True
+    if request.args.get('sort') and request.args.get('sort') != "":
+        sort_by = request.args.get('sort')
+        if request.args.get('order') and request.args.get('order') != "":
+            order = request.args.get('order')
+            if order == 'reverse':
+                is_reverse = False
     else:
-        retval = dfs_streams()
-        if 'error' not in retval:
-            cache.set('stream_list', retval, timeout=CACHE_TIMEOUT)
+        sort_by = 'end'
 
-    try:
-        is_reverse = True
-        if request.args.get('sort') and request.args.get('sort') != "":
-            sort_by = request.args.get('sort')
-            if request.args.get('order') and request.args.get('order') != "":
-                order = request.args.get('order')
-                if order == 'reverse':
-                    is_reverse = False
-        else:
-            sort_by = 'end'
-        retval = sorted(retval, key=itemgetter(sort_by), reverse=is_reverse)
-    except (TypeError, KeyError) as e:
-        return retval
-
-    # lets create a container to work with
-    temp_list = []
-
-    # instantiate a disabled streams model cursor
+    # streams under a disabled array, site, platform or instrument are not listed
     disabled_streams = DisabledStreams().query.all()
+    excluded = catalog.disabled([disabled_stream.ref_des for disabled_stream in disabled_streams])
 
-    # grab the json from the instance of all it's data
-    disabled_streams = [disabled_stream.to_json() \
-                        for disabled_stream in disabled_streams]
-
-    # look over each of the items in the disabled streams
-    '''
-    @param search_terms:
-        the list of strings that will be searched against
-    @param data_set:
-        the main data being parsed
-    '''
-    def _parse_lists(search_terms, data_set):
-        included_streams = []
-
-        '''
-        @param term:
-            The search term that will be checking aginst
-        @param subset:
-            The data being searched
-        @param length:
-            A very specific argument for choosing what part of the reference
-            designator to use
-        '''
-        def _gen(term, subset, length):
-            result = []
-            for obj in subset:
-                if obj['reference_designator'][:length] not in term:
-                    result.append(obj)
-            return result
-
-        for stream in search_terms:
-
-            # establish a match criteria, so we know at what level to delete
-            match_on = len(stream['refDes'])
-
-            # TODO: Refactor this to use a method
-            if match_on == 2:
-                if len(included_streams) is 0:
-                    included_streams = _gen(stream['refDes'], data_set, match_on)
-                else:
-                    included_streams = _gen(stream['refDes'], included_streams, match_on)
-
-            elif match_on == 8:
-                if len(included_streams) is 0:
-                    included_streams = _gen(stream['refDes'], data_set, match_on)
-                else:
-                    included_streams = _gen(stream['refDes'], included_streams, match_on)
-
-            elif match_on == 11:
-                if len(included_streams) is 0:
-                    included_streams = _gen(stream['refDes'], data_set, match_on)
-                else:
-                    included_streams = _gen(stream['refDes'], included_streams, match_on)
-
-            elif match_on == 27:
-                if len(included_streams) is 0:
-                    included_streams = _gen(stream['refDes'], data_set, match_on)
-                else:
-                    included_streams = _gen(stream['refDes'], included_streams, match_on)
-
-        if len(included_streams) is 0:
-            return data_set
-
-        return included_streams
-
-    retval = _parse_lists(disabled_streams, retval)
-
-    if request.args.get('min') == 'True':
-        for obj in retval:
-            try:
-                del obj['parameter_id']
-                del obj['units']
-                del obj['variable_type']
-                del obj['variable_types']
-                del obj['download']
-                del obj['variables']
-                del obj['variables_shape']
-            except KeyError as e:
-                print e
-
+    concepts = None
     if request.args.get('concepts') and request.args.get('concepts') != "":
-        return_list = []
-        search_term = str(request.args.get('concepts')).split()
-        search_set = set(search_term)
-        for subset in search_set:
-            for item in retval:
-                if subset.lower() in str(item['reference_designator']).lower():
-                    return_list.append(item)
-        retval = return_list
+        concepts = set(str(request.args.get('concepts')).split())
 
+    search = None
     if request.args.get('search') and request.args.get('search') != "":
-        return_list = []
-        search_term = str(request.args.get('search')).split()
-        search_set = set(search_term)
-        for subset in search_set:
-            if len(return_list) > 0:
-                ven_subset = []
-                ven_set = deepcopy(retval)
-                for item in ven_set:
-                    if subset.lower() in str(item['array_name']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['site_name']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['platform_name']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['assembly_name']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['reference_designator']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['stream_name']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['parameter_display_name']).lower():
-                        ven_subset.append(item)
-                    elif subset.lower() in str(item['long_display_name']).lower():
-                        ven_subset.append(item)
-                retval = ven_subset
-            else:
-                for item in retval:
-                    if subset.lower() in str(item['array_name']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['site_name']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['platform_name']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['assembly_name']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['reference_designator']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['parameter_display_name']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['stream_name']).lower():
-                        return_list.append(item)
-                    elif subset.lower() in str(item['long_display_name']).lower():
-                        return_list.append(item)
-                retval = return_list
+        search = set(str(request.args.get('search')).split())
+
+    positions = catalog.query(sort_by=sort_by, reverse=is_reverse, search=search,
+                              concepts=concepts, exclude=excluded)
+    minimal = request.args.get('min') == 'True'
 
     if request.args.get('startAt'):
         start_at = int(request.args.get('startAt'))
         count = int(request.args.get('count'))
-        total = int(len(retval))
-        retval_slice = retval[start_at:(start_at + count)]
+        total = int(len(positions))
+        retval_slice = catalog.page(positions, start_at, count, minimal=minimal)
         result = jsonify({"count": count,
                             "total": total,
                             "startAt": start_at,
@@ -1124,7 +519,7 @@ def streams_list():
         return result
 
     else:
-        return jsonify(streams=retval)
+        return jsonify(streams=catalog.page(positions, minimal=minimal))
 
 @api.route('/disabled_streams', methods=['GET', 'POST'])
 @api.route('/disabled_streams/<int:id>', methods=['DELETE'])
@@ -1189,7 +584,7 @@ def get_acoustic_datalist():
     Get all available acoustic data sets
     '''
     antelope_url = current_app.config['UFRAME_ANTELOPE_URL']
-    r = requests.get(antelope_url)
+    r = uframe_client.get(antelope_url)
     data = r.json()
 
     for ind, record in enumerate(data):
@@ -1226,14 +621,63 @@ def get_acoustic_datalist():
         return jsonify(results=data)
 
 
+def _ntp_time(iso8601):
+    '''
+    uframe (NTP) time of an ISO8601 string, UTC unless it has a timezone.
+    '''
+    dt = parse_date(iso8601)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=pytz.utc)
+    return (dt - datetime(1900, 1, 1, tzinfo=pytz.utc)).total_seconds()
+
+
+def _glider_track_options(args):
+    '''
+    select_tracks options from the request arguments; ValueError when invalid.
+    '''
+    options = {}
+    if args.get('bbox'):
+        bbox = [float(value) for value in args.get('bbox').split(',')]
+        if len(bbox) != 4:
+            raise ValueError('bbox is min_lon,min_lat,max_lon,max_lat')
+        options['bbox'] = bbox
+    if args.get('start_time'):
+        options['start'] = _ntp_time(args.get('start_time'))
+    if args.get('end_time'):
+        options['end'] = _ntp_time(args.get('end_time'))
+    if args.get('tolerance'):
+        options['tolerance'] = float(args.get('tolerance'))
+    elif args.get('zoom'):
+        options['tolerance'] = zoom_tolerance(args.get('zoom'))
+    return options
+
+
 # @auth.login_required
 @api.route('/get_glider_tracks')
 def get_uframe_glider_track():
     '''
     get glider tracks
+
+    Tracks are stored at full resolution; these optional arguments limit the response:
+        glider                  comma separated glider names (e.g. CP05MOAS-GL340)
+        bbox                    min_lon,min_lat,max_lon,max_lat
+        start_time, end_time    ISO8601 time window
+        tolerance               simplification tolerance in degrees, or
+        zoom                    map zoom level (simplified to about one pixel)
     '''
     try:
-        cached = cache.get('glider_tracks')
+        try:
+            options = _glider_track_options(request.args)
+        except (ValueError, OverflowError) as e:
+            return make_response("Error: invalid glider track request.  %s" % e, 400)
+        names = request.args.get('glider').split(',') if request.args.get('glider') else None
+
+        # only the shards of the requested gliders; unknown gliders have no shard (an empty, cached result)
+        cached = None
+        if names is not None:
+            cached = blob_cache.get('glider_tracks', shards=names)
+        if cached is None:
+            cached = blob_cache.get('glider_tracks')
         will_reset_cache = False
         will_update_using_cache = False
 
@@ -1244,14 +688,15 @@ def get_uframe_glider_track():
             will_reset_cache = True
             will_update_using_cache = False
 
-        if cached and not(will_reset_cache) and not (will_update_using_cache):
+        # recompile only when the collection itself is missing
+        if cached is not None and not(will_reset_cache) and not (will_update_using_cache):
             data = cached
         else:
+            # compiling stores the gliders as 'glider_tracks'
             data = _compile_glider_tracks(will_update_using_cache)
 
-            if "error" not in data:
-                cache.set('glider_tracks', data, timeout=CACHE_TIMEOUT)
-
+        if names is not None or options:
+            data = select_tracks(data, names, **options)
         return jsonify({"gliders":data})
     except requests.exceptions.ConnectionError as e:
         error = "Error: Cannot connect to uframe.  %s" % e
@@ -1267,7 +712,7 @@ def get_uframe_streams(mooring, platform, instrument, stream_type):
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = '/'.join([uframe_url, mooring, platform, instrument, stream_type])
         current_app.logger.info("GET %s", url)
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as e:
         return internal_server_error('uframe connection cannot be made.' + str(e.message))
@@ -1282,7 +727,7 @@ def get_uframe_stream(mooring, platform, instrument, stream):
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, stream])
         current_app.logger.info("GET %s", url)
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except Exception as e:
         #return internal_server_error('uframe connection cannot be made.' + str(e.message))
@@ -1290,7 +735,7 @@ def get_uframe_stream(mooring, platform, instrument, stream):
 
 def get_uframe_toc():
     uframe_url = current_app.config['UFRAME_URL'] + current_app.config['UFRAME_TOC']
-    r = requests.get(uframe_url)
+    r = uframe_client.get(uframe_url)
     if r.status_code == 200:
         d =  r.json()
         for row in d:
@@ -1392,7 +837,7 @@ def get_uframe_instrument_metadata(ref):
         mooring, platform, instrument = ref.split('-', 2)
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, 'metadata'])
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code == 200:
             data = response.json()
             return jsonify(metadata=data['parameters'])
@@ -1411,7 +856,7 @@ def get_uframe_instrument_metadata_parameters(ref):
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, 'metadata', 'parameters'])
         #current_app.logger.info("GET %s", url)
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         return response
     except:
         return _response_internal_server_error()
@@ -1438,7 +883,7 @@ def get_uframe_stream_metadata_times(ref):
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, 'metadata','times'])
         #current_app.logger.info("GET %s", url)
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if response.status_code == 200:
             return response
         return jsonify(times={}), 200
@@ -1459,7 +904,7 @@ def get_uframe_stream_contents(mooring, platform, instrument, stream_type, strea
         uframe_url, timeout, timeout_read = get_uframe_info()
         url = "/".join([uframe_url, mooring, platform, instrument, stream_type, stream + query])
         current_app.logger.debug('***** url: ' + url)
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
         if not response:
             raise Exception('No data available from uFrame for this request.')
         if response.status_code != 200:
@@ -1487,10 +932,11 @@ def multistream_api(stream1, stream2, instrument1, instrument2, var1, var2):
     header1 = '-'.join([stream1.replace('_', '-'), instrument1.split('_')[0].replace('-', '_'), instrument1.split('_')[1].replace('-', '_')])
     header2 = '-'.join([stream2.replace('_', '-'), instrument2.split('_')[0].replace('-', '_'), instrument2.split('_')[1].replace('-', '_')])
 
-    # Need to reformat the data a bit
+    # Join the second stream's variable onto the first stream's particles
     try:
-        for ind, data in enumerate(resp_data[header2]):
-            resp_data[header1][ind][var2] = data[var2]
+        dataset = resp_data[header1]
+        other = resp_data[header2]
+        dataset.add_column(var2, other.column(var2), other.qc.get(var2))
         title = PlatformDeployment._get_display_name(stream1)
         subtitle = PlatformDeployment._get_display_name(stream2)
     except IndexError:
@@ -1498,7 +944,7 @@ def multistream_api(stream1, stream2, instrument1, instrument2, var1, var2):
     except KeyError:
         return jsonify(error='Missing Data in Data Repository'), 500
 
-    return jsonify(data=resp_data[header1], units=units, title=title, subtitle=subtitle)
+    return jsonify(data=dataset.to_records(), units=units, title=title, subtitle=subtitle)
 
 
 def get_uframe_multi_stream_contents(stream1_dict, stream2_dict, start_time, end_time):
@@ -1541,7 +987,7 @@ def get_uframe_multi_stream_contents(stream1_dict, stream2_dict, start_time, end
         current_app.logger.debug("***:" + url)
 
         _, timeout, timeout_read = get_uframe_info()
-        response = requests.get(url, timeout=(timeout, timeout_read))
+        response = uframe_client.get(url, timeout=(timeout, timeout_read))
 
         if response.status_code != 200:
             msg = map_common_error_message(response.text, response.text)
@@ -1552,10 +998,12 @@ def get_uframe_multi_stream_contents(stream1_dict, stream2_dict, start_time, end
         return str(e), 500
 
 
-def get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream, start_time, end_time, dpa_flag, parameter_ids):
+def get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream, start_time, end_time, dpa_flag, parameter_ids, track=True):
     '''
     Gets the bounded stream contents, start_time and end_time need to be datetime objects
+    (track=False skips the google analytics hit, for the extra windows of one plot request)
     '''
+    decoder = None
     try:
         if dpa_flag == '0' and len(parameter_ids) < 1:
             query = '?beginDT=%s&endDT=%s&limit=%s' % (start_time, end_time, current_app.config['DATA_POINTS'])
@@ -1576,38 +1024,36 @@ def get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type,
         TOO_BIG = 1024 * 1024 * 15 # 15MB
         CHUNK_SIZE = 1024 * 32   #...KB
         TOTAL_SECONDS = current_app.config['UFRAME_PLOT_TIMEOUT']
-        dataBlock = ""
-        response = ""
-        idx = 0
+        decoder = ParticleStreamDecoder()
 
         # counter
         t0 = time.time()
 
-        with closing(requests.get(url, stream=True)) as response:
-            content_length = 0
+        with closing(uframe_client.get(url, stream=True)) as response:
             for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                content_length = content_length + CHUNK_SIZE
-                t1 = time.time()
-                total = t1-t0
-                idx += 1
+                # particles are decoded as they arrive; limits apply to bytes actually received
+                decoder.feed(chunk)
 
-                if content_length > TOO_BIG:
+                if decoder.bytes_received > TOO_BIG:
                     return 'Data request too large, greater than 15MB', 500
 
-                if total > TOTAL_SECONDS:
+                if time.time() - t0 > TOTAL_SECONDS:
                     return 'Data request time out', 500
 
-                dataBlock += chunk
-
-            idx_c = dataBlock.rfind('}\n]')
-
-            if idx_c == -1:
-                dataBlock += "]"
-            urllib2.urlopen(GA_URL)
-            return json.loads(dataBlock), 200
+            try:
+                data = decoder.close()
+            except ValueError:
+                if not decoder.truncated:
+                    raise
+                # uframe cut the array short: plot the complete particles received
+                current_app.logger.info('uframe particle array truncated after %d particles.' % decoder.count)
+                data = decoder.particles
+            if track:
+                urllib2.urlopen(GA_URL)
+            return data, 200
 
     except Exception as e:
-        msg = map_common_error_message(dataBlock, str(e))
+        msg = map_common_error_message(decoder.error_text() if decoder else '', str(e))
         return msg, 500
 
 
@@ -1643,49 +1089,24 @@ def get_uframe_stream_contents_chunked(mooring, platform, instrument, stream_typ
         TOO_BIG = 1024 * 1024 * 15 # 15MB
         CHUNK_SIZE = 1024 * 32   #...KB
         TOTAL_SECONDS = 20
-        dataBlock = ""
-        idx = 0
+        decoder = ParticleStreamDecoder()
 
         #counter
         t0 = time.time()
 
-        with closing(requests.get(url,stream=True)) as response:
-            content_length = 0
+        with closing(uframe_client.get(url,stream=True)) as response:
             for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                content_length = content_length + CHUNK_SIZE
-                t1 = time.time()
-                total = t1-t0
-                idx+=1
-                if content_length > TOO_BIG or total > TOTAL_SECONDS:
-                    #('uframe response to large.')
-                    # break it down to the last know good spot
-                    t00 = time.time()
-                    idx_c = dataBlock.rfind('}, {')
-                    dataBlock = dataBlock[:idx_c]
-                    dataBlock+="} ]"
-                    t11 = time.time()
-                    totaln = t11-t00
-
-                    print "size_limit or time reached",content_length/(1024 * 1024),total,totaln,idx
-                    return json.loads(dataBlock),200
-                # all the data is in the resonse return it as normal
-                #previousBlock = dataBlock
-                dataBlock+=chunk
-            #print "transfer complete",content_length/(1024 * 1024),total
-
-            #if str(dataBlock[-3:-1]) != '} ]':
-            #    idx_c = dataBlock.rfind('}')
-            #    dataBlock = dataBlock[:idx_c]
-            #    dataBlock+="} ]"
-            #    print 'uFrame appended Error Message to Stream',"\n",dataBlock[-3:-1]
-            idx_c = dataBlock.rfind('} ]')
-            if idx_c == -1:
-                dataBlock+="]"
-
-            return json.loads(dataBlock),200
+                decoder.feed(chunk)
+                total = time.time() - t0
+                if decoder.bytes_received > TOO_BIG or total > TOTAL_SECONDS:
+                    # uframe response too large or too slow; keep the complete particles received so far
+                    current_app.logger.info('size_limit or time reached: %d bytes, %.1f s, %d particles'
+                                            % (decoder.bytes_received, total, decoder.count))
+                    return decoder.particles, 200
+
+            return decoder.close(), 200
 
     except Exception,e:
-        #return json.loads(dataBlock), 200
         return internal_server_error('uframe connection unstable.'),500
 
 def get_uframe_info():
@@ -1739,7 +1160,7 @@ def get_csv(stream, ref, start_time, end_time, dpa_flag):
 
     url = "/".join([uframe_url, mooring, platform, instrument, stream_type, stream + query])
     current_app.logger.debug('***** url: ' + url)
-    response = requests.get(url, timeout=(timeout, timeout_read))
+    response = uframe_client.get(url, timeout=(timeout, timeout_read))
 
     return response.text, response.status_code
 
@@ -1773,7 +1194,7 @@ def get_json(stream, ref, start_time, end_time, dpa_flag, provenance, annotation
 
     url = "/".join([uframe_url, mooring, platform, instrument, stream_type, stream + query])
     current_app.logger.debug('***** url: ' + url)
-    response = requests.get(url, timeout=(timeout, timeout_read))
+    response = uframe_client.get(url, timeout=(timeout, timeout_read))
 
     return response.text, response.status_code
 
@@ -1805,7 +1226,7 @@ def get_netcdf(stream, ref, start_time, end_time, dpa_flag, provenance, annotati
     uframe_url, timeout, timeout_read = get_uframe_info()
     url = "/".join([uframe_url, mooring, platform, instrument, stream_type, stream + query])
     current_app.logger.debug('***** url: ' + url)
-    response = requests.get(url, timeout=(timeout, timeout_read))
+    response = uframe_client.get(url, timeout=(timeout, timeout_read))
 
     return response.text, response.status_code
 
@@ -1817,16 +1238,39 @@ def get_data_api(stream, instrument, yvar, xvar):
     try:
         xvar = xvar.split(',')
         yvar = yvar.split(',')
-        resp_data, units = get_simple_data(stream, instrument, yvar, xvar)
+        dataset, units = get_simple_data(stream, instrument, yvar, xvar, points=plot_point_target())
         instrument = instrument.split(',')
         title = get_display_name_by_rd(instrument[0])
     except Exception as err:
         return jsonify(error='%s' % str(err.message)), 500
-    return jsonify(data=resp_data, units=units, title=title)
+    return jsonify(data=dataset.to_records(), units=units, title=title)
 
 @auth.login_required
 @api.route('/plot/<string:instrument>/<string:stream>', methods=['GET'])
 def get_svg_plot(instrument, stream):
+    # Rendered plots are cached by normalized request; browsers revalidate with If-None-Match
+    cache_key = plot_cache.request_key(instrument, stream, request.args)
+    cached_plot = plot_cache.get(cache_key)
+    if cached_plot is not None:
+        return _plot_response(cached_plot)
+
+    try:
+        plot_pool.check_capacity()
+    except PlotQueueFull as err:
+        return jsonify(error=str(err.message)), 503, {'Retry-After': '5'}
+
+    # Very large plots can be requested asynchronously and polled for
+    if to_bool(request.args.get('async', False)):
+        args = [(key, value) for key, value in request.args.iteritems(multi=True) if key != 'async']
+        headers = [(key, value) for key, value in request.headers if key.lower() != 'if-none-match']
+        try:
+            job_id = plot_pool.submit_request(lambda: get_svg_plot(instrument, stream),
+                                              request.path + '?' + urlencode(args), headers)
+        except PlotQueueFull as err:
+            return jsonify(error=str(err.message)), 503, {'Retry-After': '5'}
+        return jsonify(job_id=job_id, status='pending',
+                       poll=url_for('uframe.get_plot_job', job_id=job_id)), 202
+
     # from ooiservices.app.uframe.controller import split_stream_name
     # Ok first make a list out of stream and instrument
     instrument = instrument.split(',')
@@ -1863,8 +1307,7 @@ def get_svg_plot(instrument, stream):
     events = {}
     if use_event:
         try:
-            response = get_events_by_ref_des(instrument[0])
-            events = json.loads(response.data)
+            events = {'events': get_event_index()['events'].get(instrument[0], [])}
         except Exception as err:
             current_app.logger.exception(str(err.message))
             return jsonify(error=str(err.message)), 400
@@ -1882,17 +1325,22 @@ def get_svg_plot(instrument, stream):
     height_in = height / 96.
     width_in = width / 96.
 
+    # number of points to plot, one per pixel of a requested width (or the points requested), else DATA_POINTS
+    points = plot_point_target()
+    if points is None:
+        points = current_app.config['DATA_POINTS']
+
     # get the data from uFrame
     try:
         if plot_layout == "depthprofile":
             data = get_process_profile_data(stream[0], instrument[0], yvar[0], xvar[0])
         else:
             if len(instrument) == 1:
-                data = get_data(stream[0], instrument[0], yvar, xvar)
+                data = get_data(stream[0], instrument[0], yvar, xvar, points=points)
             elif len(instrument) > 1:  # Multiple datasets
                 data = []
                 for idx, instr in enumerate(instrument):
-                    stream_data = get_data(stream[idx], instr, [yvar[idx]], [xvar[idx]])
+                    stream_data = get_data(stream[idx], instr, [yvar[idx]], [xvar[idx]], points=points)
                     data.append(stream_data)
 
     except Exception as err:
@@ -1935,23 +1383,65 @@ def get_svg_plot(instrument, stream):
                     'profileid': profileid,
                     'width_in': width_in,
                     'use_qaqc': qaqc,
+                    'x_units': request.args.get('x_units', ''),
+                    'y_units': request.args.get('y_units', ''),
                     'st_date': request.args['startdate'],
                     'ed_date': request.args['enddate']}
 
     try:
-        buf = generate_plot(data, plot_options)
+        # rendered in the plot worker pool, not in this request thread
+        body = plot_pool.render(data, plot_options)
 
         content_header_map = {
             'svg' : 'image/svg+xml',
             'png' : 'image/png'
         }
 
-        return buf.read(), 200, {'Content-Type': content_header_map[plot_format]}
+        entry = plot_cache.set(cache_key, body, content_header_map[plot_format], request.args['enddate'])
+        return _plot_response(entry)
+    except PlotQueueFull as err:
+        current_app.logger.info(str(err.message))
+        return jsonify(error=str(err.message)), 503, {'Retry-After': '5'}
+    except PlotTimeout as err:
+        current_app.logger.exception(str(err.message))
+        return jsonify(error=str(err.message)), 504
     except Exception as err:
         current_app.logger.exception(str(err.message))
         return jsonify(error='Error generating {0} plot: {1}'.format(plot_options['plot_layout'], str(err.message))), 400
 
 
+@api.route('/plot_job/<string:job_id>', methods=['GET'])
+def get_plot_job(job_id):
+    '''
+    Result of an asynchronous /plot request: 202 while it is running, then
+    the plot (or the error the plot request returned).
+    '''
+    status, body = plot_pool.job_result(job_id)
+    if status is None:
+        return jsonify(error='Unknown or expired plot job %s' % job_id), 404
+    if status['status'] == 'pending':
+        return jsonify(job_id=job_id, status='pending'), 202
+    if status['status'] == 'error':
+        return jsonify(job_id=job_id, error=status['error']), 500
+    headers = {'Content-Type': status['content_type']}
+    if status.get('etag'):
+        headers['ETag'] = status['etag']
+    return body, status['status_code'], headers
+
+
+def _plot_response(entry):
+    '''
+    Response for a rendered (or cached) plot; 304 when the client already has it.
+    '''
+    headers = {'ETag': '"%s"' % entry.etag,
+               'Cache-Control': 'private, max-age=%d' % entry.max_age}
+    if entry.etag in request.if_none_match:
+        plot_cache.not_modified()
+        return '', 304, headers
+    headers['Content-Type'] = entry.content_type
+    return entry.body, 200, headers
+
+
 def get_process_profile_data(stream, instrument, xvar, yvar):
     '''
     NOTE: i have to swap the inputs (xvar, yvar) around at this point to get the plot to work....
@@ -1960,47 +1450,78 @@ def get_process_profile_data(stream, instrument, xvar, yvar):
         join_name ='_'.join([str(instrument), str(stream)])
 
         mooring, platform, instrument, stream_type, stream = split_stream_name(join_name)
-        parameter_ids, y_units, x_units = find_parameter_ids(mooring, platform, instrument, [yvar], [xvar])
-
-        data = get_profile_data(mooring, platform, instrument, stream_type, stream, parameter_ids)
+        parameter_ids, y_units, x_units, units_mapping = find_parameter_ids(mooring, platform, instrument, [yvar], [xvar])
 
-        if not data or data == None:
+        data, profile_ids, _ = _get_profile_particles(mooring, platform, instrument, stream_type, stream, parameter_ids)
+        dataset = ParticleDataset.from_particles(data, [xvar, yvar])
+        ids, (time, x_data, y_data) = split_profiles(profile_ids, dataset.time, dataset.column(xvar), dataset.column(yvar))
+        if not ids:
             raise Exception('profiles not present in data')
+    except KeyError:
+        raise Exception('profiles not present in data')
     except Exception as e:
         raise Exception('%s' % str(e.message))
 
+    # time of the first particle in each profile
+    time = [float(profile_time[0]) for profile_time in time]
+    return {'x': x_data, 'y': y_data, 'x_field': xvar, "y_field": yvar, 'time': time}
+
+
+def _get_profile_particles(mooring, platform, instrument, stream_type, stream, parameter_ids):
     '''
-    # check the data is in the first row
-    if yvar not in data[0] or xvar not in data[0]:
-        data = {'error':'requested fields not in data'}
-        return data
-    if 'profile_id' not in data[0]:
-        data = {'error':'profiles not present in data'}
-        return data
+    Fetch the particles for the request dates and segment them into profiles
+    using the request xvar as depth.  Returns (particles, profile ids, depth
+    field); the profile id is -1 for particles outside every profile.
     '''
+    if 'startdate' in request.args and 'enddate' in request.args:
+        st_date = request.args['startdate']
+        ed_date = request.args['enddate']
+        if 'dpa_flag' in request.args:
+            dpa_flag = request.args['dpa_flag']
+        else:
+            dpa_flag = "0"
+        ed_date = validate_date_time(st_date, ed_date)
+        data, status_code = get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag, parameter_ids)
+    else:
+        message = 'Failed to make plot - start end dates not applied'
+        current_app.logger.exception(message)
+        raise Exception(message)
+
+    if status_code != 200:
+        raise IOError("uFrame unable to get data for this request.")
+
+    current_app.logger.debug('\n --- retrieved data from uframe for profile processing...')
+
+    request_xvar = None
+    if request.args.get('xvar'):
+        junk = request.args['xvar']
+        test_request_xvar = junk.encode('ascii','ignore')
+        if type(test_request_xvar) == type(''):
+            if ',' in test_request_xvar:
+                chunk_request_var = test_request_xvar.split(',',1)
+                if len(chunk_request_var) > 0:
+                    request_xvar = chunk_request_var[0]
+            else:
+                request_xvar = test_request_xvar
+    else:
+        message = 'Failed to make plot - no xvar provided in request'
+        current_app.logger.exception(message)
+        raise Exception(message)
+    if not request_xvar:
+        message = 'Failed to make plot - unable to process xvar provided in request'
+        current_app.logger.exception(message)
+        raise Exception(message)
 
-    y_data = []
-    x_data = []
-    time = []
-    profile_id_list = []
-    profile_count = -1
-
-    for i, row in enumerate(data):
-        if (row['profile_id']) >= 0:
-            profile_id = int(row['profile_id'])
-            if profile_id not in profile_id_list:
-                y_data.append([])
-                x_data.append([])
-                time.append(float(row['pk']['time']))
-                profile_id_list.append(profile_id)
-                profile_count += 1
-            try:
-                y_data[profile_count].append(row[yvar])
-                x_data[profile_count].append(row[xvar])
-            except Exception as e:
-                raise Exception('profiles not present in data')
+    if not data:
+        raise Exception('No Data Available')
+    try:
+        depth = ParticleDataset.from_particles(data, [request_xvar])
+    except KeyError as e:
+        raise Exception('Requested Data (%s) Not Available' % e.args[0])
 
-    return {'x': x_data, 'y': y_data, 'x_field': xvar, "y_field": yvar, 'time': time}
+    # Note: assumes data has depth and time is ordinal
+    profile_ids = segment_profiles(depth.time, depth.column(request_xvar))
+    return data, profile_ids, request_xvar
 
 
 def get_profile_data(mooring, platform, instrument, stream_type, stream, parameter_ids):
@@ -2008,134 +1529,10 @@ def get_profile_data(mooring, platform, instrument, stream_type, stream, paramet
     process uframe data into profiles
     '''
     try:
-        data = []
-        if 'startdate' in request.args and 'enddate' in request.args:
-            st_date = request.args['startdate']
-            ed_date = request.args['enddate']
-            if 'dpa_flag' in request.args:
-                dpa_flag = request.args['dpa_flag']
-            else:
-                dpa_flag = "0"
-            ed_date = validate_date_time(st_date, ed_date)
-            data, status_code = get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag, parameter_ids)
-        else:
-            message = 'Failed to make plot - start end dates not applied'
-            current_app.logger.exception(message)
-            raise Exception(message)
-
-        if status_code != 200:
-            raise IOError("uFrame unable to get data for this request.")
-
-        current_app.logger.debug('\n --- retrieved data from uframe for profile processing...')
-
-        # Note: assumes data has depth and time is ordinal
-        # Need to add assertions and try and exceptions to check data
-        time = []
-        depth = []
-
-        request_xvar = None
-        if request.args['xvar']:
-            junk = request.args['xvar']
-            test_request_xvar = junk.encode('ascii','ignore')
-            if type(test_request_xvar) == type(''):
-                if ',' in test_request_xvar:
-                    chunk_request_var = test_request_xvar.split(',',1)
-                    if len(chunk_request_var) > 0:
-                        request_xvar = chunk_request_var[0]
-                else:
-                    request_xvar = test_request_xvar
-        else:
-            message = 'Failed to make plot - no xvar provided in request'
-            current_app.logger.exception(message)
-            raise Exception(message)
-        if not request_xvar:
-            message = 'Failed to make plot - unable to process xvar provided in request'
-            current_app.logger.exception(message)
-            raise Exception(message)
-
-        for row in data:
-            depth.append(int(row[request_xvar]))
-            time.append(float(row['pk']['time']))
-
-        matrix = np.column_stack((time, depth))
-        tz = matrix
-        origTz = tz
-        INT = 10
-        # tz length must equal profile_list length
-
-        # maxi = np.amax(tz[:, 0])
-        # mini = np.amin(tz[:, 0])
-        # getting a range from min to max time with 10 seconds or milliseconds. I have no idea.
-        ts = (np.arange(np.amin(tz[:, 0]), np.amax(tz[:, 0]), INT)).T
-
-        # interpolation adds additional points on the line within f(t), f(t+1)  time is a function of depth
-        itz = np.interp(ts, tz[:, 0], tz[:, 1])
-
-        newtz = np.column_stack((ts, itz))
-        # 5 unit moving average
-        WINDOW = 5
-        weights = np.repeat(1.0, WINDOW) / WINDOW
-        ma = np.convolve(newtz[:, 1], weights)[WINDOW-1:-(WINDOW-1)]
-        # take the diff and change negatives to -1 and postives to 1
-        dZ = np.sign(np.diff(ma))
-
-        # repeat for second derivative
-        dZ = np.convolve(dZ, weights)[WINDOW-1:-(WINDOW-1)]
-        dZ = np.sign(dZ)
-
-        r0 = 1
-        r1 = len(dZ) + 1
-        dZero = np.diff(dZ)
-
-        start = []
-        stop = []
-        # find where the slope changes
-        dr = [start.append(i) for (i, val) in enumerate(dZero) if val != 0]
-        if len(start) == 0:
-            raise Exception('Unable to determine where slope changes.')
-
-        for i in range(len(start)-1):
-            stop.append(start[i+1])
-
-        stop.append(start[0])
-        start_stop = np.column_stack((start, stop))
-        start_times = np.take(newtz[:, 0], start)
-        stop_times = np.take(newtz[:, 0], stop)
-        start_times = start_times - INT*2
-        stop_times = stop_times + INT*2
-
-        depth_profiles = []
-
-        for i in range(len(start_times)):
-            profile_id = i
-            proInds = origTz[(origTz[:, 0] >= start_times[i]) & (origTz[:, 0] <= stop_times[i])]
-            value = proInds.shape[0]
-            z = np.full((value, 1), profile_id)
-            pro = np.append(proInds, z, axis=1)
-            depth_profiles.append(pro)
-
-        depth_profiles = np.concatenate(depth_profiles)
-        # I NEED to CHECK FOR DUPLICATE TIMES !!!!! NOT YET DONE!!!!
-        # Start stop times may result in over laps on original data set. (see function above)
-        # May be an issue, requires further enquiry
-        profile_list = []
-        for row in data:
-            try:
-                # Need to add epsilon. Floating point error may occur
-                where = np.argwhere(depth_profiles == float(row['pk']['time']))
-                index = where[0]
-                rowloc = index[0]
-                if len(where) and int(row[request_xvar]) == depth_profiles[rowloc][1]:
-                    row['profile_id'] = depth_profiles[rowloc][2]
-                    profile_list.append(row)
-            except IndexError:
-                row['profile_id'] = None
-                profile_list.append(row)
-            except Exception as err:
-                raise Exception('%s' % str(err.message))
-
-        # profile length should equal tz  length
-        return profile_list
+        data, profile_ids, _ = _get_profile_particles(mooring, platform, instrument, stream_type, stream, parameter_ids)
+        for row, profile_id in zip(data, profile_ids.tolist()):
+            row['profile_id'] = profile_id if profile_id >= 0 else None
+        return data
 
     except Exception as err:
         current_app.logger.exception('\n* (pass) exception: ' + str(err.message))
@@ -2146,7 +1543,8 @@ def get_profiles(stream, instrument):
     filename = '-'.join([stream, instrument, "profiles"])
     content_headers = {'Content-Type': 'application/json', 'Content-Disposition': "attachment; filename=%s.json" % filename}
     try:
-        profiles = get_profile_data(instrument, stream)
+        mooring, platform, instrument, stream_type, stream = split_stream_name('_'.join([instrument, stream]))
+        profiles = get_profile_data(mooring, platform, instrument, stream_type, stream, [])
     except Exception as e:
         return jsonify(error=e.message), 400, content_headers
     if profiles is None:
@@ -8,7 +8,11 @@ Support for generating sample data
 from flask import request, current_app
 import numpy as np
 from collections import OrderedDict
-import requests
+from multiprocessing.pool import ThreadPool
+from dateutil.parser import parse as parse_date
+from ooiservices.app import uframe_client
+from ooiservices.app.uframe.dataset import ParticleDataset
+from ooiservices.app.uframe.decimate import decimate_dataset, METHODS
 
 __author__ = 'Andy Bird'
 
@@ -29,7 +33,7 @@ def find_parameter_ids(mooring, platform, instrument, y_parameters, x_parameters
 
     UFRAME_DATA = current_app.config['UFRAME_URL'] + current_app.config['UFRAME_URL_BASE']
     url = "/".join([UFRAME_DATA, mooring, platform, instrument, "metadata/parameters"])
-    parameter_list = requests.get(url).json()
+    parameter_list = uframe_client.get(url).json()
 
     parameter_dict = {}
     parameter_ids = []
@@ -55,6 +59,130 @@ def find_parameter_ids(mooring, platform, instrument, y_parameters, x_parameters
     return parameter_ids, y_units, x_units, units_mapping
 
 
+def plot_point_target(width=None):
+    '''
+    Number of points a plot or data request needs: the 'points' request
+    argument, otherwise the 'width' in pixels (or the width given), capped at
+    PLOT_MAX_POINTS.  None when the request gives neither (no decimation).
+    '''
+    points = request.args.get('points', None)
+    if points is None:
+        points = request.args.get('width', width)
+    if points is None:
+        return None
+    try:
+        points = int(float(points))
+    except ValueError:
+        return None
+    return max(3, min(points, current_app.config['PLOT_MAX_POINTS']))
+
+
+def decimation_method():
+    method = request.args.get('decimation', current_app.config['PLOT_DECIMATION'])
+    if method not in METHODS:
+        method = METHODS[0]
+    return method
+
+
+def _time_windows(start_time, end_time, count):
+    '''
+    Split [start_time, end_time] into count equal windows of uframe date strings.
+    '''
+    def _format(dt):
+        return dt.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (dt.microsecond // 1000)
+
+    try:
+        start = parse_date(start_time)
+        end = parse_date(end_time)
+    except (ValueError, OverflowError):
+        return [(start_time, end_time)]
+    if count <= 1 or end <= start:
+        return [(start_time, end_time)]
+    step = (end - start) / count
+    bounds = [start_time] + [_format(start + step * i) for i in range(1, count)] + [end_time]
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _window_count(start_time, end_time):
+    '''
+    PLOT_FETCH_WINDOWS when the request asks for windows (windows=true) or
+    spans PLOT_WINDOW_MIN_DAYS or more, otherwise one.
+    '''
+    count = current_app.config['PLOT_FETCH_WINDOWS']
+    if request.args.get('windows') == 'true':
+        return count
+    try:
+        span = parse_date(end_time) - parse_date(start_time)
+    except (ValueError, OverflowError):
+        return 1
+    if span.days >= current_app.config.get('PLOT_WINDOW_MIN_DAYS', 30):
+        return count
+    return 1
+
+
+def _get_plot_particles(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag,
+                        parameter_ids, windowed=False):
+    '''
+    Particles for a plot request.  uframe thins a request down to DATA_POINTS
+    particles; a windowed (decimated) request over a long time range asks for
+    DATA_POINTS in each of PLOT_FETCH_WINDOWS time windows (fetched
+    concurrently) so it keeps its detail for decimation.  A window without
+    data (uframe answers with an object rather than a particle array) adds
+    no particles.
+    '''
+    from ooiservices.app.uframe.controller import get_uframe_plot_contents_chunked
+    count = _window_count(st_date, ed_date) if windowed else 1
+    windows = _time_windows(st_date, ed_date, count)
+    if len(windows) == 1:
+        return get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream,
+                                                st_date, ed_date, dpa_flag, parameter_ids)
+
+    app = current_app._get_current_object()
+
+    def fetch(args):
+        index, (start, end) = args
+        with app.app_context():
+            return get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream,
+                                                    start, end, dpa_flag, parameter_ids, track=(index == 0))
+
+    pool = ThreadPool(len(windows))
+    try:
+        results = pool.map(fetch, list(enumerate(windows)))
+    finally:
+        pool.close()
+        pool.join()
+
+    data = []
+    last_time = None
+    for (start, end), (result, status_code) in zip(windows, results):
+        if status_code != 200:
+            return result, status_code
+        if not isinstance(result, list):
+            # a gap in the data
+            current_app.logger.info('No particles from %s to %s: %s' % (start, end, str(result)[:200]))
+            continue
+        # window bounds are inclusive; drop particles already returned by the previous window
+        rows = result
+        if last_time is not None:
+            rows = [row for row in result if row['pk']['time'] > last_time]
+        if rows:
+            last_time = rows[-1]['pk']['time']
+        data.extend(rows)
+    return data, 200
+
+
+def _to_dataset(data, fields, stream=None):
+    '''
+    ParticleDataset for the fields, with the error messages used by get_data.
+    '''
+    try:
+        return ParticleDataset.from_particles(data, fields, stream=stream)
+    except KeyError as e:
+        if e.args[0] == 'time':
+            raise Exception('Time Variable Not Available')
+        raise Exception('Requested Data (%s) Not Available' % e.args[0])
+
+
 def get_multistream_data(stream1, stream2, instrument1, instrument2, var1, var2):
 
     from ooiservices.app.uframe.controller import split_stream_name, get_uframe_multi_stream_contents, validate_date_time
@@ -97,7 +225,12 @@ def get_multistream_data(stream1, stream2, instrument1, instrument2, var1, var2)
             if status_code != 200:
                 raise Exception(data)
             else:
-                return data, units
+                # uframe returns one particle list per stream, keyed by refdes-method-stream
+                datasets = {}
+                for key, rows in data.iteritems():
+                    fields = [var for var in (var1, var2) if rows and var in rows[0]]
+                    datasets[key] = _to_dataset(rows, fields)
+                return datasets, units
         else:
             message = 'Please Define Start and End Dates'
             current_app.logger.exception(message)
@@ -109,8 +242,8 @@ def get_multistream_data(stream1, stream2, instrument1, instrument2, var1, var2)
         raise Exception(message)
 
 
-def get_simple_data(stream, instrument, yfields, xfields, include_time=True):
-    from ooiservices.app.uframe.controller import split_stream_name, get_uframe_plot_contents_chunked, validate_date_time, to_bool_str
+def get_simple_data(stream, instrument, yfields, xfields, include_time=True, points=None):
+    from ooiservices.app.uframe.controller import split_stream_name, validate_date_time, to_bool_str
     '''
     get data from uframe
     '''
@@ -129,12 +262,13 @@ def get_simple_data(stream, instrument, yfields, xfields, include_time=True):
                 dpa_flag = "0"
 
             # data, status_code = get_uframe_stream_contents_chunked(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag)
-            data, status_code = get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag, parameter_ids)
+            data, status_code = _get_plot_particles(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag, parameter_ids, windowed=points is not None)
 
             if status_code != 200:
                 raise Exception(data)
             else:
-                return data, units_mapping
+                dataset = _to_dataset(data, yfields + xfields)
+                return decimate_dataset(dataset, points, yfields + xfields, decimation_method()), units_mapping
 
     except Exception as e:
         message = str(e.message)
@@ -142,8 +276,8 @@ def get_simple_data(stream, instrument, yfields, xfields, include_time=True):
         raise Exception(message)
 
 
-def get_data(stream, instrument, yfields, xfields, include_time=True):
-    from ooiservices.app.uframe.controller import split_stream_name, get_uframe_plot_contents_chunked, validate_date_time, to_bool_str
+def get_data(stream, instrument, yfields, xfields, include_time=True, points=None):
+    from ooiservices.app.uframe.controller import split_stream_name, validate_date_time, to_bool_str
     '''get data from uframe
     # -------------------
     # m@c: 02/01/2015
@@ -168,7 +302,7 @@ def get_data(stream, instrument, yfields, xfields, include_time=True):
                 dpa_flag = "0"
 
             # data, status_code = get_uframe_stream_contents_chunked(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag)
-            data, status_code = get_uframe_plot_contents_chunked(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag, parameter_ids)
+            data, status_code = _get_plot_particles(mooring, platform, instrument, stream_type, stream, st_date, ed_date, dpa_flag, parameter_ids, windowed=points is not None)
             if status_code != 200:
                 current_app.logger.exception(data)
                 raise Exception(data)
@@ -214,47 +348,18 @@ def get_data(stream, instrument, yfields, xfields, include_time=True):
                 current_app.logger.exception(message)
                 raise Exception(message)
 
-    # Initialize the data dicts
-    vals = [[] for field in xfields]
-    x = OrderedDict(zip(xfields, vals))
-    vals = [[] for field in yfields]
-    y = OrderedDict(zip(yfields, vals))
-
     if len(yfields) >= len(xfields):
         qaqc_fields = yfields
     else:
         qaqc_fields = xfields
 
-    # vals = [np.zeros(len(data)) for field in qaqc_fields]
-    vals = [[] for field in qaqc_fields]
-    qaqc = OrderedDict(zip(qaqc_fields, vals))
-
-    # Loop through rows of data and fill the response data
-    for ind, row in enumerate(data):
-        # used to handle multiple streams
-        if row['pk']['stream'] == stream:
-            # x
-            for xfield in xfields:
-                if xfield == 'time':
-                    x[xfield].append(float(row['pk']['time']))
-                else:
-                    x[xfield].append(row[xfield])
-                    key = xfield + '_qc_results'
-                    if key in row:
-                        qaqc[yfield].append(int(row[key]))
-                    # else:
-                    #     current_app.logger.exception('QAQC not found for {0}'.format(xfield))
-            # y
-            for yfield in yfields:
-                if yfield == 'time':
-                    y[yfield].append(float(row['pk']['time']))
-                else:
-                    y[yfield].append(row[yfield])
-                    key = yfield + '_qc_results'
-                    if key in row:
-                        qaqc[yfield].append(int(row[key]))
-                    # else:
-                    #     current_app.logger.exception('QAQC not found for {0}'.format(yfield))
+    # One pass per column over the particles; only rows of the requested stream are kept
+    dataset = ParticleDataset.from_particles(data, xfields + yfields, stream=stream)
+    # keep about one point per pixel, with the qc results of the points kept
+    dataset = decimate_dataset(dataset, points, xfields + yfields, decimation_method())
+    x = OrderedDict((xfield, dataset.column(xfield)) for xfield in xfields)
+    y = OrderedDict((yfield, dataset.column(yfield)) for yfield in yfields)
+    qaqc = OrderedDict((field, dataset.qc.get(field, np.array([], dtype=np.int64))) for field in qaqc_fields)
 
     # generate dict for the data thing
     resp_data = {'x': x,
@@ -265,7 +370,8 @@ def get_data(stream, instrument, yfields, xfields, include_time=True):
                  'y_field': yfields,
                  'y_units': y_units,
                  'dt_units': 'seconds since 1900-01-01 00:00:00',
-                 'qaqc': qaqc
+                 'qaqc': qaqc,
+                 'dataset': dataset
                  }
 
     return resp_data
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/dataset.py
+
+Columnar representation of uframe particle data.  A uframe response is a list
+of particle dicts; plotting and the data endpoints only need time, the
+requested parameters and their qc results, so those are pulled out once into
+named numpy arrays and the particle dicts can be dropped.
+'''
+import numpy as np
+from collections import OrderedDict
+
+QC_SUFFIX = '_qc_results'
+
+
+def _column(rows, getter, dtype=np.float64):
+    '''
+    Build one array from the rows.  Scalar columns go straight into a
+    preallocated array (np.fromiter, no intermediate list); columns holding
+    lists (binned adcp data) or missing values fall back to np.array.
+    '''
+    try:
+        return np.fromiter((getter(row) for row in rows), dtype=dtype, count=len(rows))
+    except (TypeError, ValueError):
+        values = [getter(row) for row in rows]
+        try:
+            return np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            return np.array(values, dtype=object)
+
+
+class ParticleDataset(object):
+    '''
+    time     float64 seconds since 1900-01-01 (from particle pk)
+    columns  parameter name -> array (one element per particle)
+    qc       parameter name -> int array of the <parameter>_qc_results bit mask
+    '''
+
+    def __init__(self, time, columns=None, qc=None, stream=None):
+        self.time = time
+        self.columns = columns if columns is not None else OrderedDict()
+        self.qc = qc if qc is not None else OrderedDict()
+        self.stream = stream
+
+    def __len__(self):
+        return len(self.time)
+
+    @classmethod
+    def from_particles(cls, particles, fields, stream=None):
+        '''
+        Build a dataset for the requested fields.  When stream is given, rows
+        from other streams (multiple stream responses) are skipped.  Raises
+        KeyError naming the first requested field missing from the data.
+        '''
+        rows = particles
+        if stream is not None and any(row['pk']['stream'] != stream for row in particles):
+            rows = [row for row in particles if row['pk']['stream'] == stream]
+
+        time = np.empty(0)
+        columns = OrderedDict()
+        qc = OrderedDict()
+        if rows:
+            first = rows[0]
+            if 'pk' not in first or 'time' not in first['pk']:
+                raise KeyError('time')
+            time = _column(rows, lambda row: row['pk']['time'])
+            for field in fields:
+                if field == 'time' or field in columns:
+                    continue
+                if field not in first:
+                    raise KeyError(field)
+                columns[field] = _column(rows, lambda row, f=field: row[f])
+                key = field + QC_SUFFIX
+                if key in first:
+                    qc[field] = _column(rows, lambda row, k=key: int(row.get(k, 0)), dtype=np.int64)
+
+        return cls(time, columns, qc, stream=stream)
+
+    def column(self, field):
+        if field == 'time':
+            return self.time
+        return self.columns[field]
+
+    def add_column(self, field, values, qc=None):
+        '''
+        Join a column from another dataset of the same length (interpolated
+        multiple stream requests).
+        '''
+        values = np.asarray(values)
+        if len(values) != len(self):
+            raise IndexError('column %s has %d values, dataset has %d' % (field, len(values), len(self)))
+        self.columns[field] = values
+        if qc is not None:
+            self.qc[field] = np.asarray(qc)
+
+    def take(self, indices):
+        '''
+        New dataset holding only the particles at indices (qc results included).
+        '''
+        columns = OrderedDict((field, values[indices]) for field, values in self.columns.iteritems())
+        qc = OrderedDict((field, values[indices]) for field, values in self.qc.iteritems())
+        return ParticleDataset(self.time[indices], columns, qc, stream=self.stream)
+
+    def qc_flags(self, field, plot_qaqc=0):
+        '''
+        QC results for field as selected by the plot 'qaqc' option: 0 none,
+        1-9 only particles flagged with that value, 10 and up every flag.
+        Returns an empty array when nothing is to be marked.
+        '''
+        flags = self.qc.get(field)
+        if flags is None or plot_qaqc < 1:
+            return np.array([], dtype=np.int64)
+        if plot_qaqc >= 10:
+            return flags
+        return np.where(flags == plot_qaqc, flags, 0)
+
+    def to_records(self):
+        '''
+        Particle dicts holding only time, the dataset columns and their qc
+        results, for the json data endpoints.
+        '''
+        names = ['time'] + self.columns.keys()
+        lists = [self.time.tolist()] + [values.tolist() for values in self.columns.itervalues()]
+        qc_names = [name + QC_SUFFIX for name in self.qc.iterkeys()]
+        qc_lists = [values.tolist() for values in self.qc.itervalues()]
+        records = []
+        for values in zip(*(lists + qc_lists)):
+            record = dict(zip(names, values[:len(names)]))
+            record.update(zip(qc_names, values[len(names):]))
+            pk = {'time': values[0]}
+            if self.stream is not None:
+                pk['stream'] = self.stream
+            record['pk'] = pk
+            records.append(record)
+        return records
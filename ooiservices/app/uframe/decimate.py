@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/decimate.py
+
+Reduce a time series to roughly the number of points a plot can show.
+Two methods are provided:
+
+    lttb    largest triangle three buckets; keeps the visually significant
+            point of each bucket (good default for line plots)
+    minmax  the minimum and maximum of each bucket (keeps every spike)
+
+Both return sorted indices into the original arrays so any other column
+(qc results, other parameters) can be subset the same way.
+'''
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, n_out):
+    '''
+    Largest triangle three buckets.  The first and last points are always
+    kept; the rest are split into n_out - 2 buckets and the point of each
+    bucket forming the largest triangle with the previously kept point and
+    the mean of the next bucket is kept.
+    '''
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # bucket i is edges[i]:edges[i + 1]; spacing >= 1 so no bucket is empty
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    sizes = np.diff(edges)
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    mean_x = (cum_x[edges[1:]] - cum_x[edges[:-1]]) / sizes
+    mean_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / sizes
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in xrange(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out):
+    '''
+    Index of the minimum and maximum of each of n_out / 2 equal buckets,
+    plus the first and last points.
+    '''
+    n = len(y)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n)
+
+    edges = np.floor(np.linspace(0, n, buckets + 1)).astype(np.int64)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    # sorted by bucket then value: the first of each bucket is its minimum, the last its maximum
+    order = np.lexsort((np.asarray(y), bucket))
+    keep = np.concatenate(([0, n - 1], order[edges[:-1]], order[edges[1:] - 1]))
+    return np.unique(keep)
+
+
+def decimate_indices(x, y, n_out, method='lttb'):
+    '''
+    Indices of the points to keep.  Points where x or y is not finite are
+    never kept; columns which are not 1-d numbers (binned data) are thinned
+    with an even stride instead.
+    '''
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    y = np.asarray(y)
+    if y.ndim != 1 or y.dtype.kind not in 'biuf':
+        return np.unique(np.floor(np.linspace(0, n - 1, n_out)).astype(np.int64))
+
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(valid) <= n_out:
+        return valid
+    if method == 'minmax':
+        keep = minmax_indices(y[valid], n_out)
+    else:
+        keep = lttb_indices(x[valid], y[valid], n_out)
+    return valid[keep]
+
+
+def _stride(n, n_out):
+    return np.unique(np.floor(np.linspace(0, n - 1, n_out)).astype(np.int64))
+
+
+def decimate_dataset(dataset, n_out, fields, method='lttb'):
+    '''
+    ParticleDataset reduced to at most n_out points, with their qc results:
+    each field gets an equal share of n_out and the points kept for each
+    are combined.
+    '''
+    if n_out is None or len(dataset) <= n_out:
+        return dataset
+    fields = [field for field in fields if field != 'time' and field in dataset.columns]
+    if not fields:
+        return dataset.take(_stride(len(dataset), n_out))
+
+    # minmax also keeps the first and last points
+    share = n_out // len(fields) - (2 if method == 'minmax' else 0)
+    share = max(4, share)
+    keep = np.unique(np.concatenate([decimate_indices(dataset.time, dataset.columns[field], share, method)
+                                     for field in fields]))
+    if len(keep) > n_out:
+        # more fields than n_out has room for
+        keep = keep[_stride(len(keep), n_out)]
+    return dataset.take(keep)
@@ -2,16 +2,14 @@ from flask import request, jsonify, make_response, current_app
 from ooiservices.app.uframe import uframe as api
 from ooiservices.app.main.authentication import auth
 from ooiservices.app.decorators import scope_required
-from ooiservices.app.uframe.assetController import get_events_by_ref_des
 from ooiservices.app.uframe.assetController import _uframe_headers,\
-    _compile_events
-from ooiservices.app import cache
+    _compile_events, _index_events
+from ooiservices.app import blob_cache, uframe_client
 from copy import deepcopy
 
 import json
 import requests
 
-requests.adapters.DEFAULT_RETRIES = 2
 CACHE_TIMEOUT = 86400
 
 
@@ -20,6 +18,72 @@ CACHE_TIMEOUT = 86400
 '''
 
 
+def store_events(events, timeout=CACHE_TIMEOUT):
+    '''
+    Cache the compiled event list with its reference designator index.
+    '''
+    blob_cache.set('event_list', events, timeout=timeout)
+    blob_cache.set('event_index', _index_events(events), timeout=timeout)
+
+
+def clear_events():
+    blob_cache.delete('event_list')
+    blob_cache.delete('event_index')
+
+
+def _get_event_list():
+    '''
+    The compiled event list, from cache or uframe.  Returns (events, None) or
+    (None, error response).
+    '''
+    cached = blob_cache.get('event_list')
+    if cached:
+        return cached, None
+
+    url = current_app.config['UFRAME_ASSETS_URL']\
+        + '/%s' % 'events'
+
+    payload = uframe_client.get(url)
+
+    try:
+        data = payload.json()
+    except ValueError:
+        # not json (a uframe or proxy html error page)
+        status_code = payload.status_code if payload.status_code != 200 else 500
+        return None, (jsonify({"events": {"error": "Malformed events response from uframe."}}), status_code)
+    if payload.status_code != 200:
+        return None, (jsonify({"events": data}), payload.status_code)
+
+    data = _compile_events(data)
+
+    if "error" not in data:
+        store_events(data)
+    return data, None
+
+
+def get_event_index():
+    '''
+    {'events': {ref_des: [event, ...]}, 'deployments': {ref_des: event}} for
+    the cached event list (see _index_events).  Empty when uframe is down.
+    '''
+    index = blob_cache.get('event_index')
+    if index is not None:
+        return index
+    try:
+        data, error = _get_event_list()
+    except requests.exceptions.ConnectionError as e:
+        current_app.logger.warning("Error: Cannot connect to uframe.  %s" % e)
+        data = None
+    if data is None:
+        return {'events': {}, 'deployments': {}}
+    index = blob_cache.get('event_index')
+    if index is None:
+        # event list cached without its index
+        index = _index_events(data)
+        blob_cache.set('event_index', index, timeout=CACHE_TIMEOUT)
+    return index
+
+
 @api.route('/events', methods=['GET'])
 def get_events():
     '''
@@ -30,31 +94,13 @@ def get_events():
         '''
         Listing GET request of all events.  This method is cached for 1 hour.
         '''
-        data = {}
-
-        cached = cache.get('event_list')
-        if cached:
-            data = cached
-
-        else:
-            url = current_app.config['UFRAME_ASSETS_URL']\
-                + '/%s' % 'events'
-
-            payload = requests.get(url)
-
-            data = payload.json()
-            if payload.status_code != 200:
-                return jsonify({"events": payload.json()}), payload.status_code
-
-            data = _compile_events(data)
-
-            if "error" not in data:
-                cache.set('event_list', data, timeout=CACHE_TIMEOUT)
-
         if request.args.get('ref_des') and request.args.get('ref_des') != "":
             ref_des = request.args.get('ref_des')
-            resp = get_events_by_ref_des(data, ref_des)
-            return resp
+            return jsonify({'events': get_event_index()['events'].get(ref_des, [])})
+
+        data, error = _get_event_list()
+        if error is not None:
+            return error
 
         if request.args.get('search') and request.args.get('search') != "":
             return_list = []
@@ -105,7 +151,7 @@ def get_event(id):
         data = {}
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('events', id)
-        payload = requests.get(url)
+        payload = uframe_client.get(url)
         data = payload.json()
         if payload.status_code != 200:
             return jsonify({"events": payload.json()}), payload.status_code
@@ -135,10 +181,10 @@ def create_event():
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('events', id)
         data['@class'] = data.pop('eventClass')
-        response = requests.post(url,
+        response = uframe_client.post(url,
                                  data=json.dumps(data),
                                  headers=_uframe_headers())
-        cache.delete('event_list')
+        clear_events()
         return response.text, response.status_code
 
     except requests.exceptions.ConnectionError as e:
@@ -154,10 +200,10 @@ def update_event(id):
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('events', id)
         data['@class'] = data.pop('eventClass')
-        response = requests.put(url,
+        response = uframe_client.put(url,
                                 data=json.dumps(data),
                                 headers=_uframe_headers())
-        cache.delete('event_list')
+        clear_events()
         return response.text, response.status_code
 
     except requests.exceptions.ConnectionError as e:
@@ -174,9 +220,9 @@ def delete_event(id):
     try:
         url = current_app.config['UFRAME_ASSETS_URL']\
             + '/%s/%s' % ('events', id)
-        response = requests.delete(url,
+        response = uframe_client.delete(url,
                                    headers=_uframe_headers())
-        cache.delete('event_list')
+        clear_events()
         return response.text, response.status_code
 
     except requests.exceptions.ConnectionError as e:
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/glider_tracks.py
+
+Glider tracks for /get_glider_tracks.
+
+Gliders are the engineering instruments (00-ENG000000) of the MOAS
+platforms.  Discovery walks the uframe levels (platform > glider >
+instrument > method > stream) with GLIDER_WORKERS concurrent requests, one
+task per glider, and the tracks are then compiled one task per glider.
+
+Each glider is stored on its own in blob_cache ('glider_track:<location>')
+as soon as it is compiled, next to the assembled 'glider_tracks' list.  An
+update starts from the stored glider: recovered gliders are reused as they
+are, telemetered ones only request the data after the last point of their
+track (last_requested).  A glider which fails keeps its stored track, and
+does not hold up or drop the others.
+
+Tracks are stored at full resolution; responses select from them with
+select_tracks: a glider name, bounding box and time window filter, and a
+Douglas-Peucker simplification (tolerance in degrees, or a map zoom
+level) limits the points shipped.  'glider_tracks' is sharded per glider
+in blob_cache, so a request for some gliders only loads their shards.
+'''
+
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+GLIDER_TRACKS_KEY = 'glider_tracks'
+GLIDER_KEY_PREFIX = 'glider_track:'
+ENG_INSTRUMENT = '00-ENG000000'
+COSMO_CONSTANT = 2208988800
+BAR_TO_M = 0.09804139432
+DATA_LIMIT = 1000
+ADDITIONAL_FIELDS = ('m_battery', 'm_lithium_battery_relative_charge', 'm_speed', 'm_vacuum')
+TRACK_FIELDS = ('coordinates', 'times', 'depths')
+
+
+def _column(rows, key):
+    return np.array([row.get(key) for row in rows], dtype=np.float64)
+
+
+def extract_track(rows, depth=None):
+    '''
+    LineString track of the particles in rows: the positions with a valid
+    latitude and longitude, their times and depths (in m, -999 when not
+    available).  depth is the depth parameter metadata (particleKey, units,
+    fillValue) or None.
+    '''
+    track = {'type': 'LineString', 'coordinates': [], 'times': [], 'units': None, 'depths': []}
+    if not rows:
+        return track
+    pk = rows[0]['pk']
+    track['name'] = pk['subsite'] + '-' + pk['node']
+    track['reference_designator'] = track['name'] + '-' + pk['sensor']
+
+    lon = _column(rows, 'longitude')
+    lat = _column(rows, 'latitude')
+    with np.errstate(invalid='ignore'):
+        keep = ~np.isnan(lon) & ~np.isnan(lat) & (np.abs(lon) < 180) & (np.abs(lat) < 90)
+    times = np.array([row['pk']['time'] for row in rows], dtype=np.float64)
+
+    depths = np.empty(len(rows))
+    depths.fill(-999)
+    if depth is not None and depth.get('units') in ('bar', 'm'):
+        values = _column(rows, depth['particleKey'])
+        try:
+            fill = float(depth.get('fillValue'))
+        except (TypeError, ValueError):
+            fill = np.nan
+        with np.errstate(invalid='ignore'):
+            valid = ~np.isnan(values) & (values != -999) & (values != fill)
+        if valid[keep].any():
+            scale = BAR_TO_M if depth['units'] == 'bar' else 1.0
+            depths[valid] = values[valid] * scale
+            track['units'] = 'm'
+
+    track['coordinates'] = np.column_stack((lon[keep], lat[keep])).tolist()
+    track['times'] = times[keep].tolist()
+    track['depths'] = depths[keep].tolist()
+    return track
+
+
+def merge_track(track, delta):
+    '''
+    Append the points of delta after the last time of track.
+    '''
+    if not track or not track.get('times'):
+        return delta
+    newer = np.nonzero(np.array(delta['times'], dtype=np.float64) > track['times'][-1])[0]
+    for key in TRACK_FIELDS:
+        values = delta.get(key) or []
+        track.setdefault(key, []).extend([values[i] for i in newer])
+    if track.get('units') is None:
+        track['units'] = delta.get('units')
+    return track
+
+
+def zoom_tolerance(zoom):
+    '''
+    Simplification tolerance (degrees) of about one pixel at a web map zoom level.
+    '''
+    return 360.0 / (256 * 2 ** float(zoom))
+
+
+def simplify_indices(points, tolerance):
+    '''
+    Indices of the points (n x 2 array) kept by Douglas-Peucker
+    simplification: no dropped point is further than tolerance from the
+    simplified line.  The distances of a span are computed in one pass.
+    '''
+    count = len(points)
+    if count < 3 or not tolerance:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    spans = [(0, count - 1)]
+    while spans:
+        first, last = spans.pop()
+        if last - first < 2:
+            continue
+        start = points[first]
+        dx, dy = points[last] - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distance = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / length
+        farthest = distance.argmax()
+        if distance[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            spans.append((first, index))
+            spans.append((index, last))
+    return np.nonzero(keep)[0]
+
+
+def select_track(track, bbox=None, start=None, end=None, tolerance=None):
+    '''
+    Copy of track with the points inside bbox (min_lon, min_lat, max_lon,
+    max_lat) and between start and end (track times), simplified with
+    tolerance (degrees).  The stored track is not modified.
+    '''
+    times = np.array(track.get('times') or [], dtype=np.float64)
+    coordinates = np.array(track.get('coordinates') or [], dtype=np.float64).reshape(-1, 2)
+    keep = np.ones(len(times), dtype=bool)
+    if start is not None:
+        keep &= times >= start
+    if end is not None:
+        keep &= times <= end
+    if bbox is not None:
+        lon, lat = coordinates[:, 0], coordinates[:, 1]
+        keep &= (lon >= bbox[0]) & (lat >= bbox[1]) & (lon <= bbox[2]) & (lat <= bbox[3])
+    index = np.nonzero(keep)[0]
+    if tolerance:
+        index = index[simplify_indices(coordinates[index], tolerance)]
+
+    selected = dict(track)
+    selected['coordinates'] = coordinates[index].tolist()
+    selected['times'] = times[index].tolist()
+    selected['depths'] = np.array(track.get('depths') or [], dtype=np.float64)[index].tolist() \
+        if len(track.get('depths') or []) == len(times) else []
+    selected['total_points'] = len(times)
+    return selected
+
+
+def select_tracks(gliders, names=None, **options):
+    '''
+    The gliders named in names (e.g. CP05MOAS-GL340, all when None) with
+    their tracks selected by select_track(**options).
+    '''
+    selected = []
+    for glider in gliders:
+        if names is not None and glider_name(glider) not in names:
+            continue
+        glider = dict(glider)
+        if glider.get('track'):
+            glider['track'] = select_track(glider['track'], **options)
+        selected.append(glider)
+    return selected
+
+
+def glider_name(glider):
+    '''
+    <platform>-<glider> of a glider location, e.g. CP05MOAS-GL340.
+    '''
+    return '-'.join(glider['location'].split('/')[1:3])
+
+
+def select_method(methods):
+    '''
+    (method, is_recovered): recovered_host when available, else telemetered.
+    '''
+    if 'recovered_host' in methods:
+        return 'recovered_host', True
+    elif 'telemetered' in methods:
+        return 'telemetered', False
+    return None, None
+
+
+class GliderTrackService(object):
+
+    def __init__(self, client, base_url, timeout=None, workers=8, cache_timeout=None):
+        self.client = client
+        self.base_url = base_url
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self.cache_timeout = cache_timeout
+        self.counts = {'gliders': 0, 'skipped': 0, 'reused': 0, 'updated': 0,
+                       'compiled': 0, 'failed': 0}
+
+    @classmethod
+    def from_config(cls, app, client, cache_timeout=None):
+        config = app.config
+        return cls(client, config['UFRAME_URL'] + config['UFRAME_URL_BASE'],
+                   timeout=(config['UFRAME_TIMEOUT_CONNECT'], config['UFRAME_TIMEOUT_READ']),
+                   workers=int(config.get('GLIDER_WORKERS', 8)),
+                   cache_timeout=cache_timeout)
+
+    def _get(self, url):
+        response = self.client.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _load(self, location):
+        from ooiservices.app import blob_cache
+        return blob_cache.get(GLIDER_KEY_PREFIX + location)
+
+    def _store(self, glider):
+        from ooiservices.app import blob_cache
+        blob_cache.set(GLIDER_KEY_PREFIX + glider['location'], glider, timeout=self.cache_timeout)
+
+    # discovery
+
+    def _platform(self, platform):
+        '''
+        (platform, gliders or None when the listing failed)
+        '''
+        try:
+            return platform, self._get(self.base_url + '/' + platform)
+        except Exception:
+            return platform, None
+
+    def _outline(self, item):
+        '''
+        The glider at /platform/glider: None when it has no engineering
+        instrument, the prefix of its location when it cannot be read.
+        '''
+        platform, glider = item
+        location = '/' + platform + '/' + glider
+        try:
+            instruments = self._get(self.base_url + location)
+            if ENG_INSTRUMENT not in instruments:
+                return None
+            location += '/' + ENG_INSTRUMENT
+            metadata_url = self.base_url + location
+            methods = self._get(metadata_url)
+            method, is_recovered = select_method(methods)
+            streams = self._get(metadata_url + '/' + method)
+            metadata = self._get(metadata_url + '/metadata')
+            stream = streams[0]
+            times = depth = None
+            for t in metadata['times']:
+                if t['method'] == method and t['stream'] == stream:
+                    times = {'begin_time': t['beginTime'], 'end_time': t['endTime'],
+                             'last_updated': None, 'last_requested': None}
+                    break
+            for p in metadata['parameters']:
+                # the engineering stream always has m_depth
+                if p['stream'] == stream and p['particleKey'] == 'm_depth':
+                    depth = p
+            location += '/' + method + '/' + stream
+            return {'times': times,
+                    'url': self.base_url + location,
+                    'location': location,
+                    'instrument': ENG_INSTRUMENT,
+                    'method': method,
+                    'stream': stream,
+                    'depth': depth,
+                    'available_instruments': instruments,
+                    'available_methods': methods,
+                    'available_streams': streams,
+                    'is_recovered': is_recovered,
+                    'glider_metadata_url': metadata_url,
+                    'parameters': metadata['parameters']}
+        except Exception:
+            return location + '/'
+
+    def discover(self, pool):
+        '''
+        (glider outlines, location prefixes which could not be read)
+        '''
+        platforms = [p for p in self._get(self.base_url) if 'MOAS' in p]
+        failed = []
+        gliders = []
+        for platform, names in pool.map(self._platform, platforms):
+            if names is None:
+                failed.append('/' + platform + '/')
+            else:
+                gliders.extend((platform, name) for name in names)
+
+        outlines = []
+        for outline in pool.map(self._outline, gliders):
+            if outline is None:
+                self.counts['skipped'] += 1
+            elif isinstance(outline, basestring):
+                failed.append(outline)
+            else:
+                outlines.append(outline)
+        return outlines, failed
+
+    # tracks
+
+    def _additional_data(self, glider):
+        '''
+        Latest battery, vacuum and speed values of the engineering stream.
+        '''
+        if glider['is_recovered']:
+            stream, method = 'glider_eng_recovered', 'recovered_host'
+        else:
+            stream, method = 'glider_eng_telemetered', 'telemetered'
+        if stream not in glider['available_streams']:
+            return
+        fields = [p for p in glider['parameters']
+                  if p['stream'] == stream and p['particleKey'] in ADDITIONAL_FIELDS]
+        request = '?limit=2'
+        if fields:
+            request += '&parameters=' + ','.join(str(p['pdId']) for p in fields)
+        response = self.client.get(glider['glider_metadata_url'] + '/' + method + '/' + stream + request,
+                                   timeout=self.timeout)
+        if response.status_code != 200:
+            return
+        # newest first
+        entry = response.json()[0]
+        glider['metadata'] = {'time': entry['pk']['time']}
+        for field in fields:
+            if field['particleKey'] in entry:
+                glider['metadata'][field['particleKey']] = dict(field, value=entry[field['particleKey']])
+
+    def _request_track(self, glider, start=None):
+        request = '?limit=%d' % DATA_LIMIT
+        if glider['depth'] is not None:
+            request += '&parameters=' + str(glider['depth']['pdId'])
+        if start is not None:
+            request += '&startdt=' + start + '&enddt=' + glider['times']['end_time']
+        return extract_track(self._get(glider['url'] + request), glider['depth'])
+
+    def _track(self, glider, previous):
+        '''
+        glider with its track; previous is the stored glider or None.
+        '''
+        if previous is not None and previous.get('is_recovered') and previous.get('track'):
+            # recovered data does not change
+            self.counts['reused'] += 1
+            return previous
+
+        self._additional_data(glider)
+        track = previous.get('track') if previous is not None else None
+        if track and track.get('times'):
+            if previous['times'].get('end_time') == glider['times']['end_time']:
+                glider['track'] = track
+                glider['times']['last_updated'] = previous['times'].get('last_updated')
+            else:
+                # only the data after the last point of the stored track
+                last = datetime.utcfromtimestamp(track['times'][-1] - COSMO_CONSTANT)
+                start = last.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (last.microsecond // 1000)
+                glider['track'] = merge_track(track, self._request_track(glider, start))
+                glider['times']['last_updated'] = str(datetime.utcnow())
+            self.counts['updated'] += 1
+        else:
+            glider['track'] = self._request_track(glider)
+            glider['times']['last_updated'] = str(datetime.utcnow())
+            self.counts['compiled'] += 1
+        if glider['track']['times']:
+            glider['times']['last_requested'] = glider['track']['times'][-1] - COSMO_CONSTANT
+        return glider
+
+    def _compile_one(self, item):
+        glider, update = item
+        previous = self._load(glider['location']) if update else None
+        try:
+            tracked = self._track(glider, previous)
+        except Exception:
+            self.counts['failed'] += 1
+            return previous
+        if tracked is not previous:
+            del tracked['parameters']
+            self._store(tracked)
+        return tracked
+
+    def compile(self, update=True):
+        '''
+        Discover the gliders and compile their tracks; with update, stored
+        gliders are reused or extended instead of requested again.
+        Returns the list of gliders, which is also stored as 'glider_tracks'.
+        '''
+        from ooiservices.app import blob_cache
+        pool = ThreadPool(self.workers)
+        try:
+            outlines, failed = self.discover(pool)
+            gliders = pool.map(self._compile_one, [(outline, update) for outline in outlines])
+        finally:
+            pool.close()
+            pool.join()
+
+        gliders = [glider for glider in gliders if glider is not None]
+        if failed:
+            # keep the stored gliders of the platforms and gliders which could not be read
+            known = set(glider['location'] for glider in gliders)
+            for glider in blob_cache.get(GLIDER_TRACKS_KEY) or []:
+                if glider['location'] not in known and glider['location'].startswith(tuple(failed)):
+                    gliders.append(glider)
+        gliders.sort(key=lambda glider: glider['location'])
+        self.counts['gliders'] = len(gliders)
+        blob_cache.set(GLIDER_TRACKS_KEY, gliders, timeout=self.cache_timeout)
+        return gliders
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/hyrax_crawler.py
+
+Crawler for the HYRAX large format store (IMAGE_CAMERA_STORE), laid out as
+
+    <root>/<ref-des>/<year>/<month>/<day>/<files>
+
+Each level is fetched concurrently (HYRAX_CRAWL_WORKERS threads over the
+shared uframe_client connection pool) and every folder listing is fetched
+and parsed once; the files of a day folder are classified by extension from
+that one listing.  Listings are checkpointed in blob_cache
+('hyrax_listings') with their ETag / Last-Modified, so a rerun
+
+    - does not request folders whose dates are over (older than
+      HYRAX_SEAL_DAYS days), which cannot get new files, and
+    - revalidates the others with If-None-Match / If-Modified-Since, reusing
+      the stored listing on 304 Not Modified,
+
+and the time to rebuild the caches follows the new files, not the archive.
+'''
+
+import calendar
+from datetime import date, timedelta
+from multiprocessing.pool import ThreadPool
+
+from bs4 import BeautifulSoup
+
+LISTINGS_KEY = 'hyrax_listings'
+LISTINGS_TIMEOUT = 30 * 86400
+
+
+def _folder_base(url):
+    return url.split('contents.html')[0]
+
+
+def _folder_name(url):
+    '''
+    Name of the folder a '.../<name>/contents.html' link points at.
+    '''
+    return _folder_base(url).rstrip('/').split('/')[-1]
+
+
+def _sealed(path, cutoff):
+    '''
+    True when every date under path ([year[, month[, day]]]) is before cutoff.
+    '''
+    try:
+        parts = [int(part) for part in path]
+    except ValueError:
+        return False
+    if not parts:
+        return False
+    year = parts[0]
+    month = parts[1] if len(parts) > 1 else 12
+    day = parts[2] if len(parts) > 2 else calendar.monthrange(year, month)[1]
+    try:
+        return date(year, month, day) < cutoff
+    except ValueError:
+        return False
+
+
+class HyraxCrawler(object):
+
+    def __init__(self, client, workers=8, seal_days=2, listings=None):
+        self.client = client
+        self.workers = max(1, workers)
+        self.cutoff = date.today() - timedelta(days=seal_days)
+        # folder url -> {'links': [hrefs], 'etag': .., 'modified': ..}
+        self.listings = listings if listings is not None else {}
+        self.counts = {'fetched': 0, 'not_modified': 0, 'sealed': 0, 'failed': 0}
+
+    @classmethod
+    def from_config(cls, app, client):
+        from ooiservices.app import blob_cache
+        return cls(client,
+                   workers=int(app.config.get('HYRAX_CRAWL_WORKERS', 8)),
+                   seal_days=int(app.config.get('HYRAX_SEAL_DAYS', 2)),
+                   listings=blob_cache.get(LISTINGS_KEY) or {})
+
+    def save(self):
+        from ooiservices.app import blob_cache
+        blob_cache.set(LISTINGS_KEY, self.listings, timeout=LISTINGS_TIMEOUT)
+
+    def listing(self, url, sealed=False):
+        '''
+        hrefs of the folder at url; from the checkpoint when the folder is
+        sealed or unchanged.  A failed fetch falls back to the checkpoint.
+        '''
+        checkpoint = self.listings.get(url)
+        if checkpoint is not None and sealed:
+            self.counts['sealed'] += 1
+            return checkpoint['links']
+
+        headers = {}
+        if checkpoint is not None:
+            if checkpoint.get('etag'):
+                headers['If-None-Match'] = checkpoint['etag']
+            if checkpoint.get('modified'):
+                headers['If-Modified-Since'] = checkpoint['modified']
+        try:
+            response = self.client.get(url, headers=headers)
+        except Exception:
+            self.counts['failed'] += 1
+            return checkpoint['links'] if checkpoint is not None else []
+
+        if response.status_code == 304 and checkpoint is not None:
+            self.counts['not_modified'] += 1
+            return checkpoint['links']
+        if response.status_code != 200:
+            self.counts['failed'] += 1
+            return checkpoint['links'] if checkpoint is not None else []
+
+        soup = BeautifulSoup(response.content, "html.parser")
+        links = [a.attrs['href'] for a in soup.findAll('a')
+                 if 'href' in a.attrs and not a.attrs['href'].startswith('..')]
+        self.listings[url] = {'links': links,
+                              'etag': response.headers.get('ETag'),
+                              'modified': response.headers.get('Last-Modified')}
+        self.counts['fetched'] += 1
+        return links
+
+    def _map(self, pool, items):
+        '''
+        items: (url, path, sealed); returns [(url, path, hrefs)].
+        '''
+        listings = pool.map(lambda item: self.listing(item[0], item[2]), items)
+        return [(url, path, hrefs) for (url, path, _), hrefs in zip(items, listings)]
+
+    def crawl(self, root, folder_filter, extensions, path_filter=None):
+        '''
+        Walk root and return {ref_des: {year: {month: {day: {ext: [file urls]}}}}}
+        for the reference designator folders accepted by folder_filter(href).
+        path_filter([ref_des, year, ...]) may prune folders (testing).
+        '''
+        pool = ThreadPool(self.workers)
+        try:
+            folders = []
+            for href in self.listing(root):
+                if 'contents.html' in href and folder_filter(href):
+                    ref_url = root + href
+                    path = [_folder_name(ref_url)]
+                    if path_filter is None or path_filter(path):
+                        folders.append((ref_url, path, False))
+
+            # year, month, day: one concurrent pass per level
+            for level in range(3):
+                children = []
+                for url, path, hrefs in self._map(pool, folders):
+                    for href in hrefs:
+                        if 'contents.html' not in href:
+                            continue
+                        child_url = _folder_base(url) + href
+                        child_path = path + [_folder_name(child_url)]
+                        if path_filter is not None and not path_filter(child_path):
+                            continue
+                        children.append((child_url, child_path, _sealed(child_path[1:], self.cutoff)))
+                folders = children
+
+            files = {}
+            for url, path, hrefs in self._map(pool, folders):
+                ref_des, year, month, day = path
+                by_ext = files.setdefault(ref_des, {}).setdefault(year, {}).setdefault(month, {})\
+                    .setdefault(day, dict((ext, []) for ext in extensions))
+                for href in hrefs:
+                    for ext in extensions:
+                        if ext in href:
+                            by_ext[ext].append(_folder_base(url) + href)
+                            break
+            return files
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/plot_pool.py
+
+Plot rendering off the request threads.  matplotlib (pyplot) keeps global
+state and is not thread safe, and a large windrose or 3d scatter can hold a
+worker for a long time, so generate_plot runs in a small pool of forked
+processes (PLOT_WORKERS, each recycled after PLOT_WORKER_MAX_TASKS plots).
+The processes are forked when a web worker starts (start(): the uwsgi
+postfork hook, or manage.py as imported by a gunicorn worker), never from a
+request thread; a process without them renders in the request thread, one
+plot at a time.
+
+    - every render is limited to PLOT_RENDER_TIMEOUT seconds (SIGALRM in the
+      worker, so a runaway render frees its process)
+    - at most PLOT_QUEUE_LIMIT renders may be queued or running per web
+      process; beyond that PlotQueueFull is raised (the route answers 503)
+    - /uframe/plot?async=true runs the whole request in the background and
+      returns a job id; the result is kept in redis for PLOT_JOB_TTL seconds
+      and fetched from /uframe/plot_job/<job_id> by any web process.  A job
+      holds its place in the PLOT_QUEUE_LIMIT queue until it is done (its
+      render does not take a second one).
+'''
+
+import json
+import os
+import signal
+import threading
+import uuid
+from multiprocessing import Pool, TimeoutError
+from multiprocessing.pool import ThreadPool
+
+PLOT_JOB_PREFIX = 'plot_job:'
+
+# the flask app in a pool worker process (set by _init_worker after the fork)
+_worker_app = None
+
+
+class PlotQueueFull(Exception):
+    pass
+
+
+class PlotTimeout(Exception):
+    pass
+
+
+def _init_worker(app):
+    global _worker_app
+    _worker_app = app
+    # the worker serves plots only; leave ctrl-c handling to the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _alarm(signum, frame):
+    raise PlotTimeout('Plot rendering timed out')
+
+
+def _render(data, plot_options, timeout):
+    '''
+    Runs in a pool worker: render the plot.  Returns ('ok', image bytes),
+    ('timeout', message) or ('error', message); errors are returned rather
+    than raised so the completion callback always runs in the parent.
+    '''
+    from ooiservices.app.uframe.plotting import generate_plot
+    signal.signal(signal.SIGALRM, _alarm)
+    signal.alarm(timeout)
+    try:
+        with _worker_app.app_context():
+            return 'ok', generate_plot(data, plot_options).read()
+    except PlotTimeout:
+        return 'timeout', 'Plot rendering timed out after %d seconds' % timeout
+    except Exception as err:
+        return 'error', str(err.message or err)
+    finally:
+        signal.alarm(0)
+
+
+class PlotWorkerPool(object):
+
+    def __init__(self):
+        self._pool = None
+        self._jobs = None
+        self._jobs_pid = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        # serializes renders in this process when it has no render processes
+        self._render_lock = threading.Lock()
+        self._warned = False
+        # set in an async job's thread, which holds a queue place for its render
+        self._local = threading.local()
+
+    def init_app(self, app):
+        '''
+        Start the render processes in each uwsgi worker after it is forked.
+        '''
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['plot_pool'] = self
+        try:
+            import uwsgi
+        except ImportError:
+            return
+        if uwsgi.worker_id() > 0:
+            # lazy-apps: the app is loaded in the worker
+            self.start(app)
+        else:
+            from uwsgidecorators import postfork
+            postfork(lambda: self.start(app))
+
+    def start(self, app):
+        '''
+        Fork the render processes of this web worker process.
+        '''
+        if not app.config.get('PLOT_POOL_ENABLED', True):
+            return
+        pid = os.getpid()
+        with self._lock:
+            if self._pool is not None and self._pid == pid:
+                return
+            workers, _, _, max_tasks = self._config(app)
+            self._pool = Pool(processes=workers, initializer=_init_worker, initargs=(app,),
+                              maxtasksperchild=max_tasks)
+            self._pid = pid
+            self._pending = 0
+
+    def _config(self, app):
+        config = app.config
+        return (int(config.get('PLOT_WORKERS', 2)),
+                int(config.get('PLOT_QUEUE_LIMIT', 8)),
+                int(config.get('PLOT_RENDER_TIMEOUT', 60)),
+                int(config.get('PLOT_WORKER_MAX_TASKS', 100)))
+
+    def _get_pool(self, app):
+        '''
+        This process' render pool, or None when start() did not run in it (a
+        forked web worker must not use its parent's pool).
+        '''
+        if self._pool is None or self._pid != os.getpid():
+            if not self._warned:
+                self._warned = True
+                app.logger.warning('No plot render processes in process %d; rendering in request threads.'
+                                   % os.getpid())
+            return None
+        return self._pool
+
+    def _reserved(self):
+        return getattr(self._local, 'reserved', False)
+
+    def _reserve(self, limit):
+        with self._lock:
+            if self._pending >= limit:
+                raise PlotQueueFull('Plot service busy, %d plots queued' % self._pending)
+            self._pending += 1
+
+    def _release(self, *args):
+        with self._lock:
+            if self._pending > 0:
+                self._pending -= 1
+
+    def render(self, data, plot_options):
+        '''
+        Render in the pool and wait; returns the image bytes.  Raises
+        PlotQueueFull, PlotTimeout or the exception raised by generate_plot.
+        With PLOT_POOL_ENABLED off the plot is rendered in this thread.
+        '''
+        from flask import current_app
+        app = current_app._get_current_object()
+        if not app.config.get('PLOT_POOL_ENABLED', True):
+            from ooiservices.app.uframe.plotting import generate_plot
+            return generate_plot(data, plot_options).read()
+
+        workers, limit, timeout, _ = self._config(app)
+        pool = self._get_pool(app)
+        # an async job already holds a queue place for its render
+        reserved = self._reserved()
+        if not reserved:
+            self._reserve(limit)
+        if pool is None:
+            from ooiservices.app.uframe.plotting import generate_plot
+            try:
+                with self._render_lock:
+                    return generate_plot(data, plot_options).read()
+            finally:
+                if not reserved:
+                    self._release()
+
+        # the counter is released when the worker finishes, even after we stop waiting
+        result = pool.apply_async(_render, (data, plot_options, timeout),
+                                  callback=None if reserved else self._release)
+        try:
+            # queued jobs wait behind running ones; the worker enforces the render timeout
+            status, value = result.get(timeout * (1 + limit / max(workers, 1)))
+        except TimeoutError:
+            raise PlotTimeout('Plot rendering timed out after %d seconds' % timeout)
+        except Exception:
+            # the job never reached a worker (callback will not run)
+            if not reserved:
+                self._release()
+            raise
+        if status == 'timeout':
+            raise PlotTimeout(value)
+        if status == 'error':
+            raise Exception(value)
+        return value
+
+    def pending(self):
+        return self._pending
+
+    def check_capacity(self):
+        '''
+        Fail fast (before fetching any data) when the render queue is full.
+        '''
+        from flask import current_app
+        if self._reserved():
+            return
+        _, limit, _, _ = self._config(current_app)
+        if self._pending >= limit:
+            raise PlotQueueFull('Plot service busy, %d plots queued' % self._pending)
+
+    def submit_request(self, view, path, headers):
+        '''
+        Run view() in the background under a copy of the current request and
+        keep its response in redis.  Returns the job id.  Raises PlotQueueFull.
+        '''
+        from flask import current_app
+        from ooiservices.app import redis_store
+        app = current_app._get_current_object()
+        _, limit, _, _ = self._config(app)
+        ttl = int(app.config.get('PLOT_JOB_TTL', 600))
+        job_id = uuid.uuid4().hex
+
+        def run():
+            self._local.reserved = True
+            try:
+                try:
+                    with app.test_request_context(path, headers=headers):
+                        response = app.make_response(view())
+                        status = {'status': 'done', 'status_code': response.status_code,
+                                  'content_type': response.headers.get('Content-Type'),
+                                  'etag': response.headers.get('ETag')}
+                        body = response.get_data()
+                except Exception as err:
+                    status = {'status': 'error', 'error': str(err)}
+                    body = ''
+                redis_store.setex(PLOT_JOB_PREFIX + job_id, ttl, json.dumps(status) + '\n' + body)
+            finally:
+                self._local.reserved = False
+                self._release()
+
+        # async requests count against the same queue limit as renders, until they are done
+        self._reserve(limit)
+        try:
+            redis_store.setex(PLOT_JOB_PREFIX + job_id, ttl, json.dumps({'status': 'pending'}))
+            with self._lock:
+                if self._jobs is None or self._jobs_pid != os.getpid():
+                    self._jobs = ThreadPool(max(1, limit))
+                    self._jobs_pid = os.getpid()
+                jobs = self._jobs
+            jobs.apply_async(run)
+        except Exception:
+            self._release()
+            raise
+        return job_id
+
+    @staticmethod
+    def job_result(job_id):
+        '''
+        (status dict, body) for a job, or (None, None) when unknown or expired.
+        '''
+        from ooiservices.app import redis_store
+        payload = redis_store.get(PLOT_JOB_PREFIX + job_id)
+        if payload is None:
+            return None, None
+        if '\n' in payload:
+            status, body = payload.split('\n', 1)
+        else:
+            status, body = payload, ''
+        return json.loads(status), body
+
+
+plot_pool = PlotWorkerPool()
@@ -90,8 +90,8 @@ class OOIPlots(object):
             ylim = ax.get_ylim()
             for event in events['events']:
                 time = datestr2num(event['start_date'])
-                x = np.array([time, time])
-                h = ax.plot(x, ylim, '--', label=event['class'])
+                event_x = np.array([time, time])
+                h = ax.plot(event_x, ylim, '--', label=event['eventClass'])
 
             legend = ax.legend()
             if legend:
@@ -576,18 +576,7 @@ class OOIPlots(object):
             ydata = data['y'][ylabel]
 
             # Handle the QAQC data
-            qaqc = data['qaqc'][ylabel]
-            if plot_qaqc >= 10:
-                # Plot all of the qaqc flags results
-                # qaqc_data = data['qaqc'][ylabel]
-                pass
-            elif plot_qaqc >= 1:
-                # This is a case where the user wants to plot just one of the 9 QAQC tests
-                ind = np.where(qaqc != plot_qaqc)
-                qaqc[ind] = 0
-
-            else:
-                qaqc = []
+            qaqc = data['dataset'].qc_flags(ylabel, plot_qaqc)
 
             h, = y_axis[ind].plot(xdata, ydata, colors[ind], label=data['title'], **kwargs)
             if len(qaqc) > 0:
@@ -4,7 +4,6 @@ ooiservices/app/main/plotting.py
 
 Support for generating svg plots
 '''
-from flask import request
 from netCDF4 import num2date
 from ooiservices.app.uframe.plot_tools import OOIPlots
 import matplotlib.pyplot as plt
@@ -108,18 +107,8 @@ def generate_plot(data, plot_options):
             x = data['x'][xlabel]
             y = data['y'][ylabel]
 
-            # QAQC logic
-            if plot_qaqc >= 10:
-                # Plot all of the qaqc flags results
-                qaqc_data = data['qaqc'][ylabel]
-
-            elif plot_qaqc >= 1:
-                # This is a case where the user wants to plot just one of the 9 QAQC tests
-                ind = np.where(data['qaqc'][ylabel] != plot_qaqc)
-                data['qaqc'][ylabel][ind] = 0
-                qaqc_data = data['qaqc'][ylabel]
-            else:
-                qaqc_data = []
+            # QAQC logic: all flags (>= 10), one of the 9 QAQC tests (1-9) or none
+            qaqc_data = data['dataset'].qc_flags(ylabel, plot_qaqc)
 
             ooi_plots.plot_time_series(fig, is_timeseries, ax, x, y,
                                        title=data['title'],
@@ -139,18 +128,10 @@ def generate_plot(data, plot_options):
             xdata['time'] = data['x']['time']
             ydata = data['y']
             units = data['y_units']
-            for ind, key in enumerate(ydata):
+            qaqc = {}
+            for key in ydata:
                 xdata[key] = data['x']['time']
-                # QAQC logic
-                if plot_qaqc >= 10:
-                    # Plot all of the qaqc flags results
-                    pass
-                elif plot_qaqc >= 1:
-                    # This is a case where the user wants to plot just one of the 9 QAQC tests
-                    ind = np.where(data['qaqc'][key] != plot_qaqc)
-                    data['qaqc'][key][ind] = 0
-                else:
-                    data['qaqc'][key] = []
+                qaqc[key] = data['dataset'].qc_flags(key, plot_qaqc)
 
             ooi_plots.plot_multiple_yaxes(fig, ax,
                                           xdata,
@@ -163,7 +144,7 @@ def generate_plot(data, plot_options):
                                           tick_font=tick_font,
                                           scatter = use_scatter,
                                           width_in = width_in,
-                                          qaqc=data['qaqc'],
+                                          qaqc=qaqc,
                                           **kwargs)
 
     elif plot_layout == "depthprofile":
@@ -174,15 +155,12 @@ def generate_plot(data, plot_options):
         current_app.logger.debug('Plotting Depth Profile')
         # Define some plot parameters
         kwargs = dict(linewidth=1.5, alpha=0.7)
-        xlabel = data['x_field'] + " (" + request.args.get('x_units') + ")"
-        ylabel = data['y_field'] + " (" + request.args.get('y_units') + ")"
+        xlabel = data['x_field'] + " (" + plot_options['x_units'] + ")"
+        ylabel = data['y_field'] + " (" + plot_options['y_units'] + ")"
 
         if plot_profile_id is None:
 
-            for profile_id in range(0, np.shape(data['x'])[0]):
-                # Remove the bad data
-                qaqc_data = data['qaqc'][data['x_field']]
-
+            for profile_id in range(0, len(data['x'])):
                 ooi_plots.plot_profile(fig,
                                        ax,
                                        data['x'][profile_id],
@@ -194,7 +172,7 @@ def generate_plot(data, plot_options):
                                        scatter=use_scatter,
                                        **kwargs)
         else:
-            if int(plot_profile_id) < int(np.shape(data['x'])[0]):
+            if int(plot_profile_id) < len(data['x']):
                 # get the profile selected
                 ooi_plots.plot_profile(fig,
                                        ax,
@@ -279,8 +257,8 @@ def generate_plot(data, plot_options):
         start_dt = mdates.date2num(datetime.strptime(start.split('.')[0], '%Y-%m-%dT%H:%M:%S'))
         end_dt = mdates.date2num(datetime.strptime(end.split('.')[0], '%Y-%m-%dT%H:%M:%S'))
 
-        u = np.array(data['y'][data['y_field'][0]])
-        v = np.array(data['y'][data['y_field'][1]])
+        u = data['y'][data['y_field'][0]]
+        v = data['y'][data['y_field'][1]]
         ylabel = "Velocity" + " (" + data['y_units'][0] + ")"
 
         # # Mask the bad data
@@ -314,7 +292,7 @@ def generate_plot(data, plot_options):
         current_app.logger.debug('Plotting Stacked')
 
         time = mdates.date2num(data['x']['time'])
-        z = np.array(data['y'][data['y_field'][0]])
+        z = data['y'][data['y_field'][0]]
         label = data['y_field'][0] + " (" + data['y_units'][0] + ")"
 
         ooi_plots.plot_stacked_time_series(fig, ax, time, np.arange(len(z[0]))[::-1], z.transpose(),
@@ -336,9 +314,9 @@ def generate_plot(data, plot_options):
         xlabel = data['y_field'][0]
         ylabel = data['y_field'][1]
         zlabel = data['y_field'][2]
-        x = np.array(data['y'][xlabel])
-        y = np.array(data['y'][ylabel])
-        z = np.array(data['y'][zlabel])
+        x = data['y'][xlabel]
+        y = data['y'][ylabel]
+        z = data['y'][zlabel]
 
         # # Mask the bad data
         # qaqc_x = data['qaqc'][xlabel] < 1
@@ -370,8 +348,8 @@ def generate_plot(data, plot_options):
 
         xlabel = data['y_field'][0]
         ylabel = data['y_field'][1]
-        magnitude = np.array(data['y'][xlabel])
-        direction = np.array(data['y'][ylabel])
+        magnitude = data['y'][xlabel]
+        direction = data['y'][ylabel]
 
         # # Mask the bad data
         # qaqc_mag = data['qaqc'][xlabel] < 1
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/profiles.py
+
+Split profiler and glider data into individual depth profiles.  Depth is
+resampled on a regular time grid, smoothed, and the turning points (where the
+sign of the vertical velocity changes) delimit the profiles; particles are
+then assigned to profile windows with searchsorted instead of a per particle
+search of the window matrix.
+'''
+import numpy as np
+
+# resampling interval (seconds) and moving average window (samples)
+INTERVAL = 10
+WINDOW = 5
+
+
+def _moving_average(values, window):
+    weights = np.repeat(1.0, window) / window
+    return np.convolve(values, weights)[window-1:-(window-1)]
+
+
+def turning_points(time, depth, interval=INTERVAL, window=WINDOW):
+    '''
+    Times at which the (smoothed) direction of travel changes.  time must be
+    sorted.
+    '''
+    grid = np.arange(time[0], time[-1], interval)
+    if len(grid) < 2 * window:
+        raise Exception('Unable to determine where slope changes.')
+    grid_depth = np.interp(grid, time, depth)
+
+    # sign of the smoothed first difference, smoothed again to drop jitter
+    direction = np.sign(np.diff(_moving_average(grid_depth, window)))
+    direction = np.sign(_moving_average(direction, window))
+
+    changes = np.flatnonzero(np.diff(direction))
+    if len(changes) == 0:
+        raise Exception('Unable to determine where slope changes.')
+    return grid[changes], grid[-1]
+
+
+def segment_profiles(time, depth, interval=INTERVAL, window=WINDOW):
+    '''
+    Profile id for every point (-1 when the point is outside every profile).
+
+    Profile i spans turning point i to turning point i + 1 (the last one runs
+    to the end of the data), widened by two intervals on each side so
+    neighbouring windows overlap.  A point inside two windows, and every
+    point sharing a duplicate time, goes to the lowest profile id.
+    '''
+    time = np.asarray(time, dtype=np.float64)
+    depth = np.asarray(depth, dtype=np.float64)
+    ids = np.empty(len(time), dtype=np.int64)
+    ids.fill(-1)
+    if len(time) == 0:
+        return ids
+
+    # np.interp needs increasing times; a stable sort keeps duplicates in order
+    order = np.argsort(time, kind='mergesort')
+    sorted_time = time[order]
+    starts, end = turning_points(sorted_time, depth[order], interval, window)
+
+    stops = np.append(starts[1:], end)
+    starts = starts - interval * 2
+    stops = stops + interval * 2
+
+    # windows are sorted by both start and stop, so the first window ending at
+    # or after t is the lowest id which can contain t
+    candidate = np.searchsorted(stops, time, side='left')
+    inside = candidate < len(stops)
+    inside[inside] = starts[candidate[inside]] <= time[inside]
+    ids[inside] = candidate[inside]
+    return ids
+
+
+def split_profiles(profile_ids, *columns):
+    '''
+    Group columns by profile id, skipping unassigned (-1) points.  Returns the
+    profile ids in order of first appearance and, for each column, a list of
+    per profile arrays in that same order.
+    '''
+    profile_ids = np.asarray(profile_ids)
+    assigned = np.flatnonzero(profile_ids >= 0)
+    ids = profile_ids[assigned]
+    if len(ids) == 0:
+        return [], [[] for _ in columns]
+
+    order = np.argsort(ids, kind='mergesort')
+    sorted_ids = ids[order]
+    bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+    unique_ids = sorted_ids[np.append(0, bounds)]
+    first_seen = np.split(order, bounds)
+    appearance = np.argsort([group[0] for group in first_seen], kind='mergesort')
+
+    grouped = []
+    for column in columns:
+        column = np.asarray(column)[assigned][order]
+        parts = np.split(column, bounds)
+        grouped.append([parts[i] for i in appearance])
+    return unique_ids[appearance].tolist(), grouped
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/stream_catalog.py
+
+In-process catalog of the uframe stream list served by /uframe/stream.
+The list compiled by dfs_streams is cached in blob_cache (held in process,
+invalidated when compile_streams rewrites it); each worker indexes the list
+it gets from there, again only when that list changes:
+
+    tokens      search token -> stream positions (array, site, platform and
+                assembly names, reference designator, stream name, parameter
+                display names, long display name)
+    refdes      reference designator token -> stream positions (concepts)
+    prefixes    reference designator prefix (array, site, platform, instrument)
+                -> stream positions (disabled streams)
+    orderings   (sort key, reverse) -> presorted positions, built on first use
+
+so searching, excluding disabled streams and paging are index lookups.  A
+request works against one indexed list (StreamCatalog.data()); a reindex
+swaps in a new one, with its own orderings.
+'''
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from operator import itemgetter
+
+STREAM_LIST_KEY = 'stream_list'
+
+SEARCH_FIELDS = ('array_name', 'site_name', 'platform_name', 'assembly_name', 'reference_designator',
+                 'stream_name', 'parameter_display_name', 'long_display_name')
+# reference designator prefix lengths which can be disabled (array, site, platform, instrument)
+PREFIX_LENGTHS = (2, 8, 11, 27)
+# fields dropped from each stream for ?min=True
+MIN_EXCLUDE = ('parameter_id', 'units', 'variable_type', 'variable_types', 'download', 'variables',
+               'variables_shape')
+
+_split = re.compile(r'[^a-z0-9]+')
+
+
+def _tokens(value):
+    '''
+    Lower cased value and its alphanumeric parts.
+    '''
+    if value is None:
+        return set()
+    if isinstance(value, (list, tuple)):
+        tokens = set()
+        for item in value:
+            tokens.update(_tokens(item))
+        return tokens
+    if not isinstance(value, basestring):
+        value = str(value)
+    value = value.lower().strip()
+    tokens = set(token for token in _split.split(value) if token)
+    if value:
+        tokens.add(value)
+    return tokens
+
+
+class _Index(object):
+    '''
+    token -> set of positions, with prefix lookups over the sorted tokens.
+    '''
+
+    def __init__(self):
+        self.postings = {}
+        self.keys = []
+
+    def add(self, tokens, position):
+        for token in tokens:
+            self.postings.setdefault(token, set()).add(position)
+
+    def freeze(self):
+        self.keys = sorted(self.postings)
+
+    def prefix(self, term):
+        found = set()
+        i = bisect_left(self.keys, term)
+        while i < len(self.keys) and self.keys[i].startswith(term):
+            found |= self.postings[self.keys[i]]
+            i += 1
+        return found
+
+    def match(self, term):
+        '''
+        Positions with a token starting with term; a term with separators
+        ('GL340-03') also matches when each of its parts does.
+        '''
+        term = term.lower()
+        found = self.prefix(term)
+        parts = [part for part in _split.split(term) if part]
+        if len(parts) > 1:
+            each = [self.prefix(part) for part in parts]
+            found |= set.intersection(*each)
+        elif len(parts) == 1 and parts[0] != term:
+            found |= self.prefix(parts[0])
+        return found
+
+
+class _CatalogData(object):
+    '''
+    One indexed stream list.  Positions, and the orderings cached here, are
+    only meaningful against the streams they were built from, so a request
+    uses one _CatalogData throughout (StreamCatalog.data()).
+    '''
+
+    def __init__(self, streams=None, tokens=None, refdes=None, prefixes=None):
+        self.streams = streams if streams is not None else []
+        self.loaded_at = time.time() if streams is not None else None
+        self._tokens = tokens if tokens is not None else _Index()
+        self._refdes = refdes if refdes is not None else _Index()
+        self._prefixes = prefixes if prefixes is not None else {}
+        self._orderings = {}
+
+    def ordering(self, sort_by, reverse):
+        '''
+        Stream positions sorted by sort_by (catalog order for None); raises
+        KeyError for an unknown key.
+        '''
+        key = (sort_by, reverse)
+        order = self._orderings.get(key)
+        if order is None:
+            streams = self.streams
+            if sort_by is None:
+                order = range(len(streams))
+            else:
+                getter = itemgetter(sort_by)
+                order = sorted(range(len(streams)), key=lambda i: getter(streams[i]), reverse=reverse)
+            self._orderings[key] = order
+        return order
+
+    def disabled(self, reference_designators):
+        '''
+        Positions of streams under any disabled reference designator prefix.
+        '''
+        excluded = set()
+        for reference_designator in reference_designators:
+            if len(reference_designator) in PREFIX_LENGTHS:
+                excluded |= self._prefixes.get(reference_designator, set())
+        return excluded
+
+    def search(self, terms):
+        '''
+        Positions of streams matching every term.
+        '''
+        found = None
+        for term in terms:
+            matches = self._tokens.match(term)
+            found = matches if found is None else found & matches
+            if not found:
+                return set()
+        return found
+
+    def concepts(self, terms):
+        '''
+        Positions of streams whose reference designator matches any term.
+        '''
+        found = set()
+        for term in terms:
+            found |= self._refdes.match(term)
+        return found
+
+    def query(self, sort_by='end', reverse=True, search=None, concepts=None, exclude=None):
+        '''
+        Stream positions in order, after the concept, search and exclusion
+        filters.  An unknown sort key leaves the catalog order.
+        '''
+        try:
+            order = self.ordering(sort_by, reverse)
+        except (KeyError, TypeError):
+            sort_by, reverse = None, False
+            order = self.ordering(sort_by, reverse)
+
+        keep = None
+        if concepts:
+            keep = self.concepts(concepts)
+        if search:
+            matches = self.search(search)
+            keep = matches if keep is None else keep & matches
+        if keep is None:
+            keep = order
+        elif len(keep) * 8 < len(order):
+            # a narrow match: sort the matches by rank rather than scan the ordering
+            keep = sorted(keep, key=self._rank(sort_by, reverse).__getitem__)
+        else:
+            keep = [i for i in order if i in keep]
+        if exclude:
+            return [i for i in keep if i not in exclude]
+        return keep
+
+    def _rank(self, sort_by, reverse):
+        '''
+        position -> index in the ordering (cached alongside it).
+        '''
+        key = ('rank', sort_by, reverse)
+        rank = self._orderings.get(key)
+        if rank is None:
+            order = self.ordering(sort_by, reverse)
+            rank = [0] * len(order)
+            for position, i in enumerate(order):
+                rank[i] = position
+            self._orderings[key] = rank
+        return rank
+
+    def page(self, positions, start_at=None, count=None, minimal=False):
+        '''
+        Stream dicts for positions[start_at:start_at + count]; with minimal
+        the bulky fields are left out (the cached dicts are never changed).
+        '''
+        if start_at is not None:
+            positions = positions[start_at:start_at + count]
+        streams = self.streams
+        if not minimal:
+            return [streams[i] for i in positions]
+        return [dict((key, value) for key, value in streams[i].iteritems() if key not in MIN_EXCLUDE)
+                for i in positions]
+
+
+class StreamCatalog(object):
+
+    def __init__(self):
+        self._data = _CatalogData()
+        self._lock = threading.Lock()
+
+    @property
+    def streams(self):
+        return self._data.streams
+
+    @property
+    def loaded_at(self):
+        return self._data.loaded_at
+
+    def data(self):
+        '''
+        The current indexed stream list; a reload swaps in a new one and
+        leaves this one (and positions taken from it) intact.
+        '''
+        return self._data
+
+    def load(self, streams):
+        '''
+        Index a stream list; the indexes are built aside and swapped in.
+        '''
+        tokens = _Index()
+        refdes = _Index()
+        prefixes = {}
+        for position, stream in enumerate(streams):
+            for field in SEARCH_FIELDS:
+                tokens.add(_tokens(stream.get(field)), position)
+            reference_designator = stream.get('reference_designator') or ''
+            refdes.add(_tokens(reference_designator), position)
+            for length in PREFIX_LENGTHS:
+                if len(reference_designator) >= length:
+                    prefixes.setdefault(reference_designator[:length], set()).add(position)
+        tokens.freeze()
+        refdes.freeze()
+
+        data = _CatalogData(streams, tokens, refdes, prefixes)
+        with self._lock:
+            self._data = data
+
+    def ensure_loaded(self, compile_streams, timeout):
+        '''
+        Reindex when blob_cache returns a different stream list (it returns
+        the same in-process list until compile_streams rewrites it);
+        compile_streams() builds the list when none is cached.  Returns an
+        error response from compile_streams, or None.
+        '''
+        from ooiservices.app import blob_cache
+        streams = blob_cache.get(STREAM_LIST_KEY)
+        if not streams:
+            streams = compile_streams()
+            if not isinstance(streams, list) or 'error' in streams:
+                return streams
+            blob_cache.set(STREAM_LIST_KEY, streams, timeout=timeout)
+            streams = blob_cache.get(STREAM_LIST_KEY) or streams
+        if streams is not self.streams:
+            self.load(streams)
+        return None
+
+    def ordering(self, sort_by, reverse):
+        return self._data.ordering(sort_by, reverse)
+
+    def disabled(self, reference_designators):
+        return self._data.disabled(reference_designators)
+
+    def search(self, terms):
+        return self._data.search(terms)
+
+    def concepts(self, terms):
+        return self._data.concepts(terms)
+
+    def query(self, sort_by='end', reverse=True, search=None, concepts=None, exclude=None):
+        return self._data.query(sort_by, reverse, search, concepts, exclude)
+
+    def page(self, positions, start_at=None, count=None, minimal=False):
+        return self._data.page(positions, start_at, count, minimal)
+
+
+stream_catalog = StreamCatalog()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/stream_decoder.py
+
+Incremental decoder for uframe particle responses.  uframe returns a json
+array of particle objects; instead of concatenating the whole body into one
+string and calling json.loads, particles are decoded one at a time as chunks
+arrive.  Only the unconsumed tail of the stream (the particle being received)
+is held as text.
+'''
+
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+HEAD_SIZE = 4096
+
+
+class ParticleStreamDecoder(object):
+    '''
+    Feed raw chunks with feed(); each call returns the particles completed by
+    that chunk.  close() returns every particle decoded, and raises
+    ValueError when the stream ended inside the array (a truncated response).
+
+    A body which is not a json array (a uframe error object, for example) is
+    buffered and decoded as a whole by close().
+
+    Unconsumed text is kept as a list of chunks and joined only to decode.
+    A particle larger than a chunk is not decoded again until the text held
+    has doubled, so decoding stays linear in the size of the stream.
+    '''
+
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.particles = []
+        self.bytes_received = 0
+        self.head = ''
+        self.tail = ''
+        self.complete = False
+        self._state = 'start'
+        self._chunks = []
+        self._pending = 0
+        self._retry_at = 0
+        self._decoder = json.JSONDecoder()
+
+    @property
+    def count(self):
+        return len(self.particles)
+
+    @property
+    def truncated(self):
+        ''' After close(): the stream ended inside the particle array. '''
+        return self._state == 'items'
+
+    def feed(self, chunk):
+        if not chunk:
+            return []
+        self.bytes_received += len(chunk)
+        if len(self.head) < HEAD_SIZE:
+            self.head += chunk[:HEAD_SIZE - len(self.head)]
+        if self._state == 'done':
+            self.tail += chunk
+            return []
+        self._chunks.append(chunk)
+        self._pending += len(chunk)
+        if self._state == 'start':
+            buf = ''.join(self._chunks)
+            idx = WHITESPACE.match(buf, 0).end()
+            if idx == len(buf):
+                return []
+            if buf[idx] != '[':
+                self._state = 'raw'
+                return []
+            self._state = 'items'
+            self._chunks = [buf[idx + 1:]]
+            self._pending = len(self._chunks[0])
+        if self._state == 'raw' or self._pending < self._retry_at:
+            return []
+        return self._decode_items()
+
+    def _decode_items(self):
+        found = []
+        buf = ''.join(self._chunks)
+        idx = 0
+        end_of_buffer = len(buf)
+        while True:
+            idx = WHITESPACE.match(buf, idx).end()
+            if idx < end_of_buffer and buf[idx] == ',':
+                idx = WHITESPACE.match(buf, idx + 1).end()
+            if idx >= end_of_buffer:
+                break
+            if buf[idx] == ']':
+                self._state = 'done'
+                self.complete = True
+                self.tail = buf[idx + 1:]
+                idx = end_of_buffer
+                break
+            try:
+                particle, idx = self._decoder.raw_decode(buf, idx)
+            except ValueError:
+                # Partial particle, wait for more data.
+                break
+            found.append(particle)
+        rest = buf[idx:]
+        self._chunks = [rest] if rest else []
+        self._pending = len(rest)
+        self._retry_at = 2 * len(rest)
+        if self.keep:
+            self.particles.extend(found)
+        return found
+
+    def close(self):
+        '''
+        Finish decoding.  Returns the particle list for an array body or the
+        decoded object for any other json body.  Raises ValueError for bodies
+        which are not json, for an array which was never closed, or for data
+        trailing a complete array (uframe appends error messages to the
+        stream that way).
+        '''
+        if self._state == 'raw':
+            return json.loads(''.join(self._chunks))
+        if self._state == 'start':
+            raise ValueError('No JSON object could be decoded')
+        if self._state == 'items':
+            # whatever arrived since the last decode
+            self._decode_items()
+            if self._state != 'done':
+                raise ValueError('Particle array not closed; stream ended after %d particles' % self.count)
+        if self.tail.strip():
+            raise ValueError('Extra data after particle array: %s' % self.tail.strip()[:200])
+        self._chunks = []
+        return self.particles
+
+    def error_text(self):
+        # What the response looked like, for map_common_error_message.
+        return self.head + self.tail
@@ -10,9 +10,8 @@ from flask import request, current_app as app
 from ooiservices.app.uframe import uframe as api
 from ooiservices.app.main.authentication import auth
 
-import requests
+from ooiservices.app import uframe_client
 
-requests.adapters.DEFAULT_RETRIES = 2
 
 headers = {'Content-Type': 'application/json'}
 
@@ -20,7 +19,7 @@ headers = {'Content-Type': 'application/json'}
 @auth.login_required
 @api.route('/subscription', methods=['GET'])
 def get_subscription():
-    res = requests.get(
+    res = uframe_client.get(
         app.config['UFRAME_SUBSCRIBE_URL']+'/subscription',
         params=request.args)
     return res.text, res.status_code
@@ -29,7 +28,7 @@ def get_subscription():
 @auth.login_required
 @api.route('/subscription', methods=['POST'])
 def create_subscription():
-    res = requests.post(
+    res = uframe_client.post(
         app.config['UFRAME_SUBSCRIBE_URL']+'/subscription',
         data=request.data,
         headers=headers)
@@ -39,6 +38,6 @@ def create_subscription():
 @auth.login_required
 @api.route('/subscription/<int:id>', methods=['DELETE'])
 def delete_subscription(id):
-    res = requests.delete(
+    res = uframe_client.delete(
         app.config['UFRAME_SUBSCRIBE_URL']+'/subscription/%s' % id)
     return res.text, res.status_code
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+'''
+ooiservices/app/uframe/thumbnails.py
+
+Thumbnails of the HYRAX camera images (IMAGE_STORE/<name>_thumbnail.png).
+
+Images are downloaded by THUMBNAIL_DOWNLOADS threads, at most
+THUMBNAIL_DOWNLOADS_PER_HOST at a time from one host, and decoded and
+resized in a pool of THUMBNAIL_WORKERS processes (decode/resize is CPU
+bound; threads when run within a web request).  At most THUMBNAIL_DOWNLOADS
++ 2 * THUMBNAIL_WORKERS images are held in memory at once; downloads wait
+for resizing to catch up.  Processed urls are kept in a manifest in blob_cache
+('thumbnail_manifest') with the ETag and length of the image, so a rerun
+only downloads images it has not seen; with revalidate, seen images are
+fetched conditionally and redone only when they changed.
+'''
+
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+from StringIO import StringIO
+from urlparse import urlsplit
+from flask import current_app
+
+try:
+    # celery's fork of multiprocessing; its pools can be started from a celery prefork worker (a daemonic process)
+    from billiard import Pool
+except ImportError:
+    from multiprocessing import Pool
+
+MANIFEST_KEY = 'thumbnail_manifest'
+MANIFEST_TIMEOUT = 365 * 86400
+
+
+def thumbnail_path(store, filename):
+    return os.path.join(store, filename.split('.')[0] + '_thumbnail.png')
+
+
+def _make_thumbnail(args):
+    '''
+    Runs in a pool worker: decode content and write the thumbnail to path
+    (through a temporary file, so readers never see a partial image).
+    Returns None or an error message.
+    '''
+    content, path, size = args
+    import PIL
+    from PIL import Image
+    try:
+        img = Image.open(StringIO(content))
+        # let the decoder downscale while decoding where it can (jpeg)
+        img.draft('RGB', (size, size))
+        img.thumbnail((size, size), PIL.Image.ANTIALIAS)
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        img.save(temp, 'PNG')
+        os.rename(temp, path)
+    except Exception as err:
+        return str(err)
+    return None
+
+
+class ThumbnailPipeline(object):
+
+    def __init__(self, client, store, workers=2, downloads=8, per_host=4, size=200, manifest=None,
+                 processes=True):
+        self.client = client
+        self.store = store
+        self.workers = max(1, workers)
+        self.downloads = max(1, downloads)
+        self.per_host = max(1, per_host)
+        self.size = size
+        self.processes = processes
+        # url -> {'etag': .., 'length': .., 'thumbnail': filename}
+        self.manifest = manifest if manifest is not None else {}
+        self.counts = {'made': 0, 'skipped': 0, 'not_modified': 0, 'failed': 0}
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app, client, processes=True):
+        from ooiservices.app import blob_cache
+        config = app.config
+        return cls(client, config['IMAGE_STORE'],
+                   workers=int(config.get('THUMBNAIL_WORKERS', 2)),
+                   downloads=int(config.get('THUMBNAIL_DOWNLOADS', 8)),
+                   per_host=int(config.get('THUMBNAIL_DOWNLOADS_PER_HOST', 4)),
+                   size=int(config.get('THUMBNAIL_SIZE', 200)),
+                   manifest=blob_cache.get(MANIFEST_KEY) or {},
+                   processes=processes)
+
+    def save(self):
+        from ooiservices.app import blob_cache
+        blob_cache.set(MANIFEST_KEY, self.manifest, timeout=MANIFEST_TIMEOUT)
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _download(self, url, revalidate):
+        '''
+        (content, etag, length) of the image, or None when it is unchanged
+        or failed.
+        '''
+        seen = self.manifest.get(url)
+        # only an image whose thumbnail is still on disk can be left alone
+        current = revalidate and seen is not None \
+            and os.path.isfile(thumbnail_path(self.store, seen['thumbnail']))
+        headers = {}
+        if current and seen.get('etag'):
+            headers['If-None-Match'] = seen['etag']
+        with self._host_slot(url):
+            try:
+                response = self.client.get(url, headers=headers)
+            except Exception:
+                self._count('failed')
+                return None
+        if response.status_code == 304 and current:
+            self._count('not_modified')
+            return None
+        if response.status_code != 200:
+            self._count('failed')
+            return None
+        length = response.headers.get('Content-Length') or str(len(response.content))
+        etag = response.headers.get('ETag')
+        if current and (seen.get('etag'), seen.get('length')) == (etag, length):
+            self._count('not_modified')
+            return None
+        return response.content, etag, length
+
+    def _pool(self):
+        '''
+        A process pool for decode/resize; a thread pool without processes
+        (a web request must not fork), or when the process pool cannot be
+        started (multiprocessing inside a celery prefork worker without billiard).
+        '''
+        if not self.processes:
+            return ThreadPool(self.workers)
+        try:
+            return Pool(self.workers)
+        except (AssertionError, OSError) as err:
+            current_app.logger.warning('Thumbnail process pool could not be started (%s); resizing in %d threads.'
+                                       % (err, self.workers))
+            return ThreadPool(self.workers)
+
+    def run(self, images, revalidate=False):
+        '''
+        Make the missing thumbnails for images (dicts with 'url' and
+        'filename', see _create_image_entry).
+        '''
+        todo = []
+        queued = set()
+        for image in images:
+            url = image['url']
+            if url in queued:
+                continue
+            queued.add(url)
+            path = thumbnail_path(self.store, image['filename'])
+            if url in self.manifest and os.path.isfile(path) and not revalidate:
+                self.counts['skipped'] += 1
+                continue
+            todo.append((url, image['filename'], path))
+        if not todo:
+            return self.counts
+
+        if not os.path.isdir(self.store):
+            os.makedirs(self.store)
+        workers = self._pool()
+        downloads = ThreadPool(self.downloads)
+        # an image holds a slot from its download until its thumbnail is made
+        slots = threading.Semaphore(self.downloads + 2 * self.workers)
+        stop = threading.Event()
+        try:
+            def fetch(item):
+                url, filename, path = item
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    return None
+                try:
+                    downloaded = self._download(url, revalidate)
+                    if downloaded is None:
+                        slots.release()
+                        return None
+                    content, etag, length = downloaded
+                    # hand decode/resize to the workers while this thread downloads the next image
+                    result = workers.apply_async(_make_thumbnail, ((content, path, self.size),))
+                except Exception:
+                    slots.release()
+                    raise
+                return url, filename, etag, length, result
+
+            for pending in downloads.imap_unordered(fetch, todo):
+                if pending is None:
+                    continue
+                url, filename, etag, length, result = pending
+                try:
+                    error = result.get()
+                finally:
+                    slots.release()
+                if error is None:
+                    self.manifest[url] = {'etag': etag, 'length': length, 'thumbnail': filename}
+                    self.counts['made'] += 1
+                else:
+                    self.counts['failed'] += 1
+        except Exception:
+            # let the downloads waiting for a slot return
+            stop.set()
+            for i in range(self.downloads):
+                slots.release()
+            raise
+        finally:
+            downloads.close()
+            downloads.join()
+            workers.close()
+            workers.join()
+        return self.counts
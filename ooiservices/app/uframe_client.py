@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+'''
+ooiservices.app.uframe_client
+
+Pooled, keep-alive HTTP client shared by every module that talks to uFrame.
+A single requests.Session per process holds one connection pool per uFrame
+host; pool sizes, retry/backoff policy and default timeouts come from
+config.yml. Per-endpoint latency and pool usage counters are kept in process.
+'''
+
+import os
+import threading
+import time
+from urlparse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    Retry = None
+
+
+class UframeClient(object):
+    '''
+    Thin wrapper around a requests.Session which mirrors the requests api
+    (get, post, put, delete, request) so callers only swap the module name.
+    '''
+
+    def __init__(self, app=None):
+        self.pool_connections = 10
+        self.pool_maxsize = 20
+        self.pool_block = False
+        self.max_retries = 2
+        self.backoff_factor = 0.5
+        self.timeout = None
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._in_flight = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''
+        Read the pool settings from the application config.
+        '''
+        config = app.config
+        self.pool_connections = int(config.get('UFRAME_POOL_CONNECTIONS', self.pool_connections))
+        self.pool_maxsize = int(config.get('UFRAME_POOL_MAXSIZE', self.pool_maxsize))
+        self.pool_block = bool(config.get('UFRAME_POOL_BLOCK', self.pool_block))
+        self.max_retries = int(config.get('UFRAME_MAX_RETRIES', self.max_retries))
+        self.backoff_factor = float(config.get('UFRAME_RETRY_BACKOFF', self.backoff_factor))
+        # Calls which do not pass their own timeout still get a connect timeout;
+        # the read side stays unbounded since toc and asset dumps can be slow.
+        if 'UFRAME_TIMEOUT_CONNECT' in config:
+            self.timeout = (config['UFRAME_TIMEOUT_CONNECT'], None)
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['uframe_client'] = self
+        self.reset()
+
+    def reset(self):
+        '''
+        Drop the current session (and every pooled connection with it).
+        '''
+        with self._lock:
+            if self._session is not None:
+                try:
+                    self._session.close()
+                except Exception:
+                    pass
+            self._session = None
+            self._pid = None
+
+    def _make_adapter(self):
+        if Retry is not None:
+            max_retries = Retry(total=self.max_retries,
+                                connect=self.max_retries,
+                                read=self.max_retries,
+                                backoff_factor=self.backoff_factor)
+        else:
+            max_retries = self.max_retries
+        return HTTPAdapter(pool_connections=self.pool_connections,
+                           pool_maxsize=self.pool_maxsize,
+                           max_retries=max_retries,
+                           pool_block=self.pool_block)
+
+    @property
+    def session(self):
+        '''
+        Lazily create the session; a forked worker (celery, uwsgi) must not
+        reuse sockets opened by its parent, so the session is per pid.
+        '''
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    session = requests.Session()
+                    adapter = self._make_adapter()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = pid
+                    self._stats = {}
+                    self._in_flight = {}
+        return self._session
+
+    @staticmethod
+    def endpoint_name(url):
+        '''
+        Collapse a url into a metrics key: host plus the first two path
+        segments, e.g. 'localhost:12576/sensor/inv'.
+        '''
+        parts = urlsplit(url)
+        segments = [s for s in parts.path.split('/') if s][:2]
+        return '/'.join([parts.netloc] + segments)
+
+    def _record(self, endpoint, host, elapsed, failed):
+        with self._lock:
+            stat = self._stats.setdefault(endpoint, {'count': 0, 'errors': 0, 'total_ms': 0.0,
+                                                     'max_ms': 0.0, 'last_ms': 0.0})
+            ms = elapsed * 1000.0
+            stat['count'] += 1
+            stat['total_ms'] += ms
+            stat['last_ms'] = ms
+            if ms > stat['max_ms']:
+                stat['max_ms'] = ms
+            if failed:
+                stat['errors'] += 1
+            flight = self._in_flight.get(host)
+            if flight is not None and flight['active'] > 0:
+                flight['active'] -= 1
+
+    def request(self, method, url, **kwargs):
+        '''
+        Issue a request through the shared session. When no timeout is given
+        the connect timeout defaults to UFRAME_TIMEOUT_CONNECT.
+        '''
+        if 'timeout' not in kwargs and self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        session = self.session
+        host = urlsplit(url).netloc
+        endpoint = self.endpoint_name(url)
+        with self._lock:
+            flight = self._in_flight.setdefault(host, {'active': 0, 'peak': 0})
+            flight['active'] += 1
+            if flight['active'] > flight['peak']:
+                flight['peak'] = flight['active']
+        start = time.time()
+        failed = True
+        try:
+            response = session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self._record(endpoint, host, time.time() - start, failed)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        '''
+        Snapshot of latency counters per endpoint and connection pool usage
+        per host for this process.
+        '''
+        with self._lock:
+            endpoints = {}
+            for name, stat in self._stats.iteritems():
+                item = dict(stat)
+                item['avg_ms'] = stat['total_ms'] / stat['count'] if stat['count'] else 0.0
+                endpoints[name] = item
+            hosts = dict((host, dict(flight)) for host, flight in self._in_flight.iteritems())
+
+        pools = {}
+        if self._session is not None:
+            adapter = self._session.get_adapter('http://')
+            manager = getattr(adapter, 'poolmanager', None)
+            if manager is not None:
+                for key in list(manager.pools.keys()):
+                    pool = manager.pools.get(key)
+                    if pool is None:
+                        continue
+                    name = '%s:%s' % (pool.host, pool.port)
+                    pools[name] = {'connections_opened': pool.num_connections,
+                                   'requests': pool.num_requests,
+                                   'idle': pool.pool.qsize() if pool.pool is not None else 0,
+                                   'maxsize': self.pool_maxsize}
+
+        return {'pid': os.getpid(),
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                'max_retries': self.max_retries,
+                'backoff_factor': self.backoff_factor,
+                'endpoints': endpoints,
+                'in_flight': hosts,
+                'pools': pools}
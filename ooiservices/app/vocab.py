@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+'''
+ooiservices.app.vocab
+
+In-process vocabulary resolver.  VocabNames, Platformname, Instrumentname,
+Stream and StreamParameter are small, read-mostly tables which were queried
+once per row while compiling stream, asset and toc lists.  They are loaded
+once per process into dictionaries and reloaded when the shared vocabulary
+version (kept in redis) is bumped, or after VOCAB_MAX_AGE seconds.
+'''
+
+import threading
+import time
+from collections import namedtuple
+
+PlatformNameRow = namedtuple('PlatformNameRow', ['reference_designator', 'array_type', 'array_name',
+                                                 'site', 'platform', 'assembly'])
+
+VOCAB_VERSION_KEY = 'vocab_version'
+
+
+class VocabResolver(object):
+    '''
+    Display name lookups backed by in-memory indexes.
+
+    vocab_names     reference designator -> (level_one, .., level_four)
+    platform_names  reference designator[:14] -> PlatformNameRow
+    instrument_names instrument class -> display name
+    stream_names    stream -> concatenated name
+    parameter_names stream parameter name -> standard name
+    '''
+
+    def __init__(self, app=None):
+        self.check_interval = 60
+        self.max_age = 3600
+        self._lock = threading.Lock()
+        # held while (re)loading, so one thread loads and the others wait for it
+        self._refresh_lock = threading.Lock()
+        self._cleared = 0
+        self._clear()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('VOCAB_CHECK_INTERVAL', self.check_interval)
+        self.max_age = app.config.get('VOCAB_MAX_AGE', self.max_age)
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['vocab_resolver'] = self
+        self._clear()
+        self._listen()
+
+    def _listen(self):
+        '''
+        Any write to a vocabulary table through the ORM bumps the version once
+        its transaction commits (other processes must not reload the rows
+        before then).  Bulk sql loads (manage.py load_data, deploy) bump it
+        explicitly.
+        '''
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+        from ooiservices.app.models import VocabNames, Platformname, Instrumentname, Stream, StreamParameter
+        if getattr(self, '_listening', False):
+            return
+        for model in (VocabNames, Platformname, Instrumentname, Stream, StreamParameter):
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, name, self._changed)
+        event.listen(Session, 'after_commit', self._committed)
+        event.listen(Session, 'after_rollback', self._rolled_back)
+        self._listening = True
+
+    def _changed(self, mapper, connection, target):
+        from sqlalchemy.orm import object_session
+        session = object_session(target)
+        if session is not None:
+            session.info['vocab_changed'] = True
+        else:
+            self.bump_version()
+
+    def _committed(self, session):
+        if session.info.pop('vocab_changed', False):
+            self.bump_version()
+
+    def _rolled_back(self, session):
+        session.info.pop('vocab_changed', None)
+
+    def _clear(self):
+        self.vocab_names = {}
+        self.platform_names = {}
+        self.instrument_names = {}
+        self.stream_names = {}
+        self.parameter_names = {}
+        self.version = None
+        self.loaded_at = None
+        self.checked_at = None
+        self._cleared += 1
+
+    @staticmethod
+    def _shared_version():
+        from ooiservices.app import redis_store
+        try:
+            return redis_store.get(VOCAB_VERSION_KEY)
+        except Exception:
+            return None
+
+    def bump_version(self):
+        '''
+        Mark the vocabulary as changed for every process, e.g. after
+        loading ooiui_vocab.sql, and drop this process' copy.
+        '''
+        from ooiservices.app import redis_store
+        try:
+            redis_store.incr(VOCAB_VERSION_KEY)
+        except Exception:
+            pass
+        with self._lock:
+            self._clear()
+
+    def refresh(self, version=None):
+        '''
+        (Re)load every vocabulary table.  The new indexes are built aside
+        and swapped in, so concurrent readers never see a partial load.
+        '''
+        with self._refresh_lock:
+            self._load(version)
+
+    def _load(self, version=None):
+        from ooiservices.app.models import VocabNames, Platformname, Instrumentname, Stream, StreamParameter
+
+        cleared = self._cleared
+        if version is None:
+            version = self._shared_version()
+
+        vocab_names = {}
+        for row in VocabNames.query.with_entities(VocabNames.reference_designator, VocabNames.level_one,
+                                                  VocabNames.level_two, VocabNames.level_three,
+                                                  VocabNames.level_four).all():
+            vocab_names[row[0]] = tuple(row[1:])
+
+        # Keep the first row per key, as the .first() queries used to.
+        platform_names = {}
+        for row in Platformname.query.order_by(Platformname.id).\
+                with_entities(Platformname.reference_designator, Platformname.array_type,
+                              Platformname.array_name, Platformname.site, Platformname.platform,
+                              Platformname.assembly).all():
+            platform_names.setdefault(row[0], PlatformNameRow(*row))
+
+        instrument_names = {}
+        for row in Instrumentname.query.order_by(Instrumentname.id).\
+                with_entities(Instrumentname.instrument_class, Instrumentname.display_name).all():
+            instrument_names.setdefault(row[0], row[1])
+
+        stream_names = {}
+        for row in Stream.query.order_by(Stream.id).\
+                with_entities(Stream.stream, Stream.concatenated_name).all():
+            stream_names.setdefault(row[0], row[1])
+
+        parameter_names = {}
+        for row in StreamParameter.query.order_by(StreamParameter.id).\
+                with_entities(StreamParameter.stream_parameter_name, StreamParameter.standard_name).all():
+            parameter_names.setdefault(row[0], row[1])
+
+        with self._lock:
+            if cleared != self._cleared:
+                # bumped while loading; these tables may predate the change, the next lookup reloads
+                return
+            self.vocab_names = vocab_names
+            self.platform_names = platform_names
+            self.instrument_names = instrument_names
+            self.stream_names = stream_names
+            self.parameter_names = parameter_names
+            self.version = version
+            self.loaded_at = self.checked_at = time.time()
+
+    def _ensure_loaded(self):
+        now = time.time()
+        with self._lock:
+            loaded_at = self.loaded_at
+            stale = loaded_at is None or self.checked_at is None or now - loaded_at > self.max_age
+            check = not stale and now - self.checked_at > self.check_interval
+            if check:
+                self.checked_at = now
+        if stale:
+            self._reload(loaded_at)
+        elif check:
+            version = self._shared_version()
+            if version != self.version:
+                self._reload(loaded_at, version)
+
+    def _reload(self, loaded_at, version=None):
+        '''
+        Load unless another thread has (re)loaded since loaded_at was read.
+        '''
+        with self._refresh_lock:
+            if self.loaded_at is None or self.loaded_at == loaded_at:
+                self._load(version)
+
+    def vocab_level(self, reference_designator, level):
+        '''
+        VocabNames level (1..4) for a reference designator, or None.
+        '''
+        self._ensure_loaded()
+        names = self.vocab_names.get(reference_designator)
+        if names is None:
+            return None
+        return names[level - 1]
+
+    def long_display_name(self, reference_designator):
+        self._ensure_loaded()
+        names = self.vocab_names.get(reference_designator)
+        if names is None:
+            return None
+        return ' '.join([name or "" for name in names])
+
+    def platform_name(self, reference_designator):
+        '''
+        Platformname row for the first 14 characters of a reference designator.
+        '''
+        self._ensure_loaded()
+        return self.platform_names.get(reference_designator[:14])
+
+    def instrument_name(self, instrument_class):
+        self._ensure_loaded()
+        return self.instrument_names.get(instrument_class)
+
+    def stream_name(self, stream):
+        self._ensure_loaded()
+        return self.stream_names.get(stream)
+
+    def parameter_name(self, stream_parameter_name):
+        self._ensure_loaded()
+        return self.parameter_names.get(stream_parameter_name)
@@ -11,7 +11,7 @@ if os.environ.get('FLASK_COVERAGE'):
     import coverage
     COV = coverage.coverage(branch=True,include=basedir + '/app/*')
     COV.start()
-from ooiservices.app import create_app, db
+from ooiservices.app import create_app, db, vocab_resolver
 from flask.ext.script import Manager, Shell, Server, prompt_bool
 from flask.ext.migrate import Migrate, MigrateCommand
 import flask.ext.whooshalchemy as whooshalchemy
@@ -35,6 +35,12 @@ migrate = Migrate(app,db)
 app.config['WHOOSH_BASE'] = 'ooiservices/whoosh_index'
 whooshalchemy.whoosh_index(app, PlatformDeployment)
 
+# Served by gunicorn (ooiservices.manage:app), this module is imported in each worker after its fork:
+# start the worker's plot render processes there (uwsgi workers start theirs from a postfork hook).
+if __name__ != '__main__':
+    from ooiservices.app.uframe.plot_pool import plot_pool
+    plot_pool.start(app)
+
 ##------------------------------------------------------------------
 ## M@Campbell 02/10/2015
 ##
@@ -201,6 +207,7 @@ def deploy(password, production, psqluser):
         with open('db/ooiui_vocab.sql') as i:
             psql('-U', psqluser, 'ooiuidev', _in=i)
         app.logger.info('Dev Database loaded.')
+    vocab_resolver.bump_version()
 
     # migrate database to latest revision
     #upgrade()
@@ -408,6 +415,7 @@ def load_data(sql_file):
             db.session.execute("SET search_path = {0}, public, pg_catalog;".format(__schema__))
             db.session.execute(f.read())
             db.session.commit()
+            vocab_resolver.bump_version()
             app.logger.info('Success: Bulk data loaded from file: ' + sql_file)
         except sqlalchemy.exc.IntegrityError, exc:
             app.logger.info('Failure: Bulk data NOT loaded from file: ' + sql_file)
@@ -415,6 +423,43 @@ def load_data(sql_file):
             app.logger.info('Cause: ' + reason)
 
 
+@manager.command
+def create_indexes():
+    '''
+    Creates the indexes declared on the models which existing tables do not have yet
+    (db.create_all only creates indexes with new tables).
+    '''
+    from sqlalchemy import inspect
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not table.indexes or not db.engine.has_table(table.name, schema=table.schema):
+            continue
+        existing = set(index['name'] for index in inspector.get_indexes(table.name, schema=table.schema))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                app.logger.info('Created index: ' + index.name)
+
+
+@manager.command
+def backfill_escalation_state():
+    '''
+    Creates the system_event_escalations table if needed and builds the escalation state
+    of every alert definition from its existing alerts.
+    '''
+    from ooiservices.app.models import SystemEventDefinition, SystemEventEscalation
+    SystemEventEscalation.__table__.create(db.engine, checkfirst=True)
+    count = 0
+    for (definition_id,) in db.session.query(SystemEventDefinition.id).order_by(SystemEventDefinition.id):
+        state = SystemEventEscalation.build(definition_id)
+        if state is None:
+            continue
+        db.session.merge(state)
+        db.session.commit()
+        count += 1
+    app.logger.info('Escalation state built for %d alert definitions.' % count)
+
+
 @manager.command
 def profile(length=25, profile_dir=None):
     """Start the application under the code profiler."""
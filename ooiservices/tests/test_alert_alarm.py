@@ -8,16 +8,21 @@ import unittest
 import json
 from base64 import b64encode
 from flask import (url_for, current_app)
-from ooiservices.app import (create_app, db)
+from ooiservices.app import (create_app, db, redis_store)
 from ooiservices.app.models import (User, UserScope, Organization)
-from ooiservices.app.models import (SystemEventDefinition, SystemEvent, UserEventNotification)
+from ooiservices.app.models import (SystemEventDefinition, SystemEvent, SystemEventEscalation, UserEventNotification)
 from ooiservices.app.main.alertsalarms import (create_uframe_alertfilter_data, get_uframe_alerts_info,
                                                get_uframe_info, get_alertfilter, delete_alertfilter,
                                                uframe_create_alertfilter, uframe_update_alertfilter,
                                                uframe_acknowledge_alert_alarm, user_event_notification_has_required_fields,
                                                create_has_required_fields, update_uframe_alertfilter,
                                                create_uframe_alertfilter, safe_to_delete_alert_alarm_definition,
-                                               get_alert_alarm_json)
+                                               get_alert_alarm_json, get_alert_alarm_rollup)
+from ooiservices.app.main.notifications_redmine import determine_action
+from ooiservices.app.main.notification_queue import (enqueue_notification, get_notification_queue_status,
+                                                     _take_pending, _sent, _failed, _extend_lock, QUEUE_KEY,
+                                                     QUEUED_KEY, PENDING_PREFIX, PROCESSING_PREFIX, RETRY_KEY,
+                                                     ATTEMPTS_KEY, DEAD_KEY, LOCK_KEY, RELEASE_LOCK_SCRIPT)
 
 import datetime as dt
 import requests
@@ -3227,6 +3232,175 @@ class AlertAlarmTestCase(unittest.TestCase):
         except:
             pass
 
+    def create_rollup_events(self):
+        """
+        Create definitions (test database only) and alert_alarms for two reference designators.
+        """
+        rd = 'CE01ISSP-XX099-01-CTDPFJ999'
+        other_rd = 'CP02PMCO-WFP01-02-DOFSTK000'
+        alert = self.create_alert_alarm_definition_wo_notification(rd, 'alert', 1, 1)
+        alarm = self.create_alert_alarm_definition_wo_notification(rd, 'alarm', 2, 3)
+        other = self.create_alert_alarm_definition_wo_notification(other_rd, 'alert', 3, 2)
+        now = dt.datetime.now()
+        for uframe_event_id, definition, acknowledged in [(1, alert, False), (2, alarm, False),
+                                                          (3, alarm, True), (4, other, False)]:
+            event = SystemEvent(system_event_definition_id=definition.id, uframe_event_id=uframe_event_id,
+                                uframe_filter_id=definition.uframe_filter_id, event_time=now,
+                                event_type=definition.event_type, event_response='response', method='telemetered',
+                                deployment=1, acknowledged=acknowledged, timestamp=now)
+            db.session.add(event)
+        db.session.commit()
+        return rd, other_rd
+
+    def test_alert_alarm_rollup(self):
+        """
+        Unacknowledged count, highest severity and alarm/alert per reference designator in one query.
+        """
+        rd, other_rd = self.create_rollup_events()
+        rollup = get_alert_alarm_rollup()
+        self.assertEquals(rollup[rd], {'count': 2, 'severity': 3, 'event_type': 'alarm'})
+        self.assertEquals(rollup[other_rd], {'count': 1, 'severity': 2, 'event_type': 'alert'})
+        self.assertEquals(get_alert_alarm_rollup({'acknowledged': 'true'}), {})
+        self.assertEquals(get_alert_alarm_rollup(None, {'reference_designator': other_rd}).keys(), [other_rd])
+
+    def test_alert_alarm_keyset_pagination(self):
+        """
+        /alert_alarm filters in SQL and pages by id.
+        """
+        rd, other_rd = self.create_rollup_events()
+        ids = []
+        after_id = None
+        while True:
+            args = {'limit': 3}
+            if after_id is not None:
+                args['after_id'] = after_id
+            response = self.client.get(url_for('main.get_alerts_alarms', **args))
+            self.assertEquals(response.status_code, 200)
+            data = json.loads(response.data)
+            ids.extend(alert_alarm['id'] for alert_alarm in data['alert_alarm'])
+            if 'next_after_id' not in data:
+                break
+            after_id = data['next_after_id']
+        self.assertEquals(len(ids), 4)
+        self.assertEquals(ids, sorted(ids))
+
+        response = self.client.get(url_for('main.get_alerts_alarms', reference_designator=rd, acknowledged='false'))
+        data = json.loads(response.data)['alert_alarm']
+        self.assertEquals(len(data), 2)
+        self.assertTrue(all(item['alert_alarm_definition']['reference_designator'] == rd for item in data))
+
+        response = self.client.get(url_for('main.get_alerts_alarms', limit='none'))
+        self.assertEquals(response.status_code, 409)
+
+    def test_bulk_acknowledge_and_resolve(self):
+        """
+        Bulk acknowledge and resolve by filter; instances which cannot be resolved are reported as failed.
+        """
+        rd, other_rd = self.create_rollup_events()
+        headers = self.get_api_headers('admin', 'test')
+
+        # A selection (ids or filter) is required
+        response = self.client.put(url_for('main.bulk_acknowledge_alert_alarm'), headers=headers,
+                                   data=json.dumps({'ack_by': 1}))
+        self.assertEquals(response.status_code, 409)
+
+        response = self.client.put(url_for('main.bulk_acknowledge_alert_alarm'), headers=headers,
+                                   data=json.dumps({'ack_by': 1, 'reference_designator': other_rd}))
+        self.assertEquals(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEquals(len(result['acknowledged']), 1)
+        self.assertEquals(result['failed'], [])
+        self.assertTrue(SystemEvent.query.get(result['acknowledged'][0]).acknowledged)
+
+        response = self.client.put(url_for('main.bulk_resolve_alert_alarm'), headers=headers,
+                                   data=json.dumps({'resolved_comment': 'platform outage', 'reference_designator': rd}))
+        self.assertEquals(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEquals(len(result['resolved']), 1)
+        self.assertEquals(len(result['failed']), 2)
+        resolved = SystemEvent.query.get(result['resolved'][0])
+        self.assertTrue(resolved.resolved and resolved.acknowledged)
+        self.assertTrue(resolved.resolved_comment.endswith('platform outage'))
+
+    def test_notification_queue(self):
+        """
+        Enqueued notifications are coalesced per definition; failures are retried, then dead-lettered.
+        """
+        definition_ids = [900001, 900002]
+        keys = [QUEUE_KEY, QUEUED_KEY, RETRY_KEY, ATTEMPTS_KEY, LOCK_KEY] + \
+            [prefix + str(id) for id in definition_ids for prefix in (PENDING_PREFIX, PROCESSING_PREFIX)]
+        redis_store.delete(*keys)
+        try:
+            for id in [11, 12, 13]:
+                enqueue_notification(id, definition_ids[0])
+            enqueue_notification(21, definition_ids[1])
+            self.assertEquals(get_notification_queue_status()['queued'], 2)
+            self.assertEquals(_take_pending(definition_ids[0]), [11, 12, 13])
+            # a batch stays in processing until each notification is sent; newer ones wait for the next batch
+            enqueue_notification(14, definition_ids[0])
+            _sent(definition_ids[0])
+            self.assertEquals(_take_pending(definition_ids[0]), [12, 13])
+            _sent(definition_ids[0])
+            _sent(definition_ids[0])
+            self.assertEquals(_take_pending(definition_ids[0]), [14])
+
+            self.app.config['NOTIFICATION_MAX_ATTEMPTS'] = 2
+            self.assertEquals(_take_pending(definition_ids[1]), [21])
+            self.assertTrue(_failed(definition_ids[1], 21, [21], Exception('red mine unavailable')))
+            retrying = get_notification_queue_status()['retrying'][str(definition_ids[1])]
+            self.assertEquals(retrying['ids'], [21])
+            self.assertEquals(retrying['attempts'], 1)
+            self.assertEquals(_take_pending(definition_ids[1]), [])
+            self.assertFalse(_failed(definition_ids[1], 21, [21], Exception('red mine unavailable')))
+            dead = json.loads(redis_store.rpop(DEAD_KEY))
+            self.assertEquals((dead['id'], dead['definition_id'], dead['attempts']), (21, definition_ids[1], 2))
+
+            # the dispatch lock is renewed and released only by its holder
+            redis_store.set(LOCK_KEY, 'another-dispatch', ex=10)
+            self.assertFalse(_extend_lock('expired-dispatch'))
+            self.assertTrue(redis_store.ttl(LOCK_KEY) <= 10)
+            self.assertTrue(_extend_lock('another-dispatch'))
+            self.assertTrue(redis_store.ttl(LOCK_KEY) > 10)
+            self.assertEquals(redis_store.eval(RELEASE_LOCK_SCRIPT, 1, LOCK_KEY, 'expired-dispatch'), 0)
+            self.assertEquals(redis_store.get(LOCK_KEY), 'another-dispatch')
+            self.assertEquals(redis_store.eval(RELEASE_LOCK_SCRIPT, 1, LOCK_KEY, 'another-dispatch'), 1)
+        finally:
+            redis_store.delete(*keys)
+
+    def test_escalation_state(self):
+        """
+        determine_action reads and updates one escalation state row per definition; build gives the same from history.
+        """
+        definition = self.create_alert_alarm_definition_wo_notification('CE01ISSP-XX099-01-CTDPFJ999', 'alert', 1, 1)
+        start = dt.datetime(2015, 4, 11, 17, 17, 18)
+        ids = []
+        actions = []
+        for seconds in [0, 3, 6, 8, 12]:
+            event_time = start + dt.timedelta(seconds=seconds)
+            alert = SystemEvent(system_event_definition_id=definition.id, uframe_event_id=seconds,
+                                uframe_filter_id=definition.uframe_filter_id, event_time=event_time,
+                                event_type='alert', event_response='response', method='telemetered',
+                                deployment=1, acknowledged=False, timestamp=dt.datetime.now())
+            db.session.add(alert)
+            SystemEventEscalation.record_alert(alert)
+            db.session.commit()
+            ids.append(alert.id)
+            action = determine_action(alert.id)
+            actions.append(action)
+            if action in ['begin_notification', 'reissue_notification']:
+                SystemEvent.update_alert_alarm_escalation(id=alert.id, ticket_id=len(actions), escalated=True,
+                                                          ts_escalated=dt.datetime.now())
+        self.assertEquals(actions, [None, None, 'begin_notification', 'update_notification', 'reissue_notification'])
+        self.assertEquals(SystemEvent.query.get(ids[3]).ticket_id, 3)
+        self.assertTrue(SystemEvent.query.get(ids[0]).ts_start is None)
+
+        state = SystemEventEscalation.query.get(definition.id)
+        self.assertEquals((state.start_event_id, state.last_event_id, state.escalated, state.ticket_id),
+                          (ids[4], ids[4], True, 5))
+        built = SystemEventEscalation.build(definition.id)
+        self.assertEquals((built.start_event_id, built.last_event_id, built.escalated, built.ticket_id),
+                          (ids[4], ids[4], True, 5))
+
     def test_multiple_query_filter_options(self):
         """
         Test alert_alarm queries with multiple filter rules.
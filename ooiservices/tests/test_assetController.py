@@ -164,6 +164,53 @@ class PrivateMethodsTest(unittest.TestCase):
         converted_water_depth = _convert_water_depth(raw_depth)
         self.assertTrue('Error' in converted_water_depth['message'])
 
+    def test_event_summary_and_sort(self):
+        '''
+        _event_summary / _sort_events, used by the bulk asset event join.
+        '''
+        from ooiservices.app.uframe.assetController import\
+            _event_summary, _sort_events, convert_lat_lon
+        summary = _event_summary(self.event_json)
+        self.assertEqual(summary['eventId'], 5)
+        self.assertEqual(summary['eventClass'], '.DeploymentEvent')
+        self.assertEqual(summary['notes'], 0)
+
+        # the deployment fields, as the /events listing carries them
+        summary = _event_summary(dict(self.event_json, tense='PRESENT', locationLonLat=[-70.88, 40.1]))
+        self.assertEqual(summary['deploymentDepth'], 148.0)
+        self.assertEqual(summary['deploymentNumber'], 1)
+        self.assertEqual(summary['locationLonLat'], convert_lat_lon(40.1, -70.88))
+        self.assertNotEqual(summary['locationLonLat'], [])
+
+        events = [{'eventId': 3}, {'eventId': 1}, {'eventId': 2}]
+        self.assertEqual([e['eventId'] for e in _sort_events(events, 'eventId')], [1, 2, 3])
+        # An unknown sort key leaves the events in uframe order
+        self.assertEqual([e['eventId'] for e in _sort_events(events, 'ref_des')], [3, 1, 2])
+
+    def test_index_events(self):
+        '''
+        _index_events, the reference designator index cached with the event list.
+        '''
+        from ooiservices.app.uframe.assetController import _index_events
+        def event(id, event_class, tense, ref_des, depth=None):
+            subsite, node, sensor = ref_des.split('-', 2)
+            return {'id': id, 'eventClass': event_class, 'tense': tense, 'startDate': 1420070400000,
+                    'endDate': None, 'eventDescription': '', 'eventType': '', 'notes': '',
+                    'cruiseNumber': 'AT-26', 'cruisePlanDocument': None, 'depth': depth,
+                    'locationLonLat': [-70.8, 40.1], 'deploymentNumber': id,
+                    'referenceDesignator': {'full': True, 'subsite': subsite, 'node': node, 'sensor': sensor}}
+        ctd = 'CP05MOAS-GL340-03-CTDGVM000'
+        index = _index_events([event(1, '.DeploymentEvent', 'PAST', ctd, 10),
+                               event(2, '.DeploymentEvent', 'PRESENT', ctd, 20),
+                               event(3, '.CalibrationEvent', 'PRESENT', ctd),
+                               event(4, '.DeploymentEvent', 'PRESENT', 'CE01ISSM-MFD35-02-PRESFA000', 25),
+                               {'id': 5, 'eventClass': '.StorageEvent'}])
+        self.assertEqual([e['id'] for e in index['events'][ctd]], [1, 2, 3])
+        self.assertEqual(index['events'][ctd][0]['start_date'], 'January 01 2015, 12:00:00 AM')
+        self.assertEqual(index['deployments'][ctd]['depth'], 20)
+        self.assertEqual(index['deployments']['CE01ISSM-MFD35-02-PRESFA000']['deployment_number'], 4)
+        self.assertEqual(len(index['events']), 2)
+
 
 class AssetCollectionTest(unittest.TestCase):
     def setUp(self):
@@ -1371,4 +1371,131 @@ class CommandAndControlTestCase(unittest.TestCase):
         result = c2_get_instrument_driver_parameter_values(rd)
         print '\n result: ', result
         if verbose: print '\n'
-    '''
\ No newline at end of file
+    '''
+    def test_c2_toc_cache_and_reset(self):
+        '''
+        C2 helpers read from the cached, indexed hierarchy; DELETE /c2/toc drops it.
+        '''
+        from ooiservices.app import cache
+        from ooiservices.app.main.c2 import C2_TOC_CACHE_KEY, _get_platform, _get_platforms,\
+            _get_instrument, _get_instruments
+        headers = self.get_api_headers('admin', 'test')
+        platform = {'reference_designator': 'CP02PMCO-WFP01', 'mooring_code': 'CP02PMCO',
+                    'platform_code': 'WFP01', 'display_name': 'Wire-Following Profiler'}
+        instrument = {'reference_designator': 'CP02PMCO-WFP01-05-PARADK000', 'mooring_code': 'CP02PMCO',
+                      'platform_code': 'WFP01', 'instrument_code': '05-PARADK000', 'display_name': None}
+        toc = {'arrays': [], 'moorings': [], 'platforms': [platform], 'instruments': [instrument],
+               'platform_index': {platform['reference_designator']: platform},
+               'platforms_by_array': {'CP': [platform]},
+               'instrument_index': {instrument['reference_designator']: instrument},
+               'instruments_by_platform': {'CP02PMCO-WFP01': [instrument]}}
+        cache.set(C2_TOC_CACHE_KEY, toc)
+
+        self.assertEquals(_get_platform('CP02PMCO-WFP01'), platform)
+        self.assertEquals(_get_platform('CP02PMCO-XXXXX'), None)
+        self.assertEquals(_get_platforms('CP'), [platform])
+        self.assertEquals(_get_platforms('CE'), [])
+        self.assertEquals(_get_instrument('CP02PMCO-WFP01-05-PARADK000'), instrument)
+        instruments, oinstruments = _get_instruments('CP02PMCO-WFP01')
+        self.assertEquals(oinstruments, ['CP02PMCO-WFP01-05-PARADK000'])
+
+        response = self.client.delete('/c2/toc', headers=headers)
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(cache.get(C2_TOC_CACHE_KEY) is None)
+
+    def test_c2_platform_current_status_display(self):
+        '''
+        operational_status of each instrument on the Current Status tab is a string.
+        '''
+        from ooiservices.app import cache
+        from ooiservices.app.main.c2 import C2_TOC_CACHE_KEY
+        headers = self.get_api_headers('admin', 'test')
+        platform = {'reference_designator': 'CP02PMCO-WFP01', 'mooring_code': 'CP02PMCO',
+                    'platform_code': 'WFP01', 'display_name': 'Wire-Following Profiler'}
+        instrument = {'reference_designator': 'CP02PMCO-WFP01-05-PARADK000', 'mooring_code': 'CP02PMCO',
+                      'platform_code': 'WFP01', 'instrument_code': '05-PARADK000', 'display_name': None}
+        toc = {'arrays': [], 'moorings': [], 'platforms': [platform], 'instruments': [instrument],
+               'platform_index': {platform['reference_designator']: platform},
+               'platforms_by_array': {'CP': [platform]},
+               'instrument_index': {instrument['reference_designator']: instrument},
+               'instruments_by_platform': {'CP02PMCO-WFP01': [instrument]}}
+        cache.set(C2_TOC_CACHE_KEY, toc)
+
+        response = self.client.get('/c2/platform/CP02PMCO-WFP01/current_status_display', headers=headers)
+        self.assertEquals(response.status_code, 200)
+        contents = json.loads(response.data)['current_status_display']
+        self.assertEquals(len(contents), 1)
+        self.assertEquals(contents[0]['reference_designator'], 'CP02PMCO-WFP01-05-PARADK000')
+        self.assertTrue(isinstance(contents[0]['operational_status'], basestring))
+        cache.delete(C2_TOC_CACHE_KEY)
+
+    def test_c2_status_fanout(self):
+        '''
+        Instrument statuses are polled concurrently; failed or late polls are left out.
+        '''
+        import time
+        from ooiservices.app.main.c2_status import StatusFanout
+
+        def fetch(reference_designator):
+            if reference_designator == 'slow':
+                time.sleep(2)
+            elif reference_designator == 'bad':
+                raise Exception('instrument driver not responding')
+            return {'reference_designator': reference_designator}
+
+        fanout = StatusFanout()
+        statuses = fanout.map(['fast-1', 'fast-2', 'slow', 'bad'], fetch, workers=4, timeout=0.5)
+        self.assertEquals(sorted(statuses.keys()), ['fast-1', 'fast-2'])
+        self.assertEquals(statuses['fast-1'], {'reference_designator': 'fast-1'})
+        self.assertEquals(fanout.map([], fetch), {})
+
+        # concurrent requests share one poll per reference designator, also across a pool resize
+        import threading
+        calls = []
+        release = threading.Event()
+
+        def blocking_fetch(reference_designator):
+            calls.append(reference_designator)
+            release.wait(5)
+            return 'ok'
+
+        self.assertEquals(fanout.map(['shared'], blocking_fetch, workers=2, timeout=0.2), {})
+        self.assertEquals(fanout.map(['shared'], blocking_fetch, workers=3, timeout=0.2), {})
+        release.set()
+        self.assertEquals(fanout.map(['shared'], blocking_fetch, workers=3, timeout=5), {'shared': 'ok'})
+        self.assertEquals(calls, ['shared'])
+        time.sleep(0.1)
+        self.assertEquals(fanout._in_flight, {})
+
+    def test_c2_instrument_driver_statuses_cache(self):
+        '''
+        Driver statuses are cached briefly per reference designator.
+        '''
+        from ooiservices.app import cache
+        from ooiservices.app.main import c2
+        reference_designators = ['CP02PMCO-WFP01-05-PARADK000', 'CP02PMCO-WFP01-03-CTDPFK000']
+        keys = [c2.C2_STATUS_CACHE_PREFIX + rd for rd in reference_designators]
+        for key in keys:
+            cache.delete(key)
+        polled = []
+
+        def driver_status(reference_designator):
+            polled.append(reference_designator)
+            return {'value': {'state': 'DRIVER_STATE_COMMAND'}}
+
+        get_instrument_driver_status = c2._c2_get_instrument_driver_status
+        c2._c2_get_instrument_driver_status = driver_status
+        try:
+            cache.set(keys[0], {'value': {'state': 'DRIVER_STATE_AUTOSAMPLE'}})
+            statuses = c2._c2_get_instrument_driver_statuses(reference_designators)
+            self.assertEquals(statuses[reference_designators[0]]['value']['state'], 'DRIVER_STATE_AUTOSAMPLE')
+            self.assertEquals(statuses[reference_designators[1]]['value']['state'], 'DRIVER_STATE_COMMAND')
+            self.assertEquals(polled, [reference_designators[1]])
+
+            statuses = c2._c2_get_instrument_driver_statuses(reference_designators)
+            self.assertEquals(len(statuses), 2)
+            self.assertEquals(polled, [reference_designators[1]])
+        finally:
+            c2._c2_get_instrument_driver_status = get_instrument_driver_status
+            for key in keys:
+                cache.delete(key)
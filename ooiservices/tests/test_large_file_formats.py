@@ -47,3 +47,112 @@ class UframeLargeDataTestCase(unittest.TestCase):
 
         # Check the content of the first record
         self.assertIn('url', data[self.ref_des][self.year][self.month][self.day][0])
+
+    def test_crawler_checkpoints(self):
+        '''
+        One listing fetch per folder; reruns revalidate open folders and skip sealed ones
+        '''
+        from ooiservices.app.uframe.hyrax_crawler import HyraxCrawler
+
+        class Response(object):
+            def __init__(self, status_code, content='', etag=None):
+                self.status_code = status_code
+                self.content = content
+                self.headers = {'ETag': etag} if etag else {}
+
+        class Client(object):
+            def __init__(self, pages):
+                self.pages = pages
+                self.requested = []
+
+            def get(self, url, headers=None):
+                self.requested.append(url)
+                etag = 'etag-%d' % len(self.pages[url])
+                if (headers or {}).get('If-None-Match') == etag:
+                    return Response(304)
+                links = ''.join('<a href="%s">x</a>' % href for href in self.pages[url])
+                return Response(200, links, etag)
+
+        root = 'http://hyrax/large_format/'
+        ref = root + 'CE02SHBP-MJ01C-08-CAMDSB107/'
+        pages = {root: ['CE02SHBP-MJ01C-08-CAMDSB107/contents.html', 'CE02SHBP-MJ01C-07-ADCPTA000/contents.html'],
+                 ref + 'contents.html': ['../contents.html', '2015/contents.html'],
+                 ref + '2015/contents.html': ['11/contents.html'],
+                 ref + '2015/11/contents.html': ['30/contents.html'],
+                 ref + '2015/11/30/contents.html': ['a_20151130T000000,000Z.png', 'b.raw', 'c.txt']}
+        client = Client(pages)
+        crawler = HyraxCrawler(client, workers=4)
+        files = crawler.crawl(root, lambda href: '-CAMDS' in href, ['.png', '.raw'])
+        self.assertEqual(files['CE02SHBP-MJ01C-08-CAMDSB107']['2015']['11']['30'],
+                         {'.png': [ref + '2015/11/30/a_20151130T000000,000Z.png'],
+                          '.raw': [ref + '2015/11/30/b.raw']})
+        self.assertEqual(sorted(client.requested), sorted(pages.keys()))
+
+        client.requested = []
+        rerun = HyraxCrawler(client, workers=4, listings=crawler.listings)
+        self.assertEqual(rerun.crawl(root, lambda href: '-CAMDS' in href, ['.png', '.raw']), files)
+        # 2015 is over: only the root and the reference designator folder are revalidated
+        self.assertEqual(sorted(client.requested), [root, ref + 'contents.html'])
+        self.assertEqual(rerun.counts['fetched'], 0)
+        self.assertEqual(rerun.counts['not_modified'], 2)
+
+    def test_thumbnail_manifest(self):
+        '''
+        Thumbnails are made once per url; a revalidating rerun only redoes changed images
+        '''
+        import os
+        import shutil
+        import tempfile
+        from StringIO import StringIO
+        from PIL import Image
+        from ooiservices.app.uframe.thumbnails import ThumbnailPipeline, thumbnail_path
+
+        def png(color):
+            content = StringIO()
+            Image.new('RGB', (640, 480), color).save(content, 'PNG')
+            return content.getvalue()
+
+        class Response(object):
+            def __init__(self, status_code, content='', etag=None):
+                self.status_code = status_code
+                self.content = content
+                self.headers = {'ETag': etag} if etag else {}
+
+        class Client(object):
+            def __init__(self, images):
+                self.images = images
+                self.requested = []
+
+            def get(self, url, headers=None):
+                self.requested.append(url)
+                etag = 'etag-' + url[-5]
+                if (headers or {}).get('If-None-Match') == etag:
+                    return Response(304)
+                return Response(200, self.images[url], etag)
+
+        base = 'http://hyrax/large_format/CE02SHBP-MJ01C-08-CAMDSB107/2015/11/30/'
+        images = [{'url': base + name, 'filename': name}
+                  for name in ['a_20151130T000000,000Z.png', 'b_20151130T001500,000Z.png']]
+        client = Client(dict((image['url'], png('red')) for image in images))
+        store = tempfile.mkdtemp()
+        try:
+            pipeline = ThumbnailPipeline(client, store, workers=2, downloads=2, per_host=1, size=100)
+            counts = pipeline.run(images + images[:1])
+            self.assertEqual(counts['made'], 2)
+            self.assertEqual(sorted(client.requested), sorted(image['url'] for image in images))
+            thumbnail = Image.open(thumbnail_path(store, images[0]['filename']))
+            self.assertEqual(thumbnail.size, (100, 75))
+
+            client.requested = []
+            rerun = ThumbnailPipeline(client, store, manifest=pipeline.manifest)
+            self.assertEqual(rerun.run(images)['skipped'], 2)
+            self.assertEqual(client.requested, [])
+
+            os.remove(thumbnail_path(store, images[1]['filename']))
+            # within a web request thumbnails are resized in threads
+            rerun = ThumbnailPipeline(client, store, manifest=pipeline.manifest, processes=False)
+            counts = rerun.run(images, revalidate=True)
+            self.assertEqual((counts['made'], counts['not_modified']), (1, 1))
+            self.assertTrue(os.path.isfile(thumbnail_path(store, images[1]['filename'])))
+        finally:
+            shutil.rmtree(store)
@@ -9,6 +9,7 @@ from ooiservices.app.redmine.routes import (redmine_login, get_redmine_users_by_
                                             get_redmine_ticket_for_notification, create_redmine_ticket_for_notification,
                                             update_redmine_ticket_for_notification)
 from ooiservices.app.models import User, UserScope, Organization
+from ooiservices.app.redmine_client import RedmineClient
 from flask import current_app
 import unittest
 from unittest import skipIf
@@ -24,6 +25,39 @@ These tests verify the functionality of the Redmine api list.
 
 PROJECT = 'ooi-ui-api-testing'
 
+
+class CountingTrackers(object):
+    '''
+    Stands in for redmine.tracker; counts the tracker list requests.
+    '''
+    def __init__(self):
+        self.requests = 0
+
+    def all(self):
+        self.requests += 1
+        return [type('Tracker', (object,), {'name': 'Support', 'id': 3})()]
+
+
+class SavingIssues(object):
+    '''
+    Stands in for redmine.issue; keeps the saved fields of issue 7.
+    '''
+    def __init__(self):
+        self.saved = {'description': 'Alert.'}
+
+    def get(self, resource_id):
+        saved = self.saved
+
+        class Issue(object):
+            def __init__(self):
+                self.id = resource_id
+                self.__dict__.update(saved)
+
+            def save(self):
+                saved.update(self.__dict__)
+                return True
+        return Issue()
+
 @skipIf(os.getenv('TRAVIS'), 'Skip if testing from Travis CI.')
 class RedmineTestCase(unittest.TestCase):
 
@@ -258,4 +292,30 @@ class RedmineTestCase(unittest.TestCase):
         subject = None
         assigned_id = None
         result = update_redmine_ticket_for_notification(ticket_id, project, subject, description, priority, assigned_id)
-        self.assertTrue(result is None)
\ No newline at end of file
+        self.assertTrue(result is None)
+
+    def test_redmine_metadata_cache(self):
+        redmine_client = RedmineClient(self.app)
+        trackers = CountingTrackers()
+        redmine_client._redmine = type('Redmine', (object,), {'tracker': trackers})()
+        for n in xrange(20):
+            self.assertEquals(redmine_client.tracker_id('Support'), 3)
+        self.assertEquals(trackers.requests, 1)
+        self.assertRaises(Exception, redmine_client.tracker_id, 'Bug')
+        redmine_client.refresh('trackers')
+        redmine_client.tracker_id('Support')
+        self.assertEquals(trackers.requests, 2)
+
+    def test_redmine_update_and_append_issue(self):
+        redmine_client = RedmineClient(self.app)
+        issues = SavingIssues()
+        redmine_client._redmine = type('Redmine', (object,), {'issue': issues})()
+        # field updates are saved as given
+        self.assertEquals(redmine_client.update_issue(7, {'notes': 'Checked.', 'status_id': 2}), 7)
+        self.assertEquals(issues.saved['notes'], 'Checked.')
+        self.assertEquals(issues.saved['description'], 'Alert.')
+        # notification appends extend the description and assign an unassigned issue
+        self.assertEquals(redmine_client.append_issue(7, ' Escalated.', assign=5), 7)
+        self.assertEquals(issues.saved['description'], 'Alert. Escalated.')
+        self.assertEquals(issues.saved['assigned_to_id'], 5)
+        self.assertEquals(issues.saved['status_id'], 2)
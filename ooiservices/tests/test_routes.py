@@ -176,3 +176,45 @@ class UserTestCase(unittest.TestCase):
 
         response = self.client.get(url_for('main.get_display_name', reference_designator='GS03FLMA-RIXXX-BAD'), content_type=content_type)
         self.assertEquals(response.status_code, 204)
+
+    def test_display_name_resolver(self):
+        from ooiservices.app import vocab_resolver
+        from ooiservices.app.models import Platformname, Instrumentname
+        from ooiservices.app.main.routes import get_display_name_by_rd, get_long_display_name_by_rd,\
+            get_stream_name_by_stream, get_parameter_name_by_parameter
+
+        # Prime the resolver before any rows exist; the commit below must invalidate it
+        # (not the max age, which the testing config sets to 0).
+        max_age, check_interval = vocab_resolver.max_age, vocab_resolver.check_interval
+        vocab_resolver.max_age = vocab_resolver.check_interval = 3600
+        self.addCleanup(setattr, vocab_resolver, 'max_age', max_age)
+        self.addCleanup(setattr, vocab_resolver, 'check_interval', check_interval)
+        self.assertEquals(get_display_name_by_rd('CE01ISSM'), None)
+
+        db.session.add(VocabNames(reference_designator='CE01ISSM', level_one='Endurance',
+                                  level_two='OR Inshore Surface Mooring'))
+        db.session.add(Platformname(reference_designator='CE01ISSM-MFC31', array_type='Coastal',
+                                    array_name='Endurance', site='OR Inshore', platform='Surface Mooring',
+                                    assembly='Multi-Function Node'))
+        db.session.add(Instrumentname(instrument_class='CTDBP', display_name='CTD Pumped'))
+        db.session.add(Stream(stream='ctdbp_cdef_dcl_instrument', concatenated_name='CTD Pumped Data'))
+        db.session.add(StreamParameter(stream_parameter_name='ctdbp_seawater_temperature',
+                                       standard_name='sea_water_temperature'))
+        db.session.commit()
+
+        self.assertEquals(get_display_name_by_rd('CE'), None)
+        self.assertEquals(get_display_name_by_rd('CE01ISSM'), 'OR Inshore Surface Mooring')
+        self.assertEquals(get_long_display_name_by_rd('CE01ISSM'), 'Endurance OR Inshore Surface Mooring  ')
+        self.assertEquals(get_stream_name_by_stream('ctdbp_cdef_dcl_instrument'), 'CTD Pumped Data')
+        self.assertEquals(get_parameter_name_by_parameter('ctdbp_seawater_temperature'), 'sea_water_temperature')
+        self.assertEquals(PlatformDeployment._get_display_name('CE01ISSM-MFC31-03-CTDBPC000'),
+                          'Coastal Endurance OR Inshore Surface Mooring - Multi-Function Node - CTD Pumped')
+        self.assertEquals(PlatformDeployment._get_display_name('CE05MOAS-GL005'), 'CE05MOAS-GL005')
+        self.assertTrue(vocab_resolver.loaded_at is not None)
+
+        # a write which is rolled back leaves the loaded vocabulary alone
+        loaded_at = vocab_resolver.loaded_at
+        db.session.add(VocabNames(reference_designator='CE02SHSM', level_one='Endurance'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEquals(vocab_resolver.loaded_at, loaded_at)
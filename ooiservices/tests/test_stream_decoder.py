@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+'''
+Unit tests for the incremental uframe particle decoder.
+
+'''
+
+import unittest
+import json
+from ooiservices.app.uframe.stream_decoder import ParticleStreamDecoder
+
+
+class ParticleStreamDecoderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.particles = [{'pk': {'time': 3600000000.0 + i}, 'temperature': i * 0.5, 'name': 'p,[%d]' % i}
+                          for i in range(50)]
+        self.body = json.dumps(self.particles, indent=1)
+
+    def feed_all(self, decoder, body, size):
+        for i in range(0, len(body), size):
+            decoder.feed(body[i:i + size])
+
+    def test_chunk_boundaries(self):
+        for size in (1, 7, 64, 4096):
+            decoder = ParticleStreamDecoder()
+            self.feed_all(decoder, self.body, size)
+            self.assertEqual(decoder.close(), self.particles)
+            self.assertTrue(decoder.complete)
+            self.assertEqual(decoder.bytes_received, len(self.body))
+
+    def test_truncated_stream(self):
+        decoder = ParticleStreamDecoder()
+        self.feed_all(decoder, self.body[:len(self.body) / 2], 100)
+        self.assertRaises(ValueError, decoder.close)
+        self.assertFalse(decoder.complete)
+        self.assertTrue(decoder.truncated)
+        data = decoder.particles
+        self.assertTrue(0 < len(data) < len(self.particles))
+        self.assertEqual(data, self.particles[:len(data)])
+
+    def test_large_particle(self):
+        particles = [{'pk': {'time': 1.0}, 'samples': range(20000)}, {'pk': {'time': 2.0}, 'samples': [1]}]
+        body = json.dumps(particles)
+        decoder = ParticleStreamDecoder()
+        self.feed_all(decoder, body, 512)
+        self.assertEqual(decoder.close(), particles)
+
+    def test_error_bodies(self):
+        decoder = ParticleStreamDecoder()
+        decoder.feed('{"message": "Failed to respond", "requestUUID": "abc"}')
+        self.assertEqual(decoder.close()['requestUUID'], 'abc')
+
+        decoder = ParticleStreamDecoder()
+        decoder.feed('[{"a": 1}] {"requestUUID": "def"}')
+        self.assertRaises(ValueError, decoder.close)
+        self.assertFalse(decoder.truncated)
+        self.assertTrue('requestUUID' in decoder.error_text())
+
+        decoder = ParticleStreamDecoder()
+        decoder.feed('[ ]')
+        self.assertEqual(decoder.close(), [])
@@ -69,3 +69,89 @@ class SystemTestCase(unittest.TestCase):
                                       content_type='application/json')
 
         self.assertTrue("1" in response.data)
+
+    def test_plot_cache(self):
+        import shutil
+        import tempfile
+        from ooiservices.app.plot_cache import PlotCache
+        plots = PlotCache(self.app)
+        plots.enabled = True
+        plots.directory = tempfile.mkdtemp()
+        try:
+            args = {'yvar': 'temp', 'startdate': '2015-01-01T00:00:00.000Z',
+                    'enddate': '2015-01-02T00:00:00.000Z', 'scatter': 'True', '_': '12345'}
+            key = plots.request_key('CP05MOAS-GL340-03-CTDGVM000', 'telemetered_ctdgv', args)
+            same = dict(args, scatter='true', format='svg')
+            del same['_']
+            self.assertEqual(key, plots.request_key('CP05MOAS-GL340-03-CTDGVM000', 'telemetered_ctdgv', same))
+            self.assertNotEqual(key, plots.request_key('CP05MOAS-GL340-03-CTDGVM000', 'telemetered_ctdgv',
+                                                       dict(args, width='200')))
+            # units are drawn in the axis labels
+            self.assertNotEqual(key, plots.request_key('CP05MOAS-GL340-03-CTDGVM000', 'telemetered_ctdgv',
+                                                       dict(args, x_units='m')))
+            self.assertNotEqual(plots.request_key('CP05MOAS-GL340-03-CTDGVM000', 'telemetered_ctdgv',
+                                                  dict(args, y_units='deg_C')),
+                                plots.request_key('CP05MOAS-GL340-03-CTDGVM000', 'telemetered_ctdgv',
+                                                  dict(args, y_units='deg_F')))
+
+            self.assertEqual(plots.timeout_for(args['enddate']), plots.timeout_historical)
+            self.assertEqual(plots.timeout_for('2999-01-01T00:00:00.000Z'), plots.timeout_recent)
+
+            entry = plots.set(key, '<svg/>', 'image/svg+xml', args['enddate'])
+            cached = plots._read_disk(key)
+            self.assertEqual(cached.body, '<svg/>')
+            self.assertEqual(cached.etag, entry.etag)
+            self.assertEqual(plots.get(key).content_type, 'image/svg+xml')
+        finally:
+            shutil.rmtree(plots.directory)
+
+        response = self.client.get(url_for('main.plot_cache_stats'), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_ratio', json.loads(response.data))
+
+    def test_blob_cache(self):
+        from datetime import datetime
+        from ooiservices.app.blob_cache import BlobCache
+        blobs = BlobCache(self.app)
+        streams = [{'reference_designator': 'CP05MOAS-GL340-03-CTDGVM000', 'end': '2015-03-01'},
+                   {'reference_designator': 'CE01ISSM-MFD35-02-PRESFA000', 'end': '2015-05-01'},
+                   {'reference_designator': 'CP02PMUO-WFP01-04-FLORTK000', 'end': '2015-01-01'}]
+        self.assertTrue(blobs.set('stream_list', streams, timeout=60))
+        self.assertEqual(blobs.get('stream_list'), [streams[0], streams[2], streams[1]])
+        self.assertEqual(blobs.get('stream_list', shards=['CE']), [streams[1]])
+
+        # values json cannot hold are pickled
+        blobs.set('test_blob', {'when': datetime(2015, 1, 1)}, timeout=60)
+        self.assertEqual(blobs.get('test_blob'), {'when': datetime(2015, 1, 1)})
+        blobs.delete('test_blob')
+        self.assertIsNone(blobs.get('test_blob'))
+        blobs.delete('stream_list')
+
+        response = self.client.get(url_for('main.blob_cache_stats'), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['stream_list']['decodes'] >= 2)
+
+    def test_blob_cache_l1(self):
+        from ooiservices.app.blob_cache import BlobCache
+        blobs = BlobCache(self.app)
+        blobs.l1_names = set(['test_l1'])
+        blobs.set('test_l1', [{'ref_des': 'CP05MOAS'}], timeout=60)
+        first = blobs.get('test_l1')
+        self.assertTrue(blobs.get('test_l1') is first)
+        self.assertFalse(blobs.get('test_l1', fresh=True) is first)
+
+        # a rewrite (here or in another process) bumps the generation
+        blobs.set('test_l1', [{'ref_des': 'CE01ISSM'}], timeout=60)
+        self.assertEqual(blobs.get('test_l1'), [{'ref_des': 'CE01ISSM'}])
+        blobs._invalidate('test_l1', blobs._generations['test_l1'] + 1)
+        self.assertEqual(blobs.l1_stats()['entries'], 0)
+
+        # bounded by decoded (uncompressed) size, least recently used first
+        blobs.get('test_l1')
+        self.assertEqual(blobs.l1_stats()['bytes'], len(json.dumps([{'ref_des': 'CE01ISSM'}], separators=(',', ':'))))
+        blobs._invalidate('test_l1', blobs._generations['test_l1'] + 1)
+        blobs.l1_max_bytes = 1
+        blobs.get('test_l1')
+        self.assertEqual(blobs.l1_stats()['entries'], 0)
+        blobs.delete('test_l1')
+        self.assertIsNone(blobs.get('test_l1'))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+'''
+Unit tests for the shared uFrame http client.
+
+'''
+
+import unittest
+import json
+from ooiservices.app import create_app, uframe_client
+from ooiservices.app.uframe_client import UframeClient
+
+
+class UframeClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('TESTING_CONFIG')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client(use_cookies=False)
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_config_applied(self):
+        self.assertEqual(uframe_client.pool_maxsize, self.app.config['UFRAME_POOL_MAXSIZE'])
+        self.assertEqual(uframe_client.max_retries, self.app.config['UFRAME_MAX_RETRIES'])
+        self.assertEqual(uframe_client.timeout, (self.app.config['UFRAME_TIMEOUT_CONNECT'], None))
+
+    def test_session_is_shared(self):
+        session = uframe_client.session
+        self.assertTrue(session is uframe_client.session)
+        adapter = session.get_adapter('http://localhost:12576')
+        self.assertTrue(adapter is session.get_adapter('https://localhost:12576'))
+
+    def test_endpoint_name(self):
+        name = UframeClient.endpoint_name('http://localhost:12576/sensor/inv/CP05MOAS/GL388/toc?x=1')
+        self.assertEqual(name, 'localhost:12576/sensor/inv')
+        self.assertEqual(UframeClient.endpoint_name('http://localhost:12573/'), 'localhost:12573')
+
+    def test_stats_counts_failures(self):
+        client = UframeClient(self.app)
+        try:
+            client.get('http://localhost:1/events', timeout=(0.1, 0.1))
+        except Exception:
+            pass
+        stats = client.stats()
+        self.assertEqual(stats['endpoints']['localhost:1/events']['count'], 1)
+        self.assertEqual(stats['endpoints']['localhost:1/events']['errors'], 1)
+        self.assertEqual(stats['in_flight']['localhost:1']['active'], 0)
+
+    def test_stats_route(self):
+        response = self.client.get('/uframe_client_stats', content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue('endpoints' in data)
+        self.assertTrue('pools' in data)
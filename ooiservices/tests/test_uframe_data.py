@@ -27,6 +27,180 @@ class UframeDataTestCase(unittest.TestCase):
         db.session.remove()
         db.drop_all()
         self.app_context.pop()
+
+    def test_particle_dataset(self):
+        from ooiservices.app.uframe.dataset import ParticleDataset
+        particles = [{'pk': {'time': 3600.0 + i, 'stream': 'ctd' if i % 4 else 'other'},
+                      'temp': i * 0.5, 'temp_qc_results': i % 3, 'bins': [i, i + 1]} for i in range(12)]
+        dataset = ParticleDataset.from_particles(particles, ['time', 'temp', 'bins'], stream='ctd')
+        self.assertEqual(len(dataset), 9)
+        self.assertEqual(dataset.time[0], 3601.0)
+        self.assertEqual(dataset.column('temp').dtype.kind, 'f')
+        self.assertEqual(dataset.column('bins').shape, (9, 2))
+        self.assertEqual(dataset.qc_flags('temp', 2).tolist(), [0, 2, 0, 2, 0, 0, 0, 0, 2])
+        self.assertEqual(len(dataset.qc_flags('temp', 0)), 0)
+        self.assertRaises(KeyError, ParticleDataset.from_particles, particles, ['salinity'])
+
+        records = dataset.to_records()
+        self.assertEqual(records[0]['pk']['time'], 3601.0)
+        self.assertEqual(records[0]['temp_qc_results'], 1)
+        self.assertEqual(records[-1]['bins'], [11, 12])
+
+    def test_segment_profiles(self):
+        import numpy as np
+        from ooiservices.app.uframe.profiles import segment_profiles, split_profiles
+        # four dives to 100m and back, one sample every 5 seconds
+        time = np.arange(0, 4 * 2000, 5, dtype=np.float64)
+        depth = 100 - np.abs((time % 2000) - 1000) / 10.0
+        # duplicate times, out of order
+        time = np.append(time, [time[100], time[500]])
+        depth = np.append(depth, [depth[100], depth[500]])
+
+        ids = segment_profiles(time, depth)
+        self.assertEqual(len(ids), len(time))
+        self.assertEqual(ids[-2], ids[100])
+        self.assertEqual(ids[-1], ids[500])
+        assigned = ids[:-2][ids[:-2] >= 0]
+        self.assertTrue(len(set(assigned.tolist())) >= 6)
+        self.assertTrue((np.diff(assigned) >= 0).all())
+
+        profile_ids, (profile_time, profile_depth) = split_profiles(ids, time, depth)
+        self.assertEqual(profile_ids, sorted(profile_ids))
+        self.assertEqual(sum(len(p) for p in profile_depth), int((ids >= 0).sum()))
+        self.assertTrue(all(len(t) == len(d) for t, d in zip(profile_time, profile_depth)))
+
+    def test_decimation(self):
+        import numpy as np
+        from collections import OrderedDict
+        from ooiservices.app.uframe.dataset import ParticleDataset
+        from ooiservices.app.uframe.decimate import lttb_indices, minmax_indices, decimate_dataset
+        time = np.arange(10000, dtype=np.float64)
+        values = np.sin(time / 500.0)
+        values[7777] = 50.0
+        qc = np.zeros(10000, dtype=np.int64)
+        qc[7777] = 4
+
+        keep = lttb_indices(time, values, 200)
+        self.assertEqual(len(keep), 200)
+        self.assertEqual(keep[0], 0)
+        self.assertEqual(keep[-1], 9999)
+        self.assertTrue((np.diff(keep) > 0).all())
+        self.assertTrue(7777 in keep)
+
+        keep = minmax_indices(values, 200)
+        self.assertTrue(len(keep) <= 202)
+        self.assertTrue(7777 in keep)
+        self.assertTrue(values.argmin() in keep)
+
+        dataset = ParticleDataset(time, OrderedDict([('temp', values)]), OrderedDict([('temp', qc)]))
+        small = decimate_dataset(dataset, 300, ['time', 'temp'], 'minmax')
+        self.assertTrue(len(small) <= 300)
+        self.assertEqual(small.qc_flags('temp', 10)[small.time == 7777].tolist(), [4])
+        self.assertTrue(decimate_dataset(dataset, None, ['temp']) is dataset)
+
+        # several fields share n_out
+        fields = OrderedDict([('temp', values), ('sal', np.cos(time / 300.0)), ('pres', time % 97)])
+        dataset = ParticleDataset(time, fields, OrderedDict())
+        self.assertTrue(len(decimate_dataset(dataset, 300, ['temp', 'sal', 'pres'])) <= 300)
+        self.assertTrue(len(decimate_dataset(dataset, 5, ['temp', 'sal', 'pres'], 'minmax')) <= 5)
+
+    def test_plot_pool_limits(self):
+        from ooiservices.app.uframe.plot_pool import PlotWorkerPool, PlotQueueFull
+        pool = PlotWorkerPool()
+        pool._pending = self.app.config['PLOT_QUEUE_LIMIT']
+        self.assertRaises(PlotQueueFull, pool.check_capacity)
+        pool._release()
+        pool.check_capacity()
+        # an async job's render uses the queue place the job holds
+        pool._pending = self.app.config['PLOT_QUEUE_LIMIT']
+        pool._local.reserved = True
+        pool.check_capacity()
+        pool._local.reserved = False
+        # no render processes in this process (not started): rendered in this thread
+        self.assertTrue(pool._get_pool(self.app) is None)
+
+        response = self.client.get(url_for('uframe.get_plot_job', job_id='0' * 32))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_catalog(self):
+        from ooiservices.app.uframe.stream_catalog import StreamCatalog
+        def stream(refdes, name, end):
+            return {'reference_designator': refdes, 'stream_name': name, 'end': end,
+                    'array_name': 'Coastal Pioneer' if refdes.startswith('CP') else 'Endurance',
+                    'site_name': '', 'platform_name': '', 'assembly_name': '', 'long_display_name': '',
+                    'parameter_display_name': ['Temperature', 'Salinity'], 'units': ['C', '1'],
+                    'variables': ['temp', 'sal']}
+        catalog = StreamCatalog()
+        catalog.load([stream('CP05MOAS-GL340-03-CTDGVM000', 'ctdgv_m_glider_instrument', '2015-03-01'),
+                      stream('CE01ISSM-MFD35-02-PRESFA000', 'presf_abc_dcl_tide_measurement', '2015-05-01'),
+                      stream('CP02PMUO-WFP01-04-FLORTK000', 'flort_kn_stc_imodem_instrument', '2015-01-01')])
+
+        self.assertEqual(catalog.query(), [1, 0, 2])
+        self.assertEqual(catalog.query(reverse=False), [2, 0, 1])
+        self.assertEqual(catalog.query(sort_by='unknown'), [0, 1, 2])
+        self.assertEqual(catalog.query(search=['pioneer', 'GL340-03']), [0])
+        self.assertEqual(catalog.query(search=['temp', 'instrument']), [0, 2])
+        self.assertEqual(catalog.query(concepts=['CE01', 'CP02']), [1, 2])
+        self.assertEqual(catalog.query(exclude=catalog.disabled(['CP', 'CE01ISSM-MFD35-02-PRESFA000'])), [])
+        self.assertEqual(catalog.query(exclude=catalog.disabled(['CP05MOAS'])), [1, 2])
+
+        page = catalog.page(catalog.query(), 1, 1, minimal=True)
+        self.assertEqual([s['stream_name'] for s in page], ['ctdgv_m_glider_instrument'])
+        self.assertTrue('variables' not in page[0])
+        self.assertTrue('variables' in catalog.streams[0])
+
+        # a reindex leaves the list (and orderings) a request started with intact
+        data = catalog.data()
+        positions = data.query(reverse=False)
+        catalog.load([stream('CE01ISSM-MFD35-02-PRESFA000', 'presf_abc_dcl_tide_measurement', '2015-05-01')])
+        self.assertEqual(catalog.query(reverse=False), [0])
+        self.assertEqual([s['end'] for s in data.page(positions, 1, 2)], ['2015-03-01', '2015-05-01'])
+
+    def test_glider_track(self):
+        from ooiservices.app.uframe.glider_tracks import extract_track, merge_track
+        depth = {'particleKey': 'm_depth', 'units': 'bar', 'fillValue': '-9999999'}
+        def row(t, lon, lat, m_depth):
+            return {'pk': {'time': t, 'subsite': 'CP05MOAS', 'node': 'GL340', 'sensor': '00-ENG000000'},
+                    'longitude': lon, 'latitude': lat, 'm_depth': m_depth}
+        rows = [row(1.0, -70.5, 40.1, 10.0), row(2.0, float('nan'), 40.2, 10.0), row(3.0, 190.0, 40.3, 10.0),
+                row(4.0, -70.6, 90.0, 10.0), row(5.0, -70.7, 40.4, None), row(6.0, -70.8, 40.5, -9999999)]
+
+        track = extract_track(rows, depth)
+        self.assertEqual(track['reference_designator'], 'CP05MOAS-GL340-00-ENG000000')
+        self.assertEqual(track['coordinates'], [[-70.5, 40.1], [-70.7, 40.4], [-70.8, 40.5]])
+        self.assertEqual(track['times'], [1.0, 5.0, 6.0])
+        self.assertAlmostEqual(track['depths'][0], 0.9804139432)
+        self.assertEqual(track['depths'][1:], [-999, -999])
+        self.assertEqual(track['units'], 'm')
+        self.assertEqual(extract_track([], depth)['coordinates'], [])
+
+        delta = extract_track([row(6.0, -70.8, 40.5, 1.0), row(7.0, -70.9, 40.6, 2.0)], dict(depth, units='m'))
+        merged = merge_track(track, delta)
+        self.assertEqual(merged['times'], [1.0, 5.0, 6.0, 7.0])
+        self.assertEqual(merged['depths'][-1], 2.0)
+        self.assertEqual(len(merged['coordinates']), 4)
+
+    def test_glider_track_selection(self):
+        import numpy as np
+        from ooiservices.app.uframe.glider_tracks import simplify_indices, select_tracks
+        x = np.linspace(0, 10, 1001)
+        spike = np.column_stack((x, np.where(np.abs(x - 5) < 0.001, 3.0, 0.0)))
+        self.assertEqual(simplify_indices(spike, 0.01).tolist(), [0, 499, 500, 501, 1000])
+        self.assertEqual(len(simplify_indices(spike, 0)), 1001)
+
+        track = {'coordinates': np.column_stack((x, np.sin(x))).tolist(), 'times': range(1001),
+                 'depths': [1.0] * 1001, 'units': 'm'}
+        gliders = [{'location': '/CP05MOAS/GL340/00-ENG000000/telemetered/glider_eng_telemetered', 'track': track},
+                   {'location': '/CE05MOAS/GL311/00-ENG000000/telemetered/glider_eng_telemetered', 'track': track}]
+        selected = select_tracks(gliders, ['CP05MOAS-GL340'], bbox=[2, -2, 8, 2], start=100, end=700, tolerance=0.05)
+        self.assertEqual(len(selected), 1)
+        selected = selected[0]['track']
+        self.assertEqual((selected['times'][0], selected['times'][-1]), (200, 700))
+        self.assertTrue(2 < len(selected['times']) < 50)
+        self.assertEqual(len(selected['depths']), len(selected['coordinates']))
+        self.assertEqual(selected['total_points'], 1001)
+        self.assertEqual(len(track['times']), 1001)
+
 ''' TODO: rewrite tests to reflect data from uframe
     def test_simple_fail_data_access_no_info(self):
         response = self.client.get('/uframe/get_data', content_type='application/json')